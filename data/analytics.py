@@ -0,0 +1,201 @@
+"""
+Turnaround statistics over the manuscript event log.
+The events are loaded once into NumPy columns (title code, time, state
+code) in (title, time) order, and every statistic is computed with
+array operations over those columns.
+"""
+import numpy as np
+
+import data.db_connect as dbc
+import data.manuscript as ms
+
+SECS_PER_DAY = 24 * 60 * 60
+
+# Events are read in big batches: we want all of them.
+LOAD_BATCH_SIZE = 10_000
+
+# The path a manuscript takes to publication, then the ways out.
+FUNNEL_STATES = [ms.SUBMITTED, ms.IN_REF_REV, ms.AUTHOR_REVISION,
+                 ms.EDITOR_REV, ms.COPY_EDIT, ms.AUTHOR_REV, ms.FORMATTING,
+                 ms.PUBLISHED, ms.REJECTED, ms.WITHDRAWN]
+# A manuscript is decided when it first reaches one of these.
+DECIDED_STATES = [ms.PUBLISHED, ms.REJECTED, ms.WITHDRAWN]
+
+STATE_CODES = {state: code for code, state in enumerate(FUNNEL_STATES)}
+NO_CODE = -1
+
+# stats fields
+TIME_IN_STATE = 'time_in_state'
+FUNNEL = 'funnel'
+EDITORS = 'editors'
+SPELLS = 'spells'  # completed stays in a state
+CURRENT = 'current'  # manuscripts in the state now
+MEDIAN_DAYS = 'median_days'
+P90_DAYS = 'p90_days'
+SUBMITTED = 'submitted'
+PUBLISHED = 'published'
+REJECTED = 'rejected'
+MEDIAN_TURNAROUND_DAYS = 'median_turnaround_days'
+
+
+def load_events() -> tuple:
+    """
+    The event log as columns: titles, times and states, ordered by
+    title then time (which the events index serves).
+    """
+    titles, times, states = [], [], []
+    for event in dbc.read_iter(ms.EVENTS_COLLECT,
+                               batch_size=LOAD_BATCH_SIZE,
+                               keys=[ms.TITLE] + ms.EVENT_KEYS,
+                               fields=[ms.STATE]):
+        titles.append(event[ms.TITLE])
+        times.append(event[ms.EVENT_TIME])
+        states.append(event[ms.STATE])
+    return titles, times, states
+
+
+def load_editors() -> dict:
+    return {manu[ms.TITLE]: manu.get(ms.EDITOR_EMAIL)
+            for manu in dbc.read_iter(ms.MANUSCRIPTS_COLLECT,
+                                      batch_size=LOAD_BATCH_SIZE,
+                                      fields=[ms.TITLE, ms.EDITOR_EMAIL])}
+
+
+def to_days(secs) -> float:
+    """
+    JSON friendly days: a float, or None for no value.
+    """
+    if secs is None or np.isnan(secs):
+        return None
+    return float(secs) / SECS_PER_DAY
+
+
+def percentile(values: np.ndarray, q: float) -> float:
+    return np.percentile(values, q) if len(values) else None
+
+
+def time_in_state(title_codes: np.ndarray, times: np.ndarray,
+                  state_codes: np.ndarray) -> dict:
+    """
+    How long manuscripts stay in each state. Repeated events in the
+    same state (e.g. another review) are one stay.
+    """
+    n = len(title_codes)
+    starts = np.ones(n, dtype=bool)
+    starts[1:] = ((title_codes[1:] != title_codes[:-1])
+                  | (state_codes[1:] != state_codes[:-1]))
+    stays = np.flatnonzero(starts)
+    stay_titles = title_codes[stays]
+    stay_states = state_codes[stays]
+    stay_times = times[stays]
+    # a stay ends where the same manuscript's next one begins
+    ended = np.zeros(len(stays), dtype=bool)
+    ended[:-1] = stay_titles[1:] == stay_titles[:-1]
+    durations = np.zeros(len(stays))
+    durations[:-1] = stay_times[1:] - stay_times[:-1]
+    current = np.bincount(stay_states[~ended & (stay_states != NO_CODE)],
+                          minlength=len(FUNNEL_STATES))
+    stats = {}
+    for state, code in STATE_CODES.items():
+        spent = durations[ended & (stay_states == code)]
+        stats[state] = {
+            SPELLS: len(spent),
+            CURRENT: int(current[code]),
+            MEDIAN_DAYS: to_days(percentile(spent, 50)),
+            P90_DAYS: to_days(percentile(spent, 90)),
+        }
+    return stats
+
+
+def funnel(title_codes: np.ndarray, state_codes: np.ndarray) -> dict:
+    """
+    How many manuscripts ever reached each state.
+    """
+    known = state_codes != NO_CODE
+    reached = np.unique(title_codes[known] * len(FUNNEL_STATES)
+                        + state_codes[known])
+    counts = np.bincount(reached % len(FUNNEL_STATES),
+                         minlength=len(FUNNEL_STATES))
+    return {state: int(counts[code]) for state, code in STATE_CODES.items()}
+
+
+def editor_throughput(title_codes: np.ndarray, times: np.ndarray,
+                      state_codes: np.ndarray, num_titles: int,
+                      editor_codes: np.ndarray, editors: list) -> dict:
+    """
+    Per editor: manuscripts submitted, published and rejected, and the
+    median days from submission to decision.
+    editor_codes gives each title's editor (NO_CODE if unknown).
+    """
+    submitted_at = np.full(num_titles, np.inf)
+    np.minimum.at(submitted_at, title_codes, times)
+    decided = np.isin(state_codes,
+                      [STATE_CODES[state] for state in DECIDED_STATES])
+    decided_at = np.full(num_titles, np.inf)
+    np.minimum.at(decided_at, title_codes[decided], times[decided])
+    turnaround = decided_at - submitted_at
+
+    def reached(state):
+        hits = np.zeros(num_titles, dtype=bool)
+        hits[title_codes[state_codes == STATE_CODES[state]]] = True
+        return hits
+
+    known = editor_codes != NO_CODE
+    codes = editor_codes[known]
+
+    def count(weights=None):
+        return np.bincount(codes, weights=weights, minlength=len(editors))
+
+    submitted = count()
+    published = count(reached(ms.PUBLISHED)[known])
+    rejected = count(reached(ms.REJECTED)[known])
+    # group the decided manuscripts' turnarounds by editor
+    done = np.isfinite(turnaround) & known
+    order = np.argsort(editor_codes[done], kind='stable')
+    done_editors = editor_codes[done][order]
+    done_turnaround = turnaround[done][order]
+    bounds = np.searchsorted(done_editors, np.arange(len(editors) + 1))
+    stats = {}
+    for code, editor in enumerate(editors):
+        spent = done_turnaround[bounds[code]:bounds[code + 1]]
+        stats[editor] = {
+            SUBMITTED: int(submitted[code]),
+            PUBLISHED: int(published[code]),
+            REJECTED: int(rejected[code]),
+            MEDIAN_TURNAROUND_DAYS: to_days(percentile(spent, 50)),
+        }
+    return stats
+
+
+def compute_stats(titles: list, times: list, states: list,
+                  editor_of: dict) -> dict:
+    """
+    The stats of an event log given as columns ordered by title then
+    time, with editor_of mapping titles to their editors.
+    """
+    uniq_titles, title_codes = np.unique(np.array(titles, dtype=str),
+                                         return_inverse=True)
+    times = np.array(times, dtype=float)
+    state_codes = np.array([STATE_CODES.get(state, NO_CODE)
+                            for state in states], dtype=int)
+    editors = sorted({editor_of[title] for title in uniq_titles
+                      if editor_of.get(title)})
+    editor_index = {editor: code for code, editor in enumerate(editors)}
+    editor_codes = np.array([editor_index.get(editor_of.get(title),
+                                              NO_CODE)
+                             for title in uniq_titles], dtype=int)
+    return {
+        TIME_IN_STATE: time_in_state(title_codes, times, state_codes),
+        FUNNEL: funnel(title_codes, state_codes),
+        EDITORS: editor_throughput(title_codes, times, state_codes,
+                                   len(uniq_titles), editor_codes,
+                                   editors),
+    }
+
+
+def get_stats() -> dict:
+    """
+    Time in state, the acceptance funnel and per editor throughput
+    over every manuscript's history.
+    """
+    return compute_stats(*load_events(), load_editors())
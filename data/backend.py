@@ -0,0 +1,149 @@
+"""
+The storage interface db_connect runs on.
+A backend stores documents (dicts) in named collections of named dbs.
+Filters, update documents, sorts and aggregation pipelines are written
+the Mongo way, e.g. {'email': {'$in': [...]}} or {'$set': {...}}; each
+backend runs them natively or interprets them.
+db_connect keeps the cache, the compression and the indexes the app
+registers on top, whatever the backend.
+"""
+from abc import ABC, abstractmethod
+from collections import namedtuple
+
+ID = '_id'
+
+# index directions
+ASCENDING = 1
+TEXT = 'text'
+
+# text_search() puts each doc's relevance here.
+TEXT_SCORE = 'score'
+
+InsertResult = namedtuple('InsertResult', ['inserted_id'])
+UpdateResult = namedtuple('UpdateResult',
+                          ['matched_count', 'modified_count'])
+
+
+class DuplicateKeyError(Exception):
+    """
+    A unique index already holds the key of the doc being written.
+    """
+    pass
+
+
+class Backend(ABC):
+    """
+    Every method takes the db and collection to work on first.
+    Docs handed in are never kept; docs handed out are the caller's.
+    fields (a list, None for all) limits the fields read; the ID is
+    left out if no_id.
+    sort is a list of fields to order on, ascending.
+    """
+    @abstractmethod
+    def create_index(self, db, collection, keys, **options):
+        """
+        keys is a field name or a list of (field, direction) pairs.
+        Options: unique, weights for TEXT indexes, and multikey if the
+        first field holds arrays whose elements filters match.
+        Creating an index that already exists is a no-op.
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def insert_one(self, db, collection, doc: dict) -> InsertResult:
+        """
+        Gives doc an ID if it has none.
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def insert_many(self, db, collection, docs: list):
+        """
+        Unordered: a doc rejected for a duplicate key doesn't stop the
+        others, but DuplicateKeyError is raised after.
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def find_one(self, db, collection, filt: dict, fields: list = None,
+                 no_id: bool = False) -> dict:
+        raise NotImplementedError()
+
+    @abstractmethod
+    def find(self, db, collection, filt: dict, fields: list = None,
+             no_id: bool = True, sort: list = None, limit: int = 0,
+             skip: int = 0, batch_size: int = 0):
+        """
+        An iterable of the matching docs. batch_size is how many to
+        fetch at a time, where that means anything.
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def delete_one(self, db, collection, filt: dict) -> int:
+        raise NotImplementedError()
+
+    @abstractmethod
+    def delete_many(self, db, collection, filt: dict) -> int:
+        raise NotImplementedError()
+
+    @abstractmethod
+    def update_one(self, db, collection, filt: dict, update: dict,
+                   array_filters: list = None) -> UpdateResult:
+        raise NotImplementedError()
+
+    @abstractmethod
+    def update_many(self, db, collection, filt: dict,
+                    update: dict) -> UpdateResult:
+        raise NotImplementedError()
+
+    @abstractmethod
+    def find_one_and_update(self, db, collection, filt: dict,
+                            update: dict) -> dict:
+        """
+        Atomically update the first matching doc, returning it as
+        updated, or None if none matched.
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def bulk_update(self, db, collection, updates: list) -> int:
+        """
+        Apply many (filt, update) pairs, each to one doc, returning how
+        many matched.
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def replace_one(self, db, collection, filt: dict, doc: dict,
+                    upsert: bool = False) -> UpdateResult:
+        raise NotImplementedError()
+
+    @abstractmethod
+    def aggregate(self, db, collection, pipeline: list):
+        raise NotImplementedError()
+
+    @abstractmethod
+    def text_search(self, db, collection, query: str, limit: int,
+                    fields: list = None) -> list:
+        """
+        Up to limit docs matching query in the collection's TEXT index,
+        best first, each with its TEXT_SCORE.
+        """
+        raise NotImplementedError()
+
+    def set_pool_settings(self, settings: dict):
+        """
+        Connection pool options, for backends that pool connections.
+        """
+        pass
+
+    def after_fork(self):
+        """
+        Called in a child process after fork: drop anything that must
+        not be shared with the parent, such as sockets.
+        """
+        pass
+
+    def close(self):
+        pass
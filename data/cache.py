@@ -0,0 +1,155 @@
+"""
+A small thread-safe LRU cache whose entries expire after a time to live.
+db_connect keeps read_one() results in one so repeated lookups of the
+same record skip the round trip to Mongo.
+"""
+import threading
+import time
+from collections import OrderedDict
+from copy import deepcopy
+from functools import partial
+
+DEF_MAX_SIZE = 1024
+DEF_MAX_BYTES = 16 * 1024 * 1024
+DEF_MAX_ENTRY_BYTES = 64 * 1024
+DEF_TTL = 60.0  # seconds
+
+# returned by get() when a key is absent or expired
+MISSING = object()
+
+# stats fields
+HITS = 'hits'
+MISSES = 'misses'
+EVICTIONS = 'evictions'
+SIZE = 'size'
+BYTES = 'bytes'
+SKIPPED = 'skipped'
+
+
+def value_size(value, limit: int = None) -> int:
+    """
+    Roughly how many bytes value takes: the length of its JSON.
+    Counting stops once past limit, so sizing a large value that won't
+    be cached anyway costs little.
+    """
+    size = 0
+    todo = [value]
+    while todo and (limit is None or size <= limit):
+        item = todo.pop()
+        if isinstance(item, (str, bytes)):
+            size += len(item) + 2
+        elif isinstance(item, dict):
+            size += 2 + 4 * len(item)
+            for key, elem in item.items():
+                size += len(str(key))
+                todo.append(elem)
+        elif isinstance(item, (list, tuple)):
+            size += 2 + 2 * len(item)
+            todo.extend(item)
+        else:
+            size += len(str(item))
+    return size
+
+
+class LRUCache:
+    """
+    Holds at most `max_size` entries and `max_bytes` bytes of values (as
+    measured by `sizeof`), dropping the least recently used first.
+    A value bigger than `max_entry_bytes` isn't cached at all: one large
+    record would push out many small ones.
+    An entry older than `ttl` seconds counts as a miss.
+    Values are copied in and out, so callers can't change what is cached.
+    Given `group`, a function of a key, invalidate() can look at one
+    group's entries instead of all of them.
+    """
+    def __init__(self, max_size: int = DEF_MAX_SIZE, ttl: float = DEF_TTL,
+                 clock=time.monotonic, max_bytes: int = DEF_MAX_BYTES,
+                 max_entry_bytes: int = DEF_MAX_ENTRY_BYTES,
+                 sizeof=None, group=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_entry_bytes, max_bytes)
+        self.sizeof = sizeof or partial(value_size,
+                                        limit=self.max_entry_bytes)
+        self.group = group
+        self.entries = OrderedDict()  # key -> (expires, value, size)
+        self.groups = {}  # group -> {key, ...}
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.skipped = 0
+
+    def drop(self, key):
+        self.bytes -= self.entries.pop(key)[2]
+        if self.group is not None:
+            group = self.group(key)
+            self.groups[group].discard(key)
+            if not self.groups[group]:
+                del self.groups[group]
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] <= self.clock():
+                self.drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return deepcopy(entry[1])
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        with self.lock:
+            if key in self.entries:
+                self.drop(key)
+            if size > self.max_entry_bytes:
+                self.skipped += 1
+                return
+            self.entries[key] = (self.clock() + self.ttl, deepcopy(value),
+                                 size)
+            self.bytes += size
+            if self.group is not None:
+                self.groups.setdefault(self.group(key), set()).add(key)
+            while (len(self.entries) > self.max_size
+                   or self.bytes > self.max_bytes):
+                self.drop(next(iter(self.entries)))
+                self.evictions += 1
+
+    def invalidate(self, pred, group=None):
+        """
+        Drop every entry (of group, if given) for which pred(key, value)
+        is true.
+        """
+        with self.lock:
+            keys = self.entries
+            if group is not None and self.group is not None:
+                keys = self.groups.get(group, ())
+            stale = [key for key in keys
+                     if pred(key, self.entries[key][1])]
+            for key in stale:
+                self.drop(key)
+        return len(stale)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.groups.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                HITS: self.hits,
+                MISSES: self.misses,
+                EVICTIONS: self.evictions,
+                SIZE: len(self.entries),
+                BYTES: self.bytes,
+                SKIPPED: self.skipped,
+            }
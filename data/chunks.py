@@ -0,0 +1,95 @@
+"""
+Large binary bodies stored as a run of fixed size chunk docs, so they
+can be written as they arrive and read back a piece at a time without
+ever being held whole in memory.
+A body is found by the file info write() returns; each chunk doc holds
+the FILE_ID, its number N and up to chunk_size bytes of DATA.
+"""
+import hashlib
+from uuid import uuid4
+
+import data.db_connect as dbc
+
+# 255KB chunks, as GridFS uses: well under Mongo's doc size limit.
+CHUNK_SIZE = 255 * 1024
+
+# chunk fields
+FILE_ID = 'file_id'
+N = 'n'
+DATA = 'data'
+
+# file info fields (also FILE_ID)
+LENGTH = 'length'
+SIZE = 'chunk_size'
+DIGEST = 'sha256'  # hex
+
+
+def add_indexes(collection: str):
+    """
+    Call once for each collection used as a chunk store.
+    """
+    dbc.add_index(collection, [(FILE_ID, dbc.ASCENDING), (N, dbc.ASCENDING)],
+                  unique=True)
+
+
+def write(collection: str, stream, max_size: int = 0,
+          chunk_size: int = CHUNK_SIZE) -> tuple:
+    """
+    Store everything read from stream (anything with read(size))
+    under a new file id, one chunk at a time.
+    Raises ValueError if it is over max_size bytes (0 means no limit).
+    Whatever stops it, nothing written is kept.
+    Returns the file info to find it by, with the body's length
+    and SHA-256 digest.
+    """
+    file_id = uuid4().hex
+    digest = hashlib.sha256()
+    length = 0
+    n = 0
+    try:
+        while True:
+            data = stream.read(chunk_size)
+            if not data:
+                break
+            # a stream may hand back less than asked for
+            while len(data) < chunk_size:
+                more = stream.read(chunk_size - len(data))
+                if not more:
+                    break
+                data += more
+            length += len(data)
+            digest.update(data)
+            if max_size and length > max_size:
+                raise ValueError(f'Body is over {max_size} bytes')
+            dbc.create(collection, {FILE_ID: file_id, N: n, DATA: data})
+            n += 1
+    except BaseException:
+        # e.g. the client went away mid upload
+        dbc.delete_many(collection, {FILE_ID: file_id})
+        raise
+    return {FILE_ID: file_id, LENGTH: length, SIZE: chunk_size,
+            DIGEST: digest.hexdigest()}
+
+
+def read(collection: str, info: dict, start: int = 0, stop: int = None):
+    """
+    Yield bytes start up to stop (None: the end) of the file,
+    a chunk at a time.
+    """
+    chunk_size = info[SIZE]
+    filt = {FILE_ID: info[FILE_ID], N: {'$gte': start // chunk_size}}
+    if stop is not None:
+        if stop <= start:
+            return
+        filt[N]['$lte'] = (stop - 1) // chunk_size
+    for chunk in dbc.read_iter(collection, filt, batch_size=1,
+                               keys=[FILE_ID, N], fields=[DATA]):
+        data = bytes(chunk[DATA])
+        offset = chunk[N] * chunk_size
+        lo = max(start - offset, 0)
+        hi = len(data) if stop is None else min(stop - offset, len(data))
+        yield data[lo:hi]
+
+
+def delete(collection: str, info: dict) -> int:
+    return dbc.delete_many(collection, {FILE_ID: info[FILE_ID]})
@@ -0,0 +1,76 @@
+"""
+Compression of large text fields at rest.
+A compressed value is stored as {CODEC: codec name, DATA: bytes};
+any other value is stored as is, so records written before a field was
+compressed read back unchanged.
+zstd is used if the zstandard package is installed, else zlib.
+"""
+import zlib
+
+try:
+    import zstandard as zstd
+except ImportError:
+    zstd = None
+
+ZLIB = 'zlib'
+ZSTD = 'zstd'
+
+# stored value fields
+CODEC = 'codec'
+DATA = 'data'
+
+# Strings shorter than this (in bytes) aren't worth compressing.
+DEF_MIN_SIZE = 1024
+
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def default_codec() -> str:
+    return ZSTD if zstd is not None else ZLIB
+
+
+def compress(data: bytes, codec: str) -> bytes:
+    if codec == ZLIB:
+        return zlib.compress(data, ZLIB_LEVEL)
+    if codec == ZSTD and zstd is not None:
+        return zstd.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    raise ValueError(f'Unavailable codec: {codec}')
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    if codec == ZLIB:
+        return zlib.decompress(data)
+    if codec == ZSTD and zstd is not None:
+        return zstd.ZstdDecompressor().decompress(data)
+    raise ValueError(f'Unavailable codec: {codec}')
+
+
+def is_compressed(value) -> bool:
+    return isinstance(value, dict) and set(value) == {CODEC, DATA}
+
+
+def encode(value, min_size: int = DEF_MIN_SIZE, codec: str = None):
+    """
+    The value to store for a string: compressed if it is at least
+    min_size bytes and compression makes it smaller, else as is.
+    """
+    if not isinstance(value, str):
+        return value
+    raw = value.encode()
+    if len(raw) < min_size:
+        return value
+    codec = codec or default_codec()
+    data = compress(raw, codec)
+    if len(data) >= len(raw):
+        return value
+    return {CODEC: codec, DATA: data}
+
+
+def decode(value):
+    """
+    The string a stored value holds; plain values come back as is.
+    """
+    if not is_compressed(value):
+        return value
+    return decompress(bytes(value[DATA]), value[CODEC]).decode()
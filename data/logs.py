@@ -0,0 +1,125 @@
+"""
+Logging for data.* and server.*.
+Get a logger with get_logger(__name__) and pass values as args, so a
+message is only formatted if it is emitted:
+    log.debug('Inserted into %s', collection)
+setup() configures the output, from the environment by default:
+    - LOG_LEVEL: DEBUG, INFO (the default), WARNING, ...
+    - LOG_FORMAT: TEXT (the default) or JSON, one object per line.
+    - LOG_SAMPLE_EVERY: only emit 1 in N of each DEBUG or INFO
+      message; WARNING and up always get through.
+"""
+import json
+import logging
+import os
+import sys
+import threading
+
+TEXT = 'TEXT'
+JSON = 'JSON'
+
+DEF_LEVEL = 'INFO'
+DEF_FORMAT = TEXT
+DEF_SAMPLE_EVERY = 1
+
+# our loggers all live under these
+ROOT_LOGGERS = ['data', 'server']
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+# JSON fields
+TIME = 'time'
+LEVEL = 'level'
+LOGGER = 'logger'
+MESSAGE = 'message'
+EXCEPTION = 'exception'
+
+# LogRecord attributes; anything else on a record came in through
+# `extra` and goes into its JSON object.
+RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None)))
+RECORD_ATTRS |= {'message', 'asctime'}
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(name)
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per record, with any `extra` fields added.
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            TIME: self.formatTime(record),
+            LEVEL: record.levelname,
+            LOGGER: record.name,
+            MESSAGE: record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry[EXCEPTION] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Lets through 1 in `every` records below WARNING for each message
+    (the unformatted one, so its args don't matter).
+    """
+    def __init__(self, every: int = DEF_SAMPLE_EVERY):
+        super().__init__()
+        if every < 1:
+            raise ValueError(f'Bad sample rate: {every}')
+        self.every = every
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.every == 1 or record.levelno >= logging.WARNING:
+            return True
+        key = (record.name, record.msg)
+        with self.lock:
+            count = self.counts.get(key, 0)
+            self.counts[key] = count + 1
+        return count % self.every == 0
+
+
+def make_handler(fmt: str = DEF_FORMAT, sample_every: int = DEF_SAMPLE_EVERY,
+                 stream=None) -> logging.Handler:
+    if fmt not in (TEXT, JSON):
+        raise ValueError(f'Bad log format: {fmt}')
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(JsonFormatter() if fmt == JSON
+                         else logging.Formatter(TEXT_FORMAT))
+    handler.addFilter(SamplingFilter(sample_every))
+    return handler
+
+
+def setup(config=None, stream=None):
+    """
+    Send our loggers' records to stream (stderr by default), as set by
+    LOG_LEVEL, LOG_FORMAT and LOG_SAMPLE_EVERY in config (os.environ by
+    default). Calling it again replaces the earlier setup.
+    """
+    config = os.environ if config is None else config
+    level = str(config.get('LOG_LEVEL') or DEF_LEVEL).upper()
+    if not isinstance(logging.getLevelName(level), int):
+        raise ValueError(f'Bad log level: {level}')
+    fmt = str(config.get('LOG_FORMAT') or DEF_FORMAT).upper()
+    try:
+        sample_every = int(config.get('LOG_SAMPLE_EVERY')
+                           or DEF_SAMPLE_EVERY)
+    except ValueError:
+        raise ValueError('LOG_SAMPLE_EVERY must be an integer: '
+                         f'{config.get("LOG_SAMPLE_EVERY")}')
+    handler = make_handler(fmt, sample_every, stream)
+    for name in ROOT_LOGGERS:
+        logger = logging.getLogger(name)
+        for old in list(logger.handlers):
+            logger.removeHandler(old)
+        logger.addHandler(handler)
+        logger.setLevel(level)
+        logger.propagate = False
+    return handler
@@ -1,7 +1,29 @@
+import hashlib
+import json
+import os
+import sys
+import time
+from functools import partial
+from itertools import islice
+from uuid import uuid4
+
+import data.chunks as chk
 import data.db_connect as dbc
+import data.logs as logs
 import data.people as ppl
+import data.search as srch
+import data.suggest as sgst
+
+log = logs.get_logger(__name__)
 
 MANUSCRIPTS_COLLECT = 'manuscripts'
+# every state change of every manuscript
+EVENTS_COLLECT = 'manuscript_events'
+# bodies uploaded with upload_text()
+MANUSCRIPT_CHUNKS_COLLECT = 'manuscript_chunks'
+# every abstract and body a manuscript has had, stored once each
+REVISIONS_COLLECT = 'manuscript_revisions'
+BODIES_COLLECT = 'manuscript_bodies'
 
 # Fields
 TITLE = 'title'
@@ -11,8 +33,90 @@ STATE = 'state'
 REFEREES = 'referees'
 TEXT = 'text'
 ABSTRACT = 'abstract'
-HISTORY = 'history'
+HISTORY = 'history'  # now in EVENTS_COLLECT; see MIGRATE_HISTORY_CMD
 EDITOR_EMAIL = 'editor_email'
+SUBMITTED_AT = 'submitted_at'  # seconds since the epoch
+# The chunks file info of an uploaded body, which replaces TEXT.
+TEXT_FILE = 'text_file'
+REVISIONS = 'revisions'  # revision hashes, oldest first
+# The manuscript's body is the one stored under this hash; reads put
+# its TEXT and TEXT_FILE in. Older manuscripts hold them themselves.
+BODY_HASH = 'body_hash'
+# The start of the body, stored plain for the text index (TEXT is
+# stored compressed, which a text index can't see into).
+SEARCH_TEXT = 'search_text'
+
+# Revision fields (also ABSTRACT and BODY_HASH)
+HASH = 'hash'
+LENGTH = 'length'  # of the body, in UTF-8 bytes
+CREATED_AT = 'created_at'  # seconds since the epoch
+REVISION_LIST_FIELDS = [HASH, LENGTH, CREATED_AT]
+# Body fields (also HASH and LENGTH)
+BODY_FIELDS = [TEXT, TEXT_FILE]
+
+# What a listing needs: everything but the bodies.
+LIST_FIELDS = [TITLE, AUTHOR, AUTHOR_EMAIL, STATE, REFEREES,
+               EDITOR_EMAIL, SUBMITTED_AT]
+
+# The editor work queue pages on this order.
+QUEUE_KEYS = [SUBMITTED_AT, TITLE]
+
+# Action request fields
+ACTION = 'action'
+REFEREE = 'referee'
+ACTOR = 'actor'  # who acted, e.g. their email
+ACTIONS = 'actions'
+# Each bulk action pushes its id here with its write, so we can tell
+# which ones landed, then pulls it out again.
+ACTION_IDS = 'action_ids'
+
+# Bulk action result fields
+OK = 'ok'
+ERROR = 'error'
+
+# Event fields (also TITLE, STATE, ACTION and ACTOR)
+EVENT_TIME = 'time'  # seconds since the epoch
+EVENT_ID = 'event_id'  # orders events made at the same time
+# History pages on this order.
+EVENT_KEYS = [EVENT_TIME, EVENT_ID]
+
+dbc.add_index(MANUSCRIPTS_COLLECT, TITLE, unique=True)
+dbc.add_index(MANUSCRIPTS_COLLECT,
+              [(EDITOR_EMAIL, dbc.ASCENDING), (STATE, dbc.ASCENDING)]
+              + [(key, dbc.ASCENDING) for key in QUEUE_KEYS])
+# multikey: finds a referee's assignments without a scan
+dbc.add_index(MANUSCRIPTS_COLLECT,
+              [(REFEREES, dbc.ASCENDING), (TITLE, dbc.ASCENDING)],
+              multikey=True)
+# manuscripts from before bodies were stored on their own hold a TEXT
+dbc.compress_field(MANUSCRIPTS_COLLECT, TEXT)
+chk.add_indexes(MANUSCRIPT_CHUNKS_COLLECT)
+dbc.add_index(REVISIONS_COLLECT, HASH, unique=True)
+# revisions from before bodies were stored on their own hold a TEXT
+dbc.compress_field(REVISIONS_COLLECT, TEXT)
+dbc.add_index(BODIES_COLLECT, HASH, unique=True)
+dbc.compress_field(BODIES_COLLECT, TEXT)
+dbc.add_index(EVENTS_COLLECT, [(TITLE, dbc.ASCENDING)]
+              + [(key, dbc.ASCENDING) for key in EVENT_KEYS])
+
+# The most upload_text() takes, in bytes.
+MAX_TEXT_SIZE = int(os.environ.get('MAX_TEXT_SIZE', 64 * 1024 * 1024))
+
+BACKFILL_CMD = 'backfill_submitted_at'
+MIGRATE_HISTORY_CMD = 'migrate_history'
+BACKFILL_SEARCH_CMD = 'backfill_search_text'
+
+# Search ranks title matches over abstract matches over text matches.
+SEARCH_WEIGHTS = {TITLE: 10, ABSTRACT: 5, SEARCH_TEXT: 1}
+# How many chars of a body search sees.
+SEARCH_TEXT_SIZE = 64 * 1024
+SEARCH_LIMIT = 10
+MAX_SEARCH_LIMIT = 100
+SEARCH_FIELDS = [TITLE, AUTHOR, STATE]
+
+searcher = srch.get_backend(MANUSCRIPTS_COLLECT, TITLE, SEARCH_WEIGHTS)
+author_suggester = sgst.TrigramIndex(MANUSCRIPTS_COLLECT, TITLE, [AUTHOR],
+                                     [AUTHOR, AUTHOR_EMAIL])
 
 
 # States
@@ -84,7 +188,7 @@ def is_valid_action(action: str) -> bool:
 
 
 def assign_ref(manu: dict, ref: str, extra=None) -> str:
-    print(extra)
+    log.debug('Assigning referee %s to %s', ref, manu.get(TITLE))
     manu[REFEREES].append(ref)
     return IN_REF_REV
 
@@ -181,9 +285,7 @@ STATE_TABLE = {
 
 
 def get_valid_actions_by_state(state: str):
-    valid_actions = STATE_TABLE[state].keys()
-    print(f'{valid_actions=}')
-    return valid_actions
+    return STATE_TABLE[state].keys()
 
 
 def handle_action(curr_state, action, **kwargs) -> str:
@@ -194,26 +296,377 @@ def handle_action(curr_state, action, **kwargs) -> str:
     return STATE_TABLE[curr_state][action][FUNC](**kwargs)
 
 
-def read() -> dict:
+REF_ACTIONS = [ASSIGN_REF, DELETE_REF]
+
+# How often apply_action() re-reads and retries when the manuscript
+# changed under it.
+MAX_ACTION_TRIES = 3
+
+
+def make_event(title: str, state: str, action: str = None,
+               actor: str = None, event_id: str = None) -> dict:
+    return {
+        TITLE: title,
+        EVENT_TIME: time.time(),
+        EVENT_ID: event_id or uuid4().hex,
+        STATE: state,
+        ACTION: action,
+        ACTOR: actor,
+    }
+
+
+def apply_action(title: str, action: str, actor: str = None,
+                 **kwargs) -> dict:
+    """
+    Run action on the manuscript and persist the outcome.
+    The write is one compare-and-set: it only lands if the state and
+    referees are still what the new state was computed from, so
+    concurrent editor and referee actions can't clobber each other.
+    Only then is the event recorded.
+    Returns the updated manuscript.
+    """
+    if action in REF_ACTIONS and not kwargs.get('ref'):
+        raise ValueError(f'{action} needs a referee')
+    for _ in range(MAX_ACTION_TRIES):
+        manu = read_one(title, fields=[STATE, REFEREES])
+        if manu is None:
+            raise ValueError(f'No such manuscript: {title=}')
+        curr_state = manu[STATE]
+        old_refs = manu[REFEREES]
+        manu = {**manu, REFEREES: list(old_refs)}
+        new_state = handle_action(curr_state, action, manu=manu, **kwargs)
+        updated = dbc.find_one_and_update(
+            MANUSCRIPTS_COLLECT,
+            {TITLE: title, STATE: curr_state, REFEREES: old_refs},
+            {STATE: new_state, REFEREES: manu[REFEREES]})
+        if updated is not None:
+            dbc.create(EVENTS_COLLECT,
+                       make_event(title, new_state, action, actor))
+            log.info('%s: %s took %s from %s to %s', title, actor, action,
+                     curr_state, new_state)
+            return updated
+        # someone got there first: drop what we read and start over
+        log.debug('%s changed under %s; retrying', title, action)
+        dbc.invalidate(MANUSCRIPTS_COLLECT, {TITLE: title})
+    log.warning('%s kept changing; %s not applied', title, action)
+    raise ValueError(f'{title=} kept changing; {action} not applied')
+
+
+MAX_BULK_ACTIONS = 1000
+CHANGED_UNDER_US = 'manuscript changed concurrently; action not applied'
+
+
+def apply_actions(items: list) -> list:
+    """
+    Apply a batch of {title, action, referee, actor} items, at most
+    one per manuscript: one read fetches every manuscript, each transition is
+    checked in memory, and one bulk write sends them all as the same
+    compare-and-set updates apply_action() makes.
+    Returns, in order, each item's title and action with `ok` and
+    either the new `state` or an `error`.
+    """
+    if len(items) > MAX_BULK_ACTIONS:
+        raise ValueError(f'At most {MAX_BULK_ACTIONS} actions per batch')
+    titles = [item.get(TITLE) for item in items]
+    current = {manu[TITLE]: manu
+               for manu in dbc.read_iter(MANUSCRIPTS_COLLECT,
+                                         {TITLE: {'$in': titles}},
+                                         fields=[TITLE, STATE, REFEREES])}
+    results = []
+    updates = []
+    pending = []
+    seen = set()
+    for item in items:
+        title = item.get(TITLE)
+        action = item.get(ACTION)
+        ref = item.get(REFEREE)
+        result = {TITLE: title, ACTION: action, OK: False}
+        results.append(result)
+        try:
+            if title in seen:
+                raise ValueError(f'More than one action for {title=}')
+            seen.add(title)
+            if action in REF_ACTIONS and not ref:
+                raise ValueError(f'{action} needs a referee')
+            manu = current.get(title)
+            if manu is None:
+                raise ValueError(f'No such manuscript: {title=}')
+            new_refs = list(manu[REFEREES])
+            new_state = handle_action(manu[STATE], action,
+                                      manu={**manu, REFEREES: new_refs},
+                                      ref=ref)
+        except ValueError as err:
+            result[ERROR] = str(err)
+            continue
+        action_id = uuid4().hex
+        updates.append((
+            {TITLE: title, STATE: manu[STATE], REFEREES: manu[REFEREES]},
+            {STATE: new_state, REFEREES: new_refs},
+            {ACTION_IDS: action_id},
+        ))
+        pending.append((result, new_state, action_id, item.get(ACTOR)))
+    if not updates:
+        return results
+    all_landed = dbc.bulk_update(MANUSCRIPTS_COLLECT, updates) == len(updates)
+    events = []
+    for result, new_state, action_id, actor in pending:
+        # Only our own write put action_id there and only we take it
+        # out, so whatever else has been written since, this tells.
+        if not all_landed and not dbc.pull(
+                MANUSCRIPTS_COLLECT, {TITLE: result[TITLE]},
+                {ACTION_IDS: action_id}).modified_count:
+            result[ERROR] = CHANGED_UNDER_US
+            continue
+        result[OK] = True
+        result[STATE] = new_state
+        events.append(make_event(result[TITLE], new_state, result[ACTION],
+                                 actor, event_id=action_id))
+    if events and all_landed:
+        dbc.pull_many(MANUSCRIPTS_COLLECT,
+                      {TITLE: {'$in': [event[TITLE] for event in events]}},
+                      {ACTION_IDS: {'$in': [event[EVENT_ID]
+                                            for event in events]}})
+    if events:
+        dbc.create_many(EVENTS_COLLECT, events)
+    return results
+
+
+def read(fields: list = None) -> dict:
     """
     Return a dictionary of all manuscripts keyed by their title.
+    Only `fields` (plus title) are fetched if given.
     """
-    manuscripts = dbc.read_dict(MANUSCRIPTS_COLLECT, TITLE)
-    return manuscripts
+    manus = dbc.read_dict(MANUSCRIPTS_COLLECT, TITLE,
+                          fields=stored_fields(fields)).values()
+    return {manu[TITLE]: manu for manu in add_bodies(manus, fields)}
 
 
-def read_one(title: str) -> dict:
+def read_iter(limit: int = 0, skip: int = 0, after: str = None,
+              fields: list = None):
+    """
+    Yield manuscripts one at a time in title order.
+    Pass the last title seen as `after` to resume from there.
+    Only `fields` (plus title) are fetched if given.
+    """
+    manus = dbc.read_iter(MANUSCRIPTS_COLLECT, limit=limit, skip=skip,
+                          keys=[TITLE],
+                          after=None if after is None else [after],
+                          fields=stored_fields(fields))
+    return iter_bodies(manus, fields)
+
+
+def read_one(title: str, fields: list = None) -> dict:
     """
     Return a single manuscript record as a dict, or None if not found.
+    Only `fields` are fetched if given.
+    """
+    manu = dbc.read_one(MANUSCRIPTS_COLLECT, {TITLE: title},
+                        fields=stored_fields(fields))
+    return None if manu is None else add_bodies([manu], fields)[0]
+
+
+def stored_fields(fields: list) -> list:
+    """
+    The manuscript fields to read for `fields`: body fields need the
+    body's hash.
     """
-    return dbc.read_one(MANUSCRIPTS_COLLECT, {TITLE: title})
+    if fields and set(fields) & set(BODY_FIELDS):
+        return fields + [BODY_HASH]
+    return fields
+
+
+def add_bodies(manus: list, fields: list = None) -> list:
+    """
+    Copies of manus (read with stored_fields(fields)) with the TEXT
+    and TEXT_FILE of their bodies if among `fields`, all looked up
+    at once, and without what only we need: SEARCH_TEXT, unless asked
+    for, and BODY_HASH if we added it.
+    """
+    body_fields = [field for field in BODY_FIELDS
+                   if not fields or field in fields]
+    hashes = sorted({manu[BODY_HASH] for manu in manus
+                     if manu.get(BODY_HASH)})
+    bodies = {}
+    if body_fields and hashes:
+        bodies = {body[HASH]: body for body in dbc.read_iter(
+            BODIES_COLLECT, {HASH: {'$in': hashes}},
+            fields=[HASH] + body_fields)}
+    added = []
+    for manu in manus:
+        manu = dict(manu)
+        body = bodies.get(manu.get(BODY_HASH))
+        if body is not None:
+            manu.update({field: body.get(field) for field in body_fields})
+        if fields is None:
+            manu.pop(SEARCH_TEXT, None)
+        elif BODY_HASH not in fields:
+            manu.pop(BODY_HASH, None)
+        added.append(manu)
+    return added
+
+
+def iter_bodies(manus, fields: list = None):
+    """
+    add_bodies() for an iterator of manuscripts, a batch at a time.
+    """
+    manus = iter(manus)
+    while batch := list(islice(manus, dbc.BATCH_SIZE)):
+        yield from add_bodies(batch, fields)
+
+
+def make_search_text(text: str) -> str:
+    return text[:SEARCH_TEXT_SIZE] if text else None
+
+
+def read_queue(editor_email: str, state: str, after: list = None,
+               page_size: int = dbc.PAGE_SIZE) -> tuple:
+    """
+    An editor's manuscripts in one state, oldest submission first,
+    a page at a time.
+    Returns the page and the `after` to pass for the next page
+    (None on the last page).
+    """
+    if not is_valid_state(state):
+        raise ValueError(f'Bad state: {state}')
+    return dbc.read_page(MANUSCRIPTS_COLLECT, QUEUE_KEYS,
+                         {EDITOR_EMAIL: editor_email, STATE: state},
+                         after=after, page_size=page_size,
+                         fields=LIST_FIELDS)
+
+
+def read_by_referee(email: str, after: list = None,
+                    page_size: int = dbc.PAGE_SIZE,
+                    fields: list = None) -> tuple:
+    """
+    The manuscripts assigned to a referee in title order, a page at
+    a time, with only `fields` (LIST_FIELDS by default).
+    Returns the page and the `after` to pass for the next page
+    (None on the last page).
+    """
+    return dbc.read_page(MANUSCRIPTS_COLLECT, [TITLE], {REFEREES: email},
+                         after=after, page_size=page_size,
+                         fields=fields or LIST_FIELDS)
+
+
+def read_history(title: str, after: list = None,
+                 page_size: int = dbc.PAGE_SIZE) -> tuple:
+    """
+    The manuscript's state changes, oldest first, a page at a time:
+    each one's time, state, action and actor.
+    Returns the page and the `after` to pass for the next page
+    (None on the last page), or None if there is no such manuscript.
+    """
+    if not exists(title):
+        return None
+    return dbc.read_page(EVENTS_COLLECT, EVENT_KEYS, {TITLE: title},
+                         after=after, page_size=page_size)
+
+
+def migrate_history() -> int:
+    """
+    Move the history embedded in manuscripts from before we kept an
+    events collection into it:
+        python -m data.manuscript migrate_history
+    Their times are unknown, so they all get the submission time.
+    Returns how many manuscripts were moved.
+    """
+    moved = 0
+    for manu in dbc.read_iter(MANUSCRIPTS_COLLECT,
+                              {HISTORY: {'$exists': True}},
+                              fields=[TITLE, HISTORY, SUBMITTED_AT]):
+        events = []
+        for i, state in enumerate(manu[HISTORY]):
+            event = make_event(manu[TITLE], state,
+                               event_id=f'{MIGRATE_HISTORY_CMD}-{i:06d}')
+            event[EVENT_TIME] = manu.get(SUBMITTED_AT, 0)
+            events.append(event)
+        # a rerun after a crash must not double them
+        dbc.delete_many(EVENTS_COLLECT,
+                        {TITLE: manu[TITLE],
+                         EVENT_ID: {'$in': [event[EVENT_ID]
+                                            for event in events]}})
+        if events:
+            dbc.create_many(EVENTS_COLLECT, events)
+        dbc.unset(MANUSCRIPTS_COLLECT, {TITLE: manu[TITLE]}, [HISTORY])
+        moved += 1
+    return moved
+
+
+def search(query: str, limit: int = SEARCH_LIMIT) -> list:
+    """
+    Manuscripts matching query, most relevant first, each with its
+    title, author, state, relevance score and a snippet of where
+    the query matched.
+    """
+    terms = srch.tokenize(query)
+    if not terms:
+        raise ValueError(f'Nothing to search for in {query=}')
+    if not 0 < limit <= MAX_SEARCH_LIMIT:
+        raise ValueError(f'limit must be 1 to {MAX_SEARCH_LIMIT}')
+    hits = searcher.search(query, limit,
+                           fields=SEARCH_FIELDS + [ABSTRACT, SEARCH_TEXT])
+    results = []
+    for hit in hits:
+        result = {field: hit.get(field) for field in SEARCH_FIELDS}
+        result[srch.SCORE] = hit[srch.SCORE]
+        result[srch.SNIPPET] = srch.make_snippet(
+            [hit.get(ABSTRACT), hit.get(SEARCH_TEXT)], terms)
+        results.append(result)
+    return results
+
+
+def suggest_authors(query: str, limit: int = sgst.SUGGEST_LIMIT) -> list:
+    """
+    Manuscript authors whose name is close to what was typed, closest
+    first, once each, shaped like people suggestions.
+    """
+    sgst.check_query(query, limit)
+    authors = {}
+    # an author can have many manuscripts, so over fetch
+    for hit in author_suggester.suggest(query, limit * 2):
+        authors.setdefault(hit[AUTHOR_EMAIL], {
+            ppl.EMAIL: hit[AUTHOR_EMAIL],
+            ppl.NAME: hit[AUTHOR],
+            sgst.SCORE: hit[sgst.SCORE],
+        })
+    return list(authors.values())[:limit]
+
+
+def backfill_submitted_at():
+    """
+    Manuscripts from before we recorded submission times sort first
+    in the queue:
+        python -m data.manuscript backfill_submitted_at
+    """
+    return dbc.update_many(MANUSCRIPTS_COLLECT,
+                           {SUBMITTED_AT: {'$exists': False}},
+                           {SUBMITTED_AT: 0}).modified_count
+
+
+def backfill_search_text():
+    """
+    Manuscripts from before bodies were searched through SEARCH_TEXT
+    are only found by title and abstract until this is run:
+        python -m data.manuscript backfill_search_text
+    """
+    filled = 0
+    fields = [TITLE, TEXT]
+    for manu in iter_bodies(dbc.read_iter(MANUSCRIPTS_COLLECT,
+                                          {SEARCH_TEXT: {'$exists': False}},
+                                          fields=stored_fields(fields)),
+                            fields):
+        dbc.update(MANUSCRIPTS_COLLECT, {TITLE: manu[TITLE]},
+                   {SEARCH_TEXT: make_search_text(manu.get(TEXT))})
+        filled += 1
+    return filled
 
 
 def exists(title: str) -> bool:
     """
     Check if a manuscript with the given title exists in the database.
+    Only the title is fetched, never the body.
     """
-    return read_one(title) is not None
+    return read_one(title, fields=[TITLE]) is not None
 
 
 def is_valid_manuscript(title: str, author: str,
@@ -236,22 +689,34 @@ def is_valid_manuscript(title: str, author: str,
 
 def create(title: str, author: str, author_email: str,
            text: str, abstract: str, editor_email: str):
-    if exists(title):
-        raise ValueError(f"Manuscript with {title=} already exists.")
     if is_valid_manuscript(title, author, author_email, text,
                            abstract, editor_email):
+        if exists(title):
+            raise ValueError(f"Manuscript with {title=} already exists.")
+        body = store_body(text=text)
         manuscript = {
             TITLE: title,
             AUTHOR: author,
             AUTHOR_EMAIL: author_email,
             STATE: SUBMITTED,
             REFEREES: [],
-            TEXT: text,
+            BODY_HASH: body[HASH],
+            SEARCH_TEXT: make_search_text(text),
             ABSTRACT: abstract,
-            HISTORY: [SUBMITTED],
             EDITOR_EMAIL: editor_email,
+            SUBMITTED_AT: time.time(),
+            REVISIONS: [store_revision(abstract, body)],
         }
-        dbc.create(MANUSCRIPTS_COLLECT, manuscript)
+        try:
+            dbc.create(MANUSCRIPTS_COLLECT, manuscript)
+        except dbc.DuplicateKeyError:
+            # created meanwhile; what we stored is content-addressed,
+            # so storing it again reuses it
+            raise ValueError(f"Manuscript with {title=} already exists.")
+        dbc.create(EVENTS_COLLECT,
+                   make_event(title, SUBMITTED, actor=author_email))
+        searcher.add(manuscript)
+        author_suggester.add(manuscript)
         return title
 
 
@@ -259,30 +724,225 @@ def delete(title: str):
     """
     Delete the manuscript with the given title.
     Returns the title if deletion succeeded, else None.
+    Its revisions and bodies stay: other manuscripts may share them.
     """
     del_num = dbc.delete(MANUSCRIPTS_COLLECT, {TITLE: title})
-    return title if del_num == 1 else None
+    if del_num != 1:
+        return None
+    dbc.delete_many(EVENTS_COLLECT, {TITLE: title})
+    searcher.remove(title)
+    author_suggester.remove(title)
+    return title
 
 
 def update(title: str, author: str, author_email: str,
            text: str, abstract: str, editor_email: str):
-    if not exists(title):
-        raise ValueError(f'Updating non-existent manuscript: {title=}')
     if is_valid_manuscript(title, author, author_email, text,
                            abstract, editor_email):
+        if not exists(title):
+            raise ValueError(f'Updating non-existent manuscript: {title=}')
+        body = store_body(text=text)
         updated_fields = {
             AUTHOR: author,
             AUTHOR_EMAIL: author_email,
-            TEXT: text,
+            BODY_HASH: body[HASH],
+            SEARCH_TEXT: make_search_text(text),
             ABSTRACT: abstract,
             EDITOR_EMAIL: editor_email,
         }
-        dbc.update(MANUSCRIPTS_COLLECT, {TITLE: title}, updated_fields)
+        if set_body(title, updated_fields,
+                    store_revision(abstract, body)) is None:
+            raise ValueError(f'Updating non-existent manuscript: {title=}')
+        searcher.add({TITLE: title, **updated_fields})
+        author_suggester.add({TITLE: title, **updated_fields})
         return title
 
 
+def revision_hash(abstract: str, text_digest: str) -> str:
+    """
+    A revision is stored under the SHA-256 of its abstract and body.
+    The body goes in by its own digest, so uploads can be hashed as
+    they stream in.
+    """
+    content = json.dumps({ABSTRACT: abstract, TEXT: text_digest},
+                         sort_keys=True)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def store_body(text: str = None, text_file: dict = None) -> dict:
+    """
+    Store a body under the SHA-256 of its UTF-8 bytes, unless it is
+    stored already. Pass it as text or as the file info of uploaded
+    chunks.
+    Returns its hash, length and body, which for an upload can be an
+    earlier copy of the same body (the new chunks are then dropped).
+    """
+    if text_file is None:
+        encoded = text.encode()
+        body = {HASH: hashlib.sha256(encoded).hexdigest(),
+                LENGTH: len(encoded), TEXT: text}
+    else:
+        body = {HASH: text_file[chk.DIGEST], LENGTH: text_file[chk.LENGTH],
+                TEXT_FILE: text_file}
+    try:
+        dbc.create(BODIES_COLLECT, dict(body))
+    except dbc.DuplicateKeyError:
+        if text_file is not None:
+            chk.delete(MANUSCRIPT_CHUNKS_COLLECT, text_file)
+            stored = dbc.read_one(BODIES_COLLECT, {HASH: body[HASH]},
+                                  fields=BODY_FIELDS)
+            body = {HASH: body[HASH], LENGTH: body[LENGTH],
+                    **{field: stored.get(field) for field in BODY_FIELDS}}
+    return body
+
+
+def store_revision(abstract: str, body: dict) -> str:
+    """
+    Store a revision of abstract and body (from store_body()), unless
+    an identical one is stored already. Returns its hash.
+    """
+    revision = {
+        HASH: revision_hash(abstract, body[HASH]),
+        ABSTRACT: abstract,
+        BODY_HASH: body[HASH],
+        LENGTH: body[LENGTH],
+        CREATED_AT: time.time(),
+    }
+    try:
+        dbc.create(REVISIONS_COLLECT, revision)
+    except dbc.DuplicateKeyError:
+        pass
+    return revision[HASH]
+
+
+def set_body(title: str, update_dict: dict, rev_hash: str) -> dict:
+    """
+    $set update_dict, which replaces the BODY_HASH, and append rev_hash
+    to the manuscript's revisions unless it is the latest already.
+    A compare-and-set on the revisions, so concurrent updates are
+    listed in the order they land.
+    Returns the updated manuscript, or None if there is no such title.
+    """
+    for _ in range(MAX_ACTION_TRIES):
+        manu = read_one(title, fields=[REVISIONS])
+        if manu is None:
+            return None
+        revisions = manu.get(REVISIONS)
+        push_dict = None
+        if not revisions or revisions[-1] != rev_hash:
+            push_dict = {REVISIONS: rev_hash}
+        updated = dbc.find_one_and_update(
+            MANUSCRIPTS_COLLECT, {TITLE: title, REVISIONS: revisions},
+            update_dict, push_dict)
+        if updated is not None:
+            if TEXT in updated or TEXT_FILE in updated:
+                # held from before bodies were stored on their own
+                dbc.unset(MANUSCRIPTS_COLLECT, {TITLE: title},
+                          [TEXT, TEXT_FILE])
+            return updated
+        dbc.invalidate(MANUSCRIPTS_COLLECT, {TITLE: title})
+    raise ValueError(f'{title=} kept changing; body not replaced')
+
+
+def upload_text(title: str, stream) -> int:
+    """
+    Store the body read from stream (UTF-8 text, at most MAX_TEXT_SIZE
+    bytes) as the manuscript's text, a chunk at a time as it arrives.
+    Returns its length in bytes.
+    """
+    manu = read_one(title, fields=[ABSTRACT])
+    if manu is None:
+        raise ValueError(f'No such manuscript: {title=}')
+    text_file = chk.write(MANUSCRIPT_CHUNKS_COLLECT, stream,
+                          max_size=MAX_TEXT_SIZE)
+    if not text_file[chk.LENGTH]:
+        raise ValueError("Text cannot be blank")
+    body = store_body(text_file=text_file)
+    updated = set_body(title, {BODY_HASH: body[HASH],
+                               SEARCH_TEXT: make_search_text(body.get(TEXT))},
+                       store_revision(manu[ABSTRACT], body))
+    if updated is None:
+        raise ValueError(f'No such manuscript: {title=}')
+    # uploaded bodies are too big to search
+    searcher.add(updated)
+    return text_file[chk.LENGTH]
+
+
+def read_revisions(title: str) -> list:
+    """
+    The manuscript's revisions, oldest first, each with its hash,
+    length and when it was first stored.
+    None if there is no such manuscript.
+    """
+    manu = read_one(title, fields=[REVISIONS])
+    if manu is None:
+        return None
+    hashes = manu.get(REVISIONS, [])
+    stored = {rev[HASH]: rev
+              for rev in dbc.read_iter(REVISIONS_COLLECT,
+                                       {HASH: {'$in': hashes}},
+                                       fields=REVISION_LIST_FIELDS)}
+    return [stored[rev_hash] for rev_hash in hashes if rev_hash in stored]
+
+
+def read_revision(title: str, rev_hash: str, fields: list = None) -> dict:
+    """
+    One of the manuscript's revisions, or None if it has no such one.
+    Its body's TEXT and TEXT_FILE are looked up if among `fields`.
+    """
+    manu = read_one(title, fields=[REVISIONS])
+    if manu is None or rev_hash not in manu.get(REVISIONS, []):
+        return None
+    body_fields = [field for field in fields or BODY_FIELDS
+                   if field in BODY_FIELDS]
+    revision = dbc.read_one(REVISIONS_COLLECT, {HASH: rev_hash},
+                            fields=fields and fields + [BODY_HASH])
+    if revision is None:
+        return None
+    revision = dict(revision)
+    body_hash = revision.get(BODY_HASH)
+    if fields and BODY_HASH not in fields:
+        revision.pop(BODY_HASH, None)
+    if body_hash and body_fields:
+        # older revisions hold their body themselves
+        body = dbc.read_one(BODIES_COLLECT, {HASH: body_hash},
+                            fields=body_fields) or {}
+        revision.update({field: body.get(field) for field in body_fields})
+    return revision
+
+
+def read_body(body: bytes, start: int = 0, stop: int = None):
+    yield body[start:stop]
+
+
+def open_text(title: str, rev_hash: str = None) -> tuple:
+    """
+    The manuscript's body (or that of one of its revisions) as UTF-8
+    bytes, for streaming out: its length and a function yielding its
+    bytes start up to stop.
+    None if there is no such manuscript or revision.
+    """
+    if rev_hash is None:
+        source = read_one(title, fields=[TEXT, TEXT_FILE])
+    else:
+        source = read_revision(title, rev_hash, fields=[TEXT, TEXT_FILE])
+    if source is None:
+        return None
+    text_file = source.get(TEXT_FILE)
+    if text_file:
+        return (text_file[chk.LENGTH],
+                partial(chk.read, MANUSCRIPT_CHUNKS_COLLECT, text_file))
+    body = (source.get(TEXT) or '').encode()
+    return len(body), partial(read_body, body)
+
+
 def main():
-    pass
+    if sys.argv[1:] == [BACKFILL_CMD]:
+        print(f'Backfilled {backfill_submitted_at()} manuscripts.')
+    elif sys.argv[1:] == [MIGRATE_HISTORY_CMD]:
+        print(f'Moved the history of {migrate_history()} manuscripts.')
+    elif sys.argv[1:] == [BACKFILL_SEARCH_CMD]:
+        print(f'Backfilled {backfill_search_text()} manuscripts.')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,827 @@
+"""
+A backend that keeps every db in this process's memory: no server and
+no dependencies, for tests, benchmarks and demos.
+Nothing outlives the process, and a forked child works on its own copy.
+Filters, updates and pipelines are interpreted here. Only the
+operators in FILTER_OPS, UPDATE_OPS, STAGES, ACCUMULATORS and EXPR_OPS
+are supported; anything else raises ValueError.
+"""
+import copy
+import json
+import re
+import threading
+import uuid
+
+import data.backend as bknd
+
+# what lookup() finds for a path that isn't there
+MISSING = object()
+
+WORD = re.compile(r'\w+')
+
+
+def lookup(value, parts: list) -> list:
+    """
+    Every value at the path `parts` in value. Arrays along the way
+    are searched element by element, unless the part is an index.
+    """
+    if not parts:
+        return [value]
+    if isinstance(value, dict):
+        if parts[0] not in value:
+            return []
+        return lookup(value[parts[0]], parts[1:])
+    if isinstance(value, list):
+        if parts[0].isdigit():
+            i = int(parts[0])
+            return lookup(value[i], parts[1:]) if i < len(value) else []
+        return [found for elem in value for found in lookup(elem, parts)]
+    return []
+
+
+def values_at(doc: dict, path: str) -> list:
+    return lookup(doc, path.split('.'))
+
+
+def value_at(doc: dict, path: str):
+    found = values_at(doc, path)
+    return found[0] if found else MISSING
+
+
+def bracket(value) -> int:
+    """
+    Mongo orders values of different types by type; this is our
+    version of its order.
+    """
+    if value is None or value is MISSING:
+        return 1
+    if isinstance(value, bool):
+        return 8
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, str):
+        return 3
+    if isinstance(value, dict):
+        return 4
+    if isinstance(value, list):
+        return 5
+    if isinstance(value, bytes):
+        return 6
+    return 9
+
+
+def sort_key(value) -> tuple:
+    rank = bracket(value)
+    if rank == 1:
+        return (rank, 0)
+    if rank in (2, 3, 6, 8):
+        return (rank, value)
+    if rank in (4, 5):
+        return (rank, json.dumps(value, sort_keys=True, default=repr))
+    return (rank, str(value))
+
+
+def hash_key(value) -> tuple:
+    """
+    A hashable stand-in for value: equal for values equal() says are.
+    """
+    rank = bracket(value)
+    if rank == 1:
+        return (rank, None)
+    if rank in (4, 5):
+        return (rank, json.dumps(value, sort_keys=True, default=repr))
+    return (rank, value)
+
+
+def equal(a, b) -> bool:
+    return bracket(a) == bracket(b) and (bracket(a) == 1 or a == b)
+
+
+def expand(found: list) -> list:
+    """
+    The values a condition is tried on: each one found and, for
+    arrays, each of their elements too.
+    """
+    values = []
+    for value in found:
+        values.append(value)
+        if isinstance(value, list):
+            values.extend(value)
+    return values
+
+
+def eq_match(found: list, target) -> bool:
+    if not found:
+        return target is None
+    return any(equal(value, target) for value in expand(found))
+
+
+def compare(op):
+    def match(found: list, target) -> bool:
+        return any(bracket(value) == bracket(target)
+                   and op(sort_key(value), sort_key(target))
+                   for value in expand(found))
+    return match
+
+
+def in_match(found: list, targets: list) -> bool:
+    return any(eq_match(found, target) for target in targets)
+
+
+FILTER_OPS = {
+    '$eq': eq_match,
+    '$ne': lambda found, target: not eq_match(found, target),
+    '$in': in_match,
+    '$nin': lambda found, targets: not in_match(found, targets),
+    '$gt': compare(lambda a, b: a > b),
+    '$gte': compare(lambda a, b: a >= b),
+    '$lt': compare(lambda a, b: a < b),
+    '$lte': compare(lambda a, b: a <= b),
+    '$exists': lambda found, target: bool(found) == bool(target),
+}
+
+
+def is_operator_dict(cond) -> bool:
+    return (isinstance(cond, dict) and bool(cond)
+            and all(key.startswith('$') for key in cond))
+
+
+def match_found(found: list, cond) -> bool:
+    if not is_operator_dict(cond):
+        return eq_match(found, cond)
+    for op, target in cond.items():
+        if op not in FILTER_OPS:
+            raise ValueError(f'Unsupported filter operator: {op}')
+        if not FILTER_OPS[op](found, target):
+            return False
+    return True
+
+
+def matches(doc: dict, filt: dict) -> bool:
+    for key, cond in (filt or {}).items():
+        if key == '$and':
+            if not all(matches(doc, sub) for sub in cond):
+                return False
+        elif key == '$or':
+            if not any(matches(doc, sub) for sub in cond):
+                return False
+        elif key == '$nor':
+            if any(matches(doc, sub) for sub in cond):
+                return False
+        elif key.startswith('$'):
+            raise ValueError(f'Unsupported filter operator: {key}')
+        elif not match_found(values_at(doc, key), cond):
+            return False
+    return True
+
+
+def project(doc: dict, fields: list = None, no_id: bool = False) -> dict:
+    """
+    A copy of doc with only `fields` (all if None), leaving out the ID
+    if no_id.
+    """
+    if not fields:
+        projected = copy.deepcopy(doc)
+    else:
+        projected = {}
+        if bknd.ID in doc:
+            projected[bknd.ID] = doc[bknd.ID]
+        for field in fields:
+            value = value_at(doc, field)
+            if value is not MISSING:
+                set_path(projected, field, copy.deepcopy(value))
+    if no_id:
+        projected.pop(bknd.ID, None)
+    return projected
+
+
+def doc_sort_key(keys: list):
+    def key(doc):
+        return [sort_key(value_at(doc, field)) for field in keys]
+    return key
+
+
+def set_path(doc: dict, path: str, value):
+    parts = path.split('.')
+    target = doc
+    for part in parts[:-1]:
+        if isinstance(target, list):
+            target = target[int(part)]
+        else:
+            target = target.setdefault(part, {})
+    if isinstance(target, list):
+        target[int(parts[-1])] = value
+    else:
+        target[parts[-1]] = value
+
+
+def unset_path(doc: dict, path: str):
+    parts = path.split('.')
+    found = lookup(doc, parts[:-1])
+    if found and isinstance(found[0], dict):
+        found[0].pop(parts[-1], None)
+
+
+def array_at(doc: dict, path: str) -> list:
+    """
+    The array at path, created empty if there is none.
+    """
+    found = value_at(doc, path)
+    if found is MISSING or found is None:
+        found = []
+        set_path(doc, path, found)
+    if not isinstance(found, list):
+        raise ValueError(f'{path} is not an array')
+    return found
+
+
+def each(value) -> list:
+    if isinstance(value, dict) and '$each' in value:
+        return value['$each']
+    return [value]
+
+
+def set_elems(doc: dict, path: str, value, array_filters: list):
+    """
+    $set on a path like 'arr.$[elem].field': set field on every element
+    of arr matching the array filter for elem.
+    """
+    match = re.fullmatch(r'(.+)\.\$\[(\w+)\]\.(.+)', path)
+    if not match:
+        raise ValueError(f'Unsupported update path: {path}')
+    array, ident, rest = match.groups()
+    elem_filt = {}
+    for filt in array_filters or []:
+        for key, cond in filt.items():
+            if key.startswith(f'{ident}.'):
+                elem_filt[key[len(ident) + 1:]] = cond
+    if not elem_filt:
+        raise ValueError(f'No array filter for {ident}')
+    found = value_at(doc, array)
+    for elem in found if isinstance(found, list) else []:
+        if isinstance(elem, dict) and matches(elem, elem_filt):
+            set_path(elem, rest, copy.deepcopy(value))
+
+
+def pull_match(elem, cond) -> bool:
+    if is_operator_dict(cond):
+        return match_found([elem], cond)
+    if isinstance(cond, dict) and isinstance(elem, dict):
+        return matches(elem, cond)
+    return equal(elem, cond)
+
+
+def do_set(doc, fields, array_filters):
+    for path, value in fields.items():
+        if '$[' in path:
+            set_elems(doc, path, value, array_filters)
+        else:
+            set_path(doc, path, copy.deepcopy(value))
+
+
+def do_unset(doc, fields, array_filters):
+    for path in fields:
+        unset_path(doc, path)
+
+
+def do_inc(doc, fields, array_filters):
+    for path, amount in fields.items():
+        value = value_at(doc, path)
+        set_path(doc, path, (0 if value is MISSING else value) + amount)
+
+
+def do_push(doc, fields, array_filters):
+    for path, value in fields.items():
+        array_at(doc, path).extend(copy.deepcopy(each(value)))
+
+
+def do_add_to_set(doc, fields, array_filters):
+    for path, value in fields.items():
+        array = array_at(doc, path)
+        for elem in each(value):
+            if not any(equal(held, elem) for held in array):
+                array.append(copy.deepcopy(elem))
+
+
+def do_pull(doc, fields, array_filters):
+    for path, cond in fields.items():
+        found = value_at(doc, path)
+        if isinstance(found, list):
+            found[:] = [elem for elem in found if not pull_match(elem, cond)]
+
+
+UPDATE_OPS = {
+    '$set': do_set,
+    '$unset': do_unset,
+    '$inc': do_inc,
+    '$push': do_push,
+    '$addToSet': do_add_to_set,
+    '$pull': do_pull,
+}
+
+
+def apply_update(doc: dict, update: dict, array_filters: list = None):
+    """
+    The doc as update leaves it (a copy).
+    """
+    updated = copy.deepcopy(doc)
+    for op, fields in update.items():
+        if op not in UPDATE_OPS:
+            raise ValueError(f'Unsupported update operator: {op}')
+        UPDATE_OPS[op](updated, fields, array_filters)
+    if not equal(updated.get(bknd.ID), doc.get(bknd.ID)):
+        raise ValueError(f'Can not change {bknd.ID}')
+    return updated
+
+
+def eval_expr(doc: dict, expr):
+    """
+    An aggregation expression: '$field' paths, {'$op': args} and
+    documents and arrays of expressions.
+    """
+    if isinstance(expr, str) and expr.startswith('$'):
+        return value_at(doc, expr[1:])
+    if is_operator_dict(expr) and len(expr) == 1:
+        op, args = next(iter(expr.items()))
+        if op not in EXPR_OPS:
+            raise ValueError(f'Unsupported expression operator: {op}')
+        return EXPR_OPS[op](doc, args)
+    if isinstance(expr, dict):
+        evaluated = {}
+        for key, sub in expr.items():
+            value = eval_expr(doc, sub)
+            if value is not MISSING:
+                evaluated[key] = value
+        return evaluated
+    if isinstance(expr, list):
+        return [eval_expr(doc, sub) for sub in expr]
+    return expr
+
+
+def if_null(doc: dict, args: list):
+    for arg in args:
+        value = eval_expr(doc, arg)
+        if value is not MISSING and value is not None:
+            return value
+    return None
+
+
+EXPR_OPS = {
+    '$ifNull': if_null,
+}
+
+
+def present(value):
+    return None if value is MISSING else value
+
+
+def acc_push(values):
+    return [present(value) for value in values]
+
+
+def acc_add_to_set(values):
+    kept = []
+    for value in values:
+        if not any(equal(held, present(value)) for held in kept):
+            kept.append(present(value))
+    return kept
+
+
+def acc_sum(values):
+    return sum(value for value in values
+               if isinstance(value, (int, float))
+               and not isinstance(value, bool))
+
+
+def acc_avg(values):
+    nums = [value for value in values
+            if isinstance(value, (int, float)) and not isinstance(value, bool)]
+    return sum(nums) / len(nums) if nums else None
+
+
+def acc_extreme(pick):
+    def acc(values):
+        found = [value for value in values
+                 if value is not MISSING and value is not None]
+        return pick(found, key=sort_key) if found else None
+    return acc
+
+
+ACCUMULATORS = {
+    '$push': acc_push,
+    '$addToSet': acc_add_to_set,
+    '$sum': acc_sum,
+    '$avg': acc_avg,
+    '$first': lambda values: present(values[0]) if values else None,
+    '$last': lambda values: present(values[-1]) if values else None,
+    '$min': acc_extreme(min),
+    '$max': acc_extreme(max),
+}
+
+
+def stage_match(docs, filt):
+    return [doc for doc in docs if matches(doc, filt)]
+
+
+def stage_project(docs, spec):
+    excluded = [field for field, value in spec.items()
+                if value in (0, False)]
+    if len(excluded) == len(spec):
+        projected = []
+        for doc in docs:
+            doc = copy.deepcopy(doc)
+            for field in excluded:
+                unset_path(doc, field)
+            projected.append(doc)
+        return projected
+    projected = []
+    for doc in docs:
+        out = {}
+        if spec.get(bknd.ID, 1) not in (0, False) and bknd.ID in doc:
+            out[bknd.ID] = doc[bknd.ID]
+        for field, value in spec.items():
+            if value in (0, False):
+                continue
+            if value in (1, True):
+                value = value_at(doc, field)
+            else:
+                value = eval_expr(doc, value)
+            if value is not MISSING:
+                set_path(out, field, copy.deepcopy(value))
+        projected.append(out)
+    return projected
+
+
+def stage_unwind(docs, spec):
+    path = spec['path'] if isinstance(spec, dict) else spec
+    field = path[1:]
+    unwound = []
+    for doc in docs:
+        array = value_at(doc, field)
+        if not isinstance(array, list):
+            if array is not MISSING and array is not None:
+                unwound.append(doc)
+            continue
+        for elem in array:
+            doc = copy.deepcopy(doc)
+            set_path(doc, field, elem)
+            unwound.append(doc)
+    return unwound
+
+
+def stage_group(docs, spec):
+    groups = {}
+    for doc in docs:
+        group_id = present(eval_expr(doc, spec[bknd.ID]))
+        key = hash_key(group_id)
+        if key not in groups:
+            groups[key] = (group_id, [])
+        groups[key][1].append(doc)
+    grouped = []
+    for group_id, members in groups.values():
+        out = {bknd.ID: group_id}
+        for field, acc in spec.items():
+            if field == bknd.ID:
+                continue
+            (op, expr), = acc.items()
+            if op not in ACCUMULATORS:
+                raise ValueError(f'Unsupported accumulator: {op}')
+            out[field] = ACCUMULATORS[op](
+                [eval_expr(doc, expr) for doc in members])
+        grouped.append(out)
+    return grouped
+
+
+def stage_sort(docs, spec):
+    for field, direction in reversed(list(spec.items())):
+        docs = sorted(docs, key=lambda doc: sort_key(value_at(doc, field)),
+                      reverse=direction < 0)
+    return docs
+
+
+STAGES = {
+    '$match': stage_match,
+    '$project': stage_project,
+    '$unwind': stage_unwind,
+    '$group': stage_group,
+    '$sort': stage_sort,
+    '$skip': lambda docs, n: docs[n:],
+    '$limit': lambda docs, n: docs[:n],
+    '$count': lambda docs, field: [{field: len(docs)}],
+}
+
+
+def run_pipeline(docs: list, pipeline: list) -> list:
+    for stage in pipeline:
+        (name, spec), = stage.items()
+        if name not in STAGES:
+            raise ValueError(f'Unsupported pipeline stage: {name}')
+        docs = STAGES[name](docs, spec)
+    return docs
+
+
+def tokenize(text) -> list:
+    return WORD.findall(text.lower()) if isinstance(text, str) else []
+
+
+def text_scores(docs, weights: dict, query: str) -> list:
+    """
+    (score, doc) for each of docs with a word of query in one of the
+    `weights` fields, best first. Each such word scores its field's
+    weight.
+    """
+    terms = set(tokenize(query))
+    scored = []
+    for doc in docs:
+        score = 0
+        for field, weight in weights.items():
+            for word in tokenize(present(value_at(doc, field))):
+                if word in terms:
+                    score += weight
+        if score:
+            scored.append((score, doc))
+    scored.sort(key=lambda pair: -pair[0])
+    return scored
+
+
+class Index:
+    """
+    Finds docs by the value of the first of its fields; for an array,
+    by each element too. A unique index also maps the values of all its
+    fields to the one doc holding them.
+    A TEXT index only records its fields and weights, for text_search().
+    """
+    def __init__(self, keys: list, unique: bool = False,
+                 weights: dict = None):
+        self.fields = [field for field, _ in keys]
+        self.text = any(direction == bknd.TEXT for _, direction in keys)
+        self.unique = unique and not self.text
+        self.weights = {field: (weights or {}).get(field, 1)
+                        for field in self.fields}
+        self.entries = {}  # hash_key(value) -> {doc key, ...}
+        self.holders = {}  # unique values -> doc key
+
+    def entry_keys(self, doc: dict) -> set:
+        found = values_at(doc, self.fields[0])
+        return {hash_key(value) for value in expand(found) or [None]}
+
+    def unique_key(self, doc: dict) -> tuple:
+        return tuple(hash_key(present(value_at(doc, field)))
+                     for field in self.fields)
+
+    def add(self, key, doc: dict):
+        if self.text:
+            return
+        for entry in self.entry_keys(doc):
+            self.entries.setdefault(entry, set()).add(key)
+        if self.unique:
+            self.holders[self.unique_key(doc)] = key
+
+    def remove(self, key, doc: dict):
+        if self.text:
+            return
+        for entry in self.entry_keys(doc):
+            keys = self.entries.get(entry)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.entries[entry]
+        if self.unique and self.holders.get(self.unique_key(doc)) == key:
+            del self.holders[self.unique_key(doc)]
+
+    def candidates(self, filt: dict):
+        """
+        The keys of the docs that may match filt, or None if this index
+        can't narrow it down.
+        """
+        if self.text or self.fields[0] not in filt:
+            return None
+        cond = filt[self.fields[0]]
+        if not isinstance(cond, dict):
+            return self.entries.get(hash_key(cond), set())
+        if set(cond) == {'$in'}:
+            return set().union(*[self.entries.get(hash_key(value), set())
+                                 for value in cond['$in']])
+        return None
+
+
+class Collection:
+    def __init__(self):
+        self.docs = {}  # hash_key(ID) -> doc
+        self.order = {}  # hash_key(ID) -> when the doc was inserted
+        self.inserted = 0
+        self.indexes = {}  # keys -> Index
+
+    def find(self, filt: dict) -> list:
+        """
+        The matching docs, in insertion order, using the index that
+        narrows the search down most.
+        """
+        best = None
+        for index in self.indexes.values():
+            keys = index.candidates(filt or {})
+            if keys is not None and (best is None or len(keys) < len(best)):
+                best = keys
+        if best is None:
+            docs = self.docs.values()
+        else:
+            docs = [self.docs[key] for key in sorted(best,
+                                                     key=self.order.get)]
+        return [doc for doc in docs if matches(doc, filt)]
+
+    def put(self, doc: dict, old: dict = None):
+        """
+        Store doc in place of old (None: a new doc).
+        """
+        key = hash_key(doc[bknd.ID])
+        if old is None and key in self.docs:
+            raise bknd.DuplicateKeyError(f'Duplicate {bknd.ID}: '
+                                         f'{doc[bknd.ID]}')
+        for index in self.indexes.values():
+            if index.unique:
+                holder = index.holders.get(index.unique_key(doc))
+                if holder is not None and holder != key:
+                    raise bknd.DuplicateKeyError(
+                        f'Duplicate key for {index.fields}')
+        if old is None:
+            self.order[key] = self.inserted
+            self.inserted += 1
+        else:
+            for index in self.indexes.values():
+                index.remove(key, old)
+        self.docs[key] = doc
+        for index in self.indexes.values():
+            index.add(key, doc)
+
+    def remove(self, doc: dict):
+        key = hash_key(doc[bknd.ID])
+        del self.docs[key]
+        del self.order[key]
+        for index in self.indexes.values():
+            index.remove(key, doc)
+
+
+class MemoryBackend(bknd.Backend):
+    """
+    Every operation holds one lock, so each is atomic like a single
+    document write in Mongo.
+    """
+    def __init__(self):
+        self.dbs = {}  # db -> {collection name -> Collection}
+        self.lock = threading.RLock()
+
+    def coll(self, db, collection) -> Collection:
+        return self.dbs.setdefault(db, {}).setdefault(collection,
+                                                      Collection())
+
+    def create_index(self, db, collection, keys, **options):
+        if isinstance(keys, str):
+            keys = [(keys, bknd.ASCENDING)]
+        name = tuple(tuple(key) for key in keys)
+        with self.lock:
+            coll = self.coll(db, collection)
+            if name in coll.indexes:
+                return name
+            index = Index(list(keys), unique=options.get('unique', False),
+                          weights=options.get('weights'))
+            for key, doc in coll.docs.items():
+                if index.unique and index.unique_key(doc) in index.holders:
+                    raise bknd.DuplicateKeyError(
+                        f'Duplicate key for {index.fields}')
+                index.add(key, doc)
+            coll.indexes[name] = index
+        return name
+
+    def insert(self, coll: Collection, doc: dict):
+        if bknd.ID not in doc:
+            doc[bknd.ID] = uuid.uuid4().hex
+        coll.put(copy.deepcopy(doc))
+
+    def insert_one(self, db, collection, doc: dict) -> bknd.InsertResult:
+        with self.lock:
+            self.insert(self.coll(db, collection), doc)
+        return bknd.InsertResult(doc[bknd.ID])
+
+    def insert_many(self, db, collection, docs: list):
+        duplicate = None
+        with self.lock:
+            coll = self.coll(db, collection)
+            for doc in docs:
+                try:
+                    self.insert(coll, doc)
+                except bknd.DuplicateKeyError as err:
+                    duplicate = err
+        if duplicate is not None:
+            raise duplicate
+
+    def find_one(self, db, collection, filt: dict, fields: list = None,
+                 no_id: bool = False) -> dict:
+        with self.lock:
+            found = self.coll(db, collection).find(filt)
+            if not found:
+                return None
+            return project(found[0], fields, no_id)
+
+    def find(self, db, collection, filt: dict, fields: list = None,
+             no_id: bool = True, sort: list = None, limit: int = 0,
+             skip: int = 0, batch_size: int = 0):
+        with self.lock:
+            found = self.coll(db, collection).find(filt)
+            if sort:
+                found = sorted(found, key=doc_sort_key(sort))
+            found = found[skip:skip + limit] if limit else found[skip:]
+            return [project(doc, fields, no_id) for doc in found]
+
+    def delete_one(self, db, collection, filt: dict) -> int:
+        with self.lock:
+            coll = self.coll(db, collection)
+            found = coll.find(filt)
+            if found:
+                coll.remove(found[0])
+            return min(len(found), 1)
+
+    def delete_many(self, db, collection, filt: dict) -> int:
+        with self.lock:
+            coll = self.coll(db, collection)
+            found = coll.find(filt)
+            for doc in found:
+                coll.remove(doc)
+            return len(found)
+
+    def update_docs(self, coll: Collection, docs: list, update: dict,
+                    array_filters: list = None) -> bknd.UpdateResult:
+        modified = 0
+        for doc in docs:
+            updated = apply_update(doc, update, array_filters)
+            if updated != doc:
+                coll.put(updated, old=doc)
+                modified += 1
+        return bknd.UpdateResult(len(docs), modified)
+
+    def update_one(self, db, collection, filt: dict, update: dict,
+                   array_filters: list = None) -> bknd.UpdateResult:
+        with self.lock:
+            coll = self.coll(db, collection)
+            return self.update_docs(coll, coll.find(filt)[:1], update,
+                                    array_filters)
+
+    def update_many(self, db, collection, filt: dict,
+                    update: dict) -> bknd.UpdateResult:
+        with self.lock:
+            coll = self.coll(db, collection)
+            return self.update_docs(coll, coll.find(filt), update)
+
+    def find_one_and_update(self, db, collection, filt: dict,
+                            update: dict) -> dict:
+        with self.lock:
+            coll = self.coll(db, collection)
+            found = coll.find(filt)
+            if not found:
+                return None
+            self.update_docs(coll, found[:1], update)
+            key = hash_key(found[0][bknd.ID])
+            return copy.deepcopy(coll.docs[key])
+
+    def bulk_update(self, db, collection, updates: list) -> int:
+        with self.lock:
+            return sum(self.update_one(db, collection, filt,
+                                       update).matched_count
+                       for filt, update in updates)
+
+    def replace_one(self, db, collection, filt: dict, doc: dict,
+                    upsert: bool = False) -> bknd.UpdateResult:
+        with self.lock:
+            coll = self.coll(db, collection)
+            found = coll.find(filt)
+            new = copy.deepcopy(doc)
+            if found:
+                new[bknd.ID] = found[0][bknd.ID]
+                if new == found[0]:
+                    return bknd.UpdateResult(1, 0)
+                coll.put(new, old=found[0])
+                return bknd.UpdateResult(1, 1)
+            if upsert:
+                if bknd.ID not in new and bknd.ID in filt \
+                        and not isinstance(filt[bknd.ID], dict):
+                    new[bknd.ID] = filt[bknd.ID]
+                self.insert(coll, new)
+            return bknd.UpdateResult(0, 0)
+
+    def aggregate(self, db, collection, pipeline: list):
+        with self.lock:
+            docs = copy.deepcopy(self.coll(db, collection).find({}))
+        return run_pipeline(docs, pipeline)
+
+    def text_search(self, db, collection, query: str, limit: int,
+                    fields: list = None) -> list:
+        with self.lock:
+            coll = self.coll(db, collection)
+            indexes = [index for index in coll.indexes.values()
+                       if index.text]
+            if not indexes:
+                raise ValueError(f'No text index on {collection}')
+            scored = text_scores(coll.docs.values(), indexes[0].weights,
+                                 query)
+            return [{**project(doc, fields, no_id=True),
+                     bknd.TEXT_SCORE: score}
+                    for score, doc in scored[:limit]]
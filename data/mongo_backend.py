@@ -0,0 +1,158 @@
+"""
+The backend on a MongoDB server, local or in the cloud (Atlas).
+"""
+import os
+
+import pymongo as pm
+
+import data.backend as bknd
+import data.logs as logs
+
+log = logs.get_logger(__name__)
+
+
+def projection(fields: list = None, no_id: bool = True) -> dict:
+    """
+    Build a projection so the server only sends `fields`
+    (all fields if None), leaving out the Mongo ID if `no_id`.
+    """
+    proj = {field: 1 for field in fields} if fields else {}
+    if no_id:
+        proj[bknd.ID] = 0
+    return proj or None
+
+
+class MongoBackend(bknd.Backend):
+    """
+    Connects on first use. A MongoClient must not cross a fork, so each
+    process builds its own: pid says which process the current one
+    belongs to.
+    cloud connections use the stable server API and are pinged first.
+    """
+    def __init__(self, uri: str = None, cloud: bool = False,
+                 pool_settings: dict = None):
+        self.uri = uri
+        self.cloud = cloud
+        self.pool_settings = dict(pool_settings or {})
+        self.client = None
+        self.pid = None
+
+    def connect(self) -> pm.MongoClient:
+        if self.cloud:
+            client = pm.MongoClient(self.uri,
+                                    server_api=pm.server_api.ServerApi('1'),
+                                    **self.pool_settings)
+            # Test the connection with a ping
+            try:
+                client.admin.command('ping')
+                log.info('Pinged your deployment. '
+                         'Successfully connected to MongoDB!')
+            except Exception as e:
+                raise ConnectionError(f"Failed to connect to MongoDB: {e}")
+            return client
+        return pm.MongoClient(self.uri, **self.pool_settings)
+
+    def get_client(self) -> pm.MongoClient:
+        if self.client is None or self.pid != os.getpid():
+            # a client made before a fork is the parent's: never touch it
+            self.client = self.connect()
+            self.pid = os.getpid()
+        return self.client
+
+    def coll(self, db, collection):
+        return self.get_client()[db][collection]
+
+    def set_pool_settings(self, settings: dict):
+        self.pool_settings.update(settings)
+        self.close()
+
+    def after_fork(self):
+        self.client = None
+        self.pid = None
+
+    def close(self):
+        if self.client is not None and self.pid == os.getpid():
+            self.client.close()
+        self.after_fork()
+
+    def create_index(self, db, collection, keys, **options):
+        # Mongo tells multikey indexes by itself
+        options.pop('multikey', None)
+        return self.coll(db, collection).create_index(keys, **options)
+
+    def insert_one(self, db, collection, doc: dict) -> bknd.InsertResult:
+        try:
+            ret = self.coll(db, collection).insert_one(doc)
+        except pm.errors.DuplicateKeyError as err:
+            raise bknd.DuplicateKeyError(str(err))
+        return bknd.InsertResult(ret.inserted_id)
+
+    def insert_many(self, db, collection, docs: list):
+        try:
+            self.coll(db, collection).insert_many(docs, ordered=False)
+        except pm.errors.BulkWriteError as err:
+            if any(error.get('code') == 11000
+                   for error in err.details.get('writeErrors', [])):
+                raise bknd.DuplicateKeyError(str(err))
+            raise
+
+    def find_one(self, db, collection, filt: dict, fields: list = None,
+                 no_id: bool = False) -> dict:
+        return self.coll(db, collection).find_one(filt,
+                                                  projection(fields, no_id))
+
+    def find(self, db, collection, filt: dict, fields: list = None,
+             no_id: bool = True, sort: list = None, limit: int = 0,
+             skip: int = 0, batch_size: int = 0):
+        cursor = self.coll(db, collection).find(filt,
+                                                projection(fields, no_id),
+                                                batch_size=batch_size,
+                                                limit=limit, skip=skip)
+        if sort:
+            cursor = cursor.sort([(key, pm.ASCENDING) for key in sort])
+        return cursor
+
+    def delete_one(self, db, collection, filt: dict) -> int:
+        return self.coll(db, collection).delete_one(filt).deleted_count
+
+    def delete_many(self, db, collection, filt: dict) -> int:
+        return self.coll(db, collection).delete_many(filt).deleted_count
+
+    def update_one(self, db, collection, filt: dict, update: dict,
+                   array_filters: list = None) -> bknd.UpdateResult:
+        ret = self.coll(db, collection).update_one(
+            filt, update, array_filters=array_filters)
+        return bknd.UpdateResult(ret.matched_count, ret.modified_count)
+
+    def update_many(self, db, collection, filt: dict,
+                    update: dict) -> bknd.UpdateResult:
+        ret = self.coll(db, collection).update_many(filt, update)
+        return bknd.UpdateResult(ret.matched_count, ret.modified_count)
+
+    def find_one_and_update(self, db, collection, filt: dict,
+                            update: dict) -> dict:
+        return self.coll(db, collection).find_one_and_update(
+            filt, update, return_document=pm.ReturnDocument.AFTER)
+
+    def bulk_update(self, db, collection, updates: list) -> int:
+        ops = [pm.UpdateOne(filt, update) for filt, update in updates]
+        ret = self.coll(db, collection).bulk_write(ops, ordered=False)
+        return ret.matched_count
+
+    def replace_one(self, db, collection, filt: dict, doc: dict,
+                    upsert: bool = False) -> bknd.UpdateResult:
+        ret = self.coll(db, collection).replace_one(filt, doc,
+                                                    upsert=upsert)
+        return bknd.UpdateResult(ret.matched_count, ret.modified_count)
+
+    def aggregate(self, db, collection, pipeline: list):
+        return self.coll(db, collection).aggregate(pipeline)
+
+    def text_search(self, db, collection, query: str, limit: int,
+                    fields: list = None) -> list:
+        proj = projection(fields)
+        proj[bknd.TEXT_SCORE] = {'$meta': 'textScore'}
+        cursor = self.coll(db, collection).find(
+            {'$text': {'$search': query}}, proj)
+        cursor = cursor.sort([(bknd.TEXT_SCORE, {'$meta': 'textScore'})])
+        return list(cursor.limit(limit))
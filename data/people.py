@@ -1,11 +1,20 @@
 import re
+import sys
+
 import data.roles as rls
 import data.db_connect as dbc
+import data.suggest as sgst
 
 MIN_USER_NAME_LEN = 2
 
 PEOPLE_COLLECT = 'people'
 
+# The masthead is kept precomputed in one doc of its own collection.
+MASTHEAD_COLLECT = 'masthead'
+MASTHEAD_ID = 'masthead'
+MH_ROLES = 'roles'
+REBUILD_MH_CMD = 'rebuild_masthead'
+
 # fields
 NAME = 'name'
 ROLES = 'roles'
@@ -15,8 +24,12 @@ EMAIL = 'email'
 # for re check
 CHAR_OR_DIGIT = '[A-Za-z0-9]'
 
-client = dbc.connect_db()
-print(f'{client=}')
+dbc.add_index(PEOPLE_COLLECT, EMAIL, unique=True)
+# multikey: lets the masthead find people by role without a scan
+dbc.add_index(PEOPLE_COLLECT, ROLES, multikey=True)
+
+suggester = sgst.TrigramIndex(PEOPLE_COLLECT, EMAIL, [NAME, AFFILIATION],
+                              [EMAIL, NAME, AFFILIATION])
 
 
 def is_valid_email(email: str) -> bool:
@@ -29,28 +42,48 @@ def is_valid_email(email: str) -> bool:
     return bool(re.match(pattern, email))
 
 
-def read():
+def read(fields: list = None):
     """
     Our contract:
-        - No arguments.
+        - Optionally, the list of fields to fetch (all if None).
         - Returns a dictionary of users keyed on user email.
         - Each user email must be the key for another dictionary.
     """
-    people = dbc.read_dict(PEOPLE_COLLECT, EMAIL)
-    print(f'{people=}')
-    return people
+    return dbc.read_dict(PEOPLE_COLLECT, EMAIL, fields=fields)
 
 
-def read_one(email: str) -> dict:
+def read_iter(limit: int = 0, skip: int = 0, after: str = None,
+              fields: list = None):
+    """
+    Yield people one at a time in email order.
+    Pass the last email seen as `after` to resume from there.
+    Only `fields` (plus email) are fetched if given.
+    """
+    return dbc.read_iter(PEOPLE_COLLECT, limit=limit, skip=skip,
+                         keys=[EMAIL],
+                         after=None if after is None else [after],
+                         fields=fields)
+
+
+def read_one(email: str, fields: list = None) -> dict:
     """
     Return a person record if email present in DB,
     else None.
     """
-    return dbc.read_one(PEOPLE_COLLECT, {EMAIL: email})
+    return dbc.read_one(PEOPLE_COLLECT, {EMAIL: email}, fields=fields)
 
 
 def exists(email: str) -> bool:
-    return read_one(email) is not None
+    return read_one(email, fields=[EMAIL]) is not None
+
+
+def suggest(query: str, limit: int = sgst.SUGGEST_LIMIT) -> list:
+    """
+    People whose name or affiliation is close to what was typed,
+    closest first, with their email, name, affiliation and score.
+    """
+    sgst.check_query(query, limit)
+    return suggester.suggest(query, limit)
 
 
 def is_valid_person(name: str, affiliation: str, email: str,
@@ -70,8 +103,6 @@ def is_valid_person(name: str, affiliation: str, email: str,
 
 
 def create(name: str, affiliation: str, email: str, role: str):
-    if exists(email):
-        raise ValueError(f'Adding duplicate {email=}')
     if is_valid_person(name, affiliation, email, role=role):
         roles = []
         if role:
@@ -83,21 +114,33 @@ def create(name: str, affiliation: str, email: str, role: str):
             ROLES: roles
         }
         # print(person)
-        dbc.create(PEOPLE_COLLECT, person)
+        try:
+            dbc.create(PEOPLE_COLLECT, person)
+        except dbc.DuplicateKeyError:
+            raise ValueError(f'Adding duplicate {email=}')
+        suggester.add(person)
+        if role in rls.MH_ROLES:
+            mh_add(person, role)
         return email
 
 
 def delete(email):
     del_num = dbc.delete(PEOPLE_COLLECT, {EMAIL: email})
-    return email if del_num == 1 else None
+    if del_num != 1:
+        return None
+    mh_remove(email, rls.MH_ROLES)
+    suggester.remove(email)
+    return email
 
 
 def update(email: str, name: str, affiliation: str):
-    if not exists(email):
-        raise ValueError(f'Updating non-existent person: {email=}')
     if is_valid_person(name, affiliation, email):
-        dbc.update(PEOPLE_COLLECT, {EMAIL: email},
-                   {NAME: name, AFFILIATION: affiliation})
+        ret = dbc.update(PEOPLE_COLLECT, {EMAIL: email},
+                         {NAME: name, AFFILIATION: affiliation})
+        if ret.matched_count == 0:
+            raise ValueError(f'Updating non-existent person: {email=}')
+        mh_update(email, {NAME: name, AFFILIATION: affiliation})
+        suggester.add({EMAIL: email, NAME: name, AFFILIATION: affiliation})
         return email
 
 
@@ -121,45 +164,128 @@ def create_mh_rec(person: dict) -> dict:
     return mh_rec
 
 
+def create_mh_entry(person: dict) -> dict:
+    """
+    What the stored masthead keeps per person: the masthead fields
+    plus the email we find them by when they change.
+    """
+    return {EMAIL: person[EMAIL], **create_mh_rec(person)}
+
+
+MH_PEOPLE = 'people'
+
+
+def mh_sort_key(entry: dict) -> tuple:
+    """
+    Masthead entries are listed by name, then email, however and in
+    whatever order they got stored.
+    """
+    return (entry.get(NAME, ''), entry[EMAIL])
+
+
+def get_masthead_pipeline(mh_codes: list) -> list:
+    """
+    One aggregation that groups the masthead entries of everyone
+    holding a masthead role by that role.
+    """
+    mh_fields = [EMAIL] + get_mh_fields()
+    return [
+        {'$match': {ROLES: {'$in': mh_codes}}},
+        {'$project': {dbc.MONGO_ID: 0, ROLES: 1,
+                      **{field: 1 for field in mh_fields}}},
+        {'$unwind': f'${ROLES}'},
+        {'$match': {ROLES: {'$in': mh_codes}}},
+        {'$group': {
+            dbc.MONGO_ID: f'${ROLES}',
+            MH_PEOPLE: {'$push': {field: {'$ifNull': [f'${field}', '']}
+                                  for field in mh_fields}},
+        }},
+    ]
+
+
+def rebuild_masthead() -> dict:
+    """
+    Recompute the stored masthead from the people collection.
+    Use this to recover if it ever drifts:
+        python -m data.people rebuild_masthead
+    """
+    mh_codes = list(rls.get_masthead_roles())
+    entries = {code: [] for code in mh_codes}
+    pipeline = get_masthead_pipeline(mh_codes)
+    for group in dbc.aggregate(PEOPLE_COLLECT, pipeline):
+        entries[group[dbc.MONGO_ID]] = sorted(group[MH_PEOPLE],
+                                              key=mh_sort_key)
+    stored = {dbc.MONGO_ID: MASTHEAD_ID, MH_ROLES: entries}
+    dbc.replace(MASTHEAD_COLLECT, {dbc.MONGO_ID: MASTHEAD_ID}, stored)
+    return stored
+
+
+def mh_path(role: str) -> str:
+    return f'{MH_ROLES}.{role}'
+
+
+def mh_add(person: dict, role: str):
+    """
+    Set person's entry under role: any entry already there for their
+    email, however stale, is replaced so each person has just one.
+    """
+    mh_remove(person[EMAIL], [role])
+    dbc.add_to_set(MASTHEAD_COLLECT, {dbc.MONGO_ID: MASTHEAD_ID},
+                   {mh_path(role): create_mh_entry(person)})
+
+
+def mh_remove(email: str, roles: list):
+    dbc.pull(MASTHEAD_COLLECT, {dbc.MONGO_ID: MASTHEAD_ID},
+             {mh_path(role): {EMAIL: email} for role in roles})
+
+
+def mh_update(email: str, update_dict: dict):
+    dbc.update_array_elems(MASTHEAD_COLLECT, {dbc.MONGO_ID: MASTHEAD_ID},
+                           [mh_path(role) for role in rls.MH_ROLES],
+                           {EMAIL: email}, update_dict)
+
+
 def get_masthead() -> dict:
+    """
+    A single lookup of the stored masthead, built on first use.
+    """
+    stored = dbc.read_one(MASTHEAD_COLLECT, {dbc.MONGO_ID: MASTHEAD_ID})
+    if stored is None:
+        stored = rebuild_masthead()
     masthead = {}
-    mh_roles = rls.get_masthead_roles()
-    for mh_role, text in mh_roles.items():
-        people_w_role = []
-        people = read()
-        for _id, person in people.items():
-            if has_role(person, mh_role):
-                rec = create_mh_rec(person)
-                people_w_role.append(rec)
-            masthead[text] = people_w_role
+    for code, text in rls.get_masthead_roles().items():
+        entries = sorted(stored[MH_ROLES].get(code, []), key=mh_sort_key)
+        masthead[text] = [create_mh_rec(entry) for entry in entries]
     return masthead
 
 
 def add_role(email: str, role: str):
-    if not exists(email):
-        raise ValueError(f'Updating non-existent person: {email=}')
     if not rls.is_valid(role):
         raise ValueError(f'Invalid role: {role}')
-    person = read_one(email)
-    if has_role(person, role):
+    ret = dbc.add_to_set(PEOPLE_COLLECT, {EMAIL: email}, {ROLES: role})
+    if ret.matched_count == 0:
+        raise ValueError(f'Updating non-existent person: {email=}')
+    if ret.modified_count == 0:
         raise ValueError("Can't add a duplicate role")
-    updated_roles = person[ROLES] + [role]
-    dbc.update(PEOPLE_COLLECT, {EMAIL: email}, {ROLES: updated_roles})
+    if role in rls.MH_ROLES:
+        mh_add(read_one(email, fields=[EMAIL] + get_mh_fields()), role)
     return email
 
 
 def delete_role(email: str, role: str):
-    if not exists(email):
+    ret = dbc.pull(PEOPLE_COLLECT, {EMAIL: email}, {ROLES: role})
+    if ret.matched_count == 0:
         raise ValueError(f'Updating non-existent person: {email=}')
-    person = read_one(email)
-    if not has_role(person, role):
+    if ret.modified_count == 0:
         raise ValueError("Role not found")
-    updated_roles = [r for r in person[ROLES] if r != role]
-    dbc.update(PEOPLE_COLLECT, {EMAIL: email}, {ROLES: updated_roles})
+    if role in rls.MH_ROLES:
+        mh_remove(email, [role])
     return email
 
 
 def main():
+    if sys.argv[1:] == [REBUILD_MH_CMD]:
+        rebuild_masthead()
     print(get_masthead())
 
 
@@ -0,0 +1,233 @@
+"""
+Full-text search for our collections.
+Two interchangeable backends:
+    - MongoTextSearch ranks with a weighted Mongo text index.
+    - InvertedIndexSearch keeps an inverted index in this process,
+      for stores without text indexes.
+SEARCH_BACKEND (MONGO or MEMORY) picks the one get_backend() returns.
+Neither can search fields stored compressed: a text index can't see
+into them, so db_connect refuses to compress them.
+"""
+import math
+import os
+import re
+import threading
+import time
+
+import data.db_connect as dbc
+
+MONGO = 'MONGO'
+MEMORY = 'MEMORY'
+SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', MONGO)
+
+# result fields
+SCORE = dbc.TEXT_SCORE
+SNIPPET = 'snippet'
+
+SNIPPET_LEN = 200
+
+STOP_WORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in',
+    'is', 'it', 'of', 'on', 'or', 'that', 'the', 'to', 'was', 'with',
+}
+
+WORD = re.compile(r'\w+')
+
+
+def tokenize(text: str) -> list:
+    return [word for word in WORD.findall(text.lower())
+            if word not in STOP_WORDS]
+
+
+def make_snippet(texts: list, terms: list, length: int = SNIPPET_LEN) -> str:
+    """
+    A window of about `length` chars around the first query term found
+    in texts (checked in order), or the start of the first text.
+    """
+    texts = [text for text in texts if text]
+    if not texts:
+        return ''
+    for text in texts:
+        lowered = text.lower()
+        found = [pos for pos in (lowered.find(term) for term in terms)
+                 if pos >= 0]
+        if found:
+            start = max(0, min(found) - length // 4)
+            break
+    else:
+        text = texts[0]
+        start = 0
+    snippet = text[start:start + length].strip()
+    if start > 0:
+        snippet = '...' + snippet
+    if start + length < len(text):
+        snippet += '...'
+    return snippet
+
+
+class SearchBackend:
+    """
+    Searches the `weights` fields of the docs in collection, which are
+    identified by their `key` field. Higher weights count for more.
+    add() and remove() must be told about every write.
+    """
+    def __init__(self, collection: str, key: str, weights: dict):
+        self.collection = collection
+        self.key = key
+        self.weights = weights
+
+    def add(self, doc: dict):
+        """
+        Index a new or changed doc.
+        """
+        pass
+
+    def remove(self, key):
+        pass
+
+    def search(self, query: str, limit: int, fields: list) -> list:
+        """
+        Up to `limit` matching docs, best first, with their `fields`
+        (plus key) and their SCORE.
+        """
+        raise NotImplementedError()
+
+
+class MongoTextSearch(SearchBackend):
+    """
+    Mongo keeps its text index up to date itself.
+    """
+    def __init__(self, collection: str, key: str, weights: dict):
+        super().__init__(collection, key, weights)
+        dbc.add_index(collection, [(field, dbc.TEXT) for field in weights],
+                      weights=weights)
+
+    def search(self, query: str, limit: int, fields: list) -> list:
+        return dbc.text_search(self.collection, query, limit,
+                               fields=[self.key] + fields)
+
+
+class InvertedIndexSearch(SearchBackend):
+    """
+    Built from the collection on first search, then updated on writes.
+    Scores are weighted term frequencies times inverse doc frequency.
+    Writes made by other processes are only seen once the index is
+    rebuilt, which happens when it is `max_age` seconds old.
+    """
+    def __init__(self, collection: str, key: str, weights: dict,
+                 max_age: float = None, clock=time.monotonic):
+        super().__init__(collection, key, weights)
+        self.max_age = dbc.INDEX_MAX_AGE if max_age is None else max_age
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.build_lock = threading.Lock()
+        self.built_at = None
+        # writes seen while a rebuild reads the collection
+        self.pending = None
+        self.postings = {}  # term -> {key: weighted term frequency}
+        self.doc_terms = {}  # key -> the terms indexed for it
+
+    def build(self):
+        """
+        Read the collection into a new index and swap it in, so the
+        old one keeps serving meanwhile. Writes made during the read
+        are applied to the new one too.
+        """
+        fresh = InvertedIndexSearch(self.collection, self.key, self.weights)
+        with self.lock:
+            self.pending = []
+        started = self.clock()
+        for doc in dbc.read_iter(self.collection,
+                                 fields=[self.key] + list(self.weights)):
+            fresh._index(doc)
+        with self.lock:
+            for doc, key in self.pending:
+                fresh._unindex(key)
+                if doc is not None:
+                    fresh._index(doc)
+            self.pending = None
+            self.postings = fresh.postings
+            self.doc_terms = fresh.doc_terms
+            self.built_at = started
+
+    def refresh(self):
+        """
+        Build the index on first use, rebuild it once too old.
+        Only one thread rebuilds; the others use the old index.
+        """
+        built_at = self.built_at
+        if built_at is not None and self.clock() - built_at < self.max_age:
+            return
+        if not self.build_lock.acquire(blocking=built_at is None):
+            return
+        try:
+            if self.built_at == built_at:
+                self.build()
+        finally:
+            self.build_lock.release()
+
+    def _index(self, doc: dict):
+        key = doc[self.key]
+        freqs = {}
+        for field, weight in self.weights.items():
+            for term in tokenize(doc.get(field) or ''):
+                freqs[term] = freqs.get(term, 0) + weight
+        for term, freq in freqs.items():
+            self.postings.setdefault(term, {})[key] = freq
+        self.doc_terms[key] = freqs.keys()
+
+    def _unindex(self, key):
+        for term in self.doc_terms.pop(key, ()):
+            postings = self.postings[term]
+            del postings[key]
+            if not postings:
+                del self.postings[term]
+
+    def add(self, doc: dict):
+        with self.lock:
+            if self.pending is not None:
+                self.pending.append((doc, doc[self.key]))
+            if self.built_at is not None:
+                self._unindex(doc[self.key])
+                self._index(doc)
+
+    def remove(self, key):
+        with self.lock:
+            if self.pending is not None:
+                self.pending.append((None, key))
+            if self.built_at is not None:
+                self._unindex(key)
+
+    def search(self, query: str, limit: int, fields: list) -> list:
+        self.refresh()
+        with self.lock:
+            num_docs = len(self.doc_terms)
+            scores = {}
+            for term in set(tokenize(query)):
+                postings = self.postings.get(term, {})
+                if not postings:
+                    continue
+                idf = math.log(1 + num_docs / len(postings))
+                for key, freq in postings.items():
+                    scores[key] = scores.get(key, 0) + freq * idf
+        best = sorted(scores, key=lambda key: (-scores[key], key))[:limit]
+        docs = {doc[self.key]: doc
+                for doc in dbc.read_iter(self.collection,
+                                         {self.key: {'$in': best}},
+                                         fields=[self.key] + fields)}
+        return [{**docs[key], SCORE: scores[key]}
+                for key in best if key in docs]
+
+
+BACKENDS = {
+    MONGO: MongoTextSearch,
+    MEMORY: InvertedIndexSearch,
+}
+
+
+def get_backend(collection: str, key: str, weights: dict,
+                kind: str = None) -> SearchBackend:
+    kind = kind or SEARCH_BACKEND
+    if kind not in BACKENDS:
+        raise ValueError(f'Unknown search backend: {kind}')
+    return BACKENDS[kind](collection, key, weights)
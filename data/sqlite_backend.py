@@ -0,0 +1,468 @@
+"""
+A backend on an embedded SQLite file, for journals small enough for
+one box: local disk instead of a network round trip per call.
+Each collection is a table of JSON documents. Indexes are SQLite
+indexes on json_extract() of their fields. Conditions on top level
+fields are narrowed down in SQL (with those indexes), and so are sorts
+and, for unfiltered reads, limits; the rest of a filter, and every
+update and pipeline, is interpreted the way MemoryBackend does it.
+Each thread has its own connections: one for writes, one that find()
+streams docs through. The file is in WAL mode, so readers don't wait
+on the writer and see one snapshot each, and every write is one
+IMMEDIATE transaction, so a compare-and-set is atomic across processes
+too.
+Sort fields are ordered the way SQLite orders their JSON values, which
+is Mongo's order for values of one scalar type.
+SQLite can't tell which fields hold arrays, so a filter on a field
+only matches array elements if the field was indexed with
+multikey=True. Those filters read each doc's array in SQL; SQLite has
+no index for them.
+"""
+import base64
+import copy
+import json
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+
+import data.backend as bknd
+import data.memory_backend as mem
+
+DEF_PATH = 'journal.db'
+
+BUSY_TIMEOUT_MS = 5000
+
+# how bytes (e.g. compressed values) are stored in JSON
+BINARY = '$binary'
+
+# filter operators narrowed down in SQL
+SQL_OPS = {'$eq': '=', '$gt': '>', '$gte': '>=', '$lt': '<', '$lte': '<='}
+
+
+def to_json(doc: dict) -> str:
+    def default(value):
+        if isinstance(value, bytes):
+            return {BINARY: base64.b64encode(value).decode()}
+        raise TypeError(f'Can not store {type(value).__name__}: {value}')
+    return json.dumps(doc, default=default)
+
+
+def from_json(text: str) -> dict:
+    def object_hook(obj):
+        if len(obj) == 1 and BINARY in obj:
+            return base64.b64decode(obj[BINARY])
+        return obj
+    return json.loads(text, object_hook=object_hook)
+
+
+def quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def json_path(field: str) -> str:
+    """
+    The SQL literal of field's JSON path. Indexes only serve queries
+    whose expressions are the same text, so it is never a parameter.
+    """
+    path = '$' + ''.join('."' + part.replace('"', '\\"') + '"'
+                         for part in field.split('.'))
+    return "'" + path.replace("'", "''") + "'"
+
+
+def extract(field: str) -> str:
+    return f'json_extract(doc, {json_path(field)})'
+
+
+def json_type(field: str) -> str:
+    return f'json_type(doc, {json_path(field)})'
+
+
+def is_sql_value(value) -> bool:
+    return isinstance(value, (str, int, float)) and not isinstance(value,
+                                                                   bool)
+
+
+def field_clauses(field: str, cond, multikey: bool = False) -> list:
+    """
+    SQL (clause, args) pairs each doc matching cond on field satisfies.
+    Those on a plain field can use its index; those on a multikey
+    field look at each element of its arrays (or its one value).
+    """
+    if not mem.is_operator_dict(cond):
+        cond = {'$eq': cond}
+    value = 'value' if multikey else extract(field)
+    clauses = []
+    for op, target in cond.items():
+        if op in SQL_OPS and is_sql_value(target):
+            clauses.append((f'{value} {SQL_OPS[op]} ?', [target]))
+        elif (op == '$in' and target
+              and all(is_sql_value(elem) for elem in target)):
+            marks = ', '.join('?' * len(target))
+            clauses.append((f'{value} IN ({marks})', list(target)))
+    if multikey:
+        return [(f'EXISTS (SELECT 1 FROM json_each(doc, {json_path(field)})'
+                 f' WHERE {clause})', args) for clause, args in clauses]
+    return clauses
+
+
+def where(filt: dict, multikey=()) -> tuple:
+    """
+    A WHERE clause and its args selecting (at least) the docs matching
+    filt, whose `multikey` fields may hold arrays; matches() has the
+    last word.
+    """
+    clauses = []
+    args = []
+    for key, cond in (filt or {}).items():
+        if key == '$and':
+            for sub in cond:
+                sub_clause, sub_args = where(sub, multikey)
+                if sub_clause:
+                    clauses.append(sub_clause)
+                    args += sub_args
+        elif key == '$or':
+            subs = [where(sub, multikey) for sub in cond]
+            # a branch SQL can't narrow lets everything through
+            if subs and all(sub_clause for sub_clause, _ in subs):
+                clauses.append('(' + ' OR '.join(f'({sub_clause})'
+                                                 for sub_clause, _ in subs)
+                               + ')')
+                for _, sub_args in subs:
+                    args += sub_args
+        elif not key.startswith('$') and key != bknd.ID and '.' not in key:
+            # (a dotted path may run through arrays SQL can't see into)
+            for clause, clause_args in field_clauses(key, cond,
+                                                     key in multikey):
+                clauses.append(clause)
+                args += clause_args
+        elif key == bknd.ID and not isinstance(cond, dict):
+            clauses.append('id = ?')
+            args.append(json.dumps(cond))
+    return ' AND '.join(clauses), args
+
+
+class SqliteBackend(bknd.Backend):
+    def __init__(self, path: str = DEF_PATH):
+        self.path = path
+        self.local = threading.local()
+        self.connections = []  # every thread's, for close()
+        self.lock = threading.Lock()
+        self.tables = set()
+        self.text_weights = {}  # table -> weights of its TEXT index
+        self.multikey = {}  # table -> {field indexed as multikey, ...}
+
+    def connect(self, name: str) -> sqlite3.Connection:
+        conn = getattr(self.local, name, None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            setattr(self.local, name, conn)
+            with self.lock:
+                self.connections.append(conn)
+        return conn
+
+    def conn(self) -> sqlite3.Connection:
+        return self.connect('conn')
+
+    def reader(self) -> sqlite3.Connection:
+        """
+        The connection find() reads through, so writes made while its
+        docs are still being read neither wait on it nor show up in it.
+        """
+        return self.connect('reader')
+
+    def table(self, db, collection) -> str:
+        name = quote(f'{db}.{collection}')
+        if name not in self.tables:
+            self.conn().execute(f'CREATE TABLE IF NOT EXISTS {name} '
+                                '(id TEXT PRIMARY KEY, doc TEXT NOT NULL)')
+            self.tables.add(name)
+        return name
+
+    @contextmanager
+    def transaction(self):
+        conn = self.conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def after_fork(self):
+        # the parent's connections are not ours to use or close
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def close(self):
+        with self.lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections = []
+        self.local = threading.local()
+
+    def create_index(self, db, collection, keys, **options):
+        table = self.table(db, collection)
+        if isinstance(keys, str):
+            keys = [(keys, bknd.ASCENDING)]
+        fields = [field for field, _ in keys]
+        if any(direction == bknd.TEXT for _, direction in keys):
+            weights = options.get('weights') or {}
+            self.text_weights[table] = {field: weights.get(field, 1)
+                                        for field in fields}
+            return fields
+        if options.get('multikey'):
+            self.multikey.setdefault(table, set()).add(fields[0])
+        name = f'{db}.{collection}:{",".join(fields)}'
+        unique = 'UNIQUE ' if options.get('unique') else ''
+        exprs = ', '.join(extract(field) for field in fields)
+        try:
+            self.conn().execute(f'CREATE {unique}INDEX IF NOT EXISTS '
+                                f'{quote(name)} ON {table} ({exprs})')
+        except sqlite3.IntegrityError as err:
+            raise bknd.DuplicateKeyError(str(err))
+        return fields
+
+    def where(self, table: str, filt: dict) -> tuple:
+        return where(filt, self.multikey.get(table, ()))
+
+    def select(self, conn, table: str, filt: dict, limit: int = 0) -> list:
+        """
+        (rowid, doc) of the docs matching filt, in insertion order:
+        the first `limit` of them, or all if 0.
+        """
+        clause, args = self.where(table, filt)
+        sql = f'SELECT rowid, doc FROM {table}'
+        if clause:
+            sql += f' WHERE {clause}'
+        cursor = conn.execute(sql + ' ORDER BY rowid', args)
+        rows = []
+        try:
+            for rowid, text in cursor:
+                doc = from_json(text)
+                if mem.matches(doc, filt):
+                    rows.append((rowid, doc))
+                    if len(rows) == limit:
+                        break
+        finally:
+            cursor.close()
+        return rows
+
+    def stream(self, table: str, filt: dict, sort: list = None,
+               limit: int = 0, skip: int = 0):
+        """
+        Yield the docs matching filt ordered on sort (then insertion),
+        parsing each only when it is reached. SQL does the skip and
+        limit too when it does the whole filter.
+        """
+        clause, args = self.where(table, filt)
+        sql = f'SELECT doc FROM {table}'
+        if clause:
+            sql += f' WHERE {clause}'
+        sql += ' ORDER BY ' + ', '.join(
+            [extract(field) for field in sort or []] + ['rowid'])
+        if not filt and (limit or skip):
+            sql += ' LIMIT ? OFFSET ?'
+            args = args + [limit or -1, skip]
+            skip = 0
+        cursor = self.reader().execute(sql, args)
+        found = 0
+        try:
+            for text, in cursor:
+                doc = from_json(text)
+                if not mem.matches(doc, filt):
+                    continue
+                if skip:
+                    skip -= 1
+                    continue
+                yield doc
+                found += 1
+                if found == limit:
+                    return
+        finally:
+            cursor.close()
+
+    def insert(self, conn, table: str, doc: dict):
+        if bknd.ID not in doc:
+            doc[bknd.ID] = uuid.uuid4().hex
+        try:
+            conn.execute(f'INSERT INTO {table} (id, doc) VALUES (?, ?)',
+                         [json.dumps(doc[bknd.ID]), to_json(doc)])
+        except sqlite3.IntegrityError as err:
+            raise bknd.DuplicateKeyError(str(err))
+
+    def write(self, conn, table: str, rowid: int, doc: dict):
+        try:
+            conn.execute(f'UPDATE {table} SET doc = ? WHERE rowid = ?',
+                         [to_json(doc), rowid])
+        except sqlite3.IntegrityError as err:
+            raise bknd.DuplicateKeyError(str(err))
+
+    def insert_one(self, db, collection, doc: dict) -> bknd.InsertResult:
+        table = self.table(db, collection)
+        with self.transaction() as conn:
+            self.insert(conn, table, doc)
+        return bknd.InsertResult(doc[bknd.ID])
+
+    def insert_many(self, db, collection, docs: list):
+        table = self.table(db, collection)
+        duplicate = None
+        with self.transaction() as conn:
+            for doc in docs:
+                try:
+                    self.insert(conn, table, doc)
+                except bknd.DuplicateKeyError as err:
+                    duplicate = err
+        if duplicate is not None:
+            raise duplicate
+
+    def find_one(self, db, collection, filt: dict, fields: list = None,
+                 no_id: bool = False) -> dict:
+        return next(self.find(db, collection, filt, fields=fields,
+                              no_id=no_id, limit=1), None)
+
+    def find(self, db, collection, filt: dict, fields: list = None,
+             no_id: bool = True, sort: list = None, limit: int = 0,
+             skip: int = 0, batch_size: int = 0):
+        table = self.table(db, collection)
+        return (mem.project(doc, fields, no_id)
+                for doc in self.stream(table, filt, sort=sort, limit=limit,
+                                       skip=skip))
+
+    def delete_rows(self, db, collection, filt: dict, limit: int) -> int:
+        table = self.table(db, collection)
+        with self.transaction() as conn:
+            rows = self.select(conn, table, filt, limit=limit)
+            conn.executemany(f'DELETE FROM {table} WHERE rowid = ?',
+                             [[rowid] for rowid, _ in rows])
+        return len(rows)
+
+    def delete_one(self, db, collection, filt: dict) -> int:
+        return self.delete_rows(db, collection, filt, 1)
+
+    def delete_many(self, db, collection, filt: dict) -> int:
+        return self.delete_rows(db, collection, filt, 0)
+
+    def update_rows(self, conn, table: str, rows: list, update: dict,
+                    array_filters: list = None) -> bknd.UpdateResult:
+        modified = 0
+        for rowid, doc in rows:
+            updated = mem.apply_update(doc, update, array_filters)
+            if updated != doc:
+                self.write(conn, table, rowid, updated)
+                modified += 1
+        return bknd.UpdateResult(len(rows), modified)
+
+    def update_one(self, db, collection, filt: dict, update: dict,
+                   array_filters: list = None) -> bknd.UpdateResult:
+        table = self.table(db, collection)
+        with self.transaction() as conn:
+            return self.update_rows(conn, table,
+                                    self.select(conn, table, filt, limit=1),
+                                    update, array_filters)
+
+    def update_many(self, db, collection, filt: dict,
+                    update: dict) -> bknd.UpdateResult:
+        table = self.table(db, collection)
+        with self.transaction() as conn:
+            return self.update_rows(conn, table,
+                                    self.select(conn, table, filt), update)
+
+    def find_one_and_update(self, db, collection, filt: dict,
+                            update: dict) -> dict:
+        table = self.table(db, collection)
+        with self.transaction() as conn:
+            rows = self.select(conn, table, filt, limit=1)
+            if not rows:
+                return None
+            rowid, doc = rows[0]
+            updated = mem.apply_update(doc, update)
+            if updated != doc:
+                self.write(conn, table, rowid, updated)
+        return updated
+
+    def bulk_update(self, db, collection, updates: list) -> int:
+        table = self.table(db, collection)
+        matched = 0
+        with self.transaction() as conn:
+            for filt, update in updates:
+                rows = self.select(conn, table, filt, limit=1)
+                matched += self.update_rows(conn, table, rows,
+                                            update).matched_count
+        return matched
+
+    def replace_one(self, db, collection, filt: dict, doc: dict,
+                    upsert: bool = False) -> bknd.UpdateResult:
+        table = self.table(db, collection)
+        new = copy.deepcopy(doc)
+        with self.transaction() as conn:
+            rows = self.select(conn, table, filt, limit=1)
+            if rows:
+                rowid, old = rows[0]
+                new[bknd.ID] = old[bknd.ID]
+                if new == old:
+                    return bknd.UpdateResult(1, 0)
+                self.write(conn, table, rowid, new)
+                return bknd.UpdateResult(1, 1)
+            if upsert:
+                if bknd.ID not in new and bknd.ID in filt \
+                        and not isinstance(filt[bknd.ID], dict):
+                    new[bknd.ID] = filt[bknd.ID]
+                self.insert(conn, table, new)
+        return bknd.UpdateResult(0, 0)
+
+    def aggregate(self, db, collection, pipeline: list):
+        filt = {}
+        if pipeline and '$match' in pipeline[0]:
+            filt = pipeline[0]['$match']
+        docs = list(self.stream(self.table(db, collection), filt))
+        return mem.run_pipeline(docs, pipeline)
+
+    def text_search(self, db, collection, query: str, limit: int,
+                    fields: list = None) -> list:
+        """
+        Only the weighted fields are read to score docs, and of those
+        that have a word of query (as far as SQL can tell) at that; the
+        best `limit` are then read whole.
+        """
+        table = self.table(db, collection)
+        if table not in self.text_weights:
+            raise ValueError(f'No text index on {collection}')
+        weights = self.text_weights[table]
+        terms = sorted(set(mem.tokenize(query)))
+        if not terms:
+            return []
+        columns = ', '.join(f"CASE {json_type(field)} WHEN 'text' "
+                            f'THEN {extract(field)} END'
+                            for field in weights)
+        sql = f'SELECT rowid, {columns} FROM {table}'
+        args = []
+        # SQLite's lower() only folds ASCII letters
+        if all(term.isascii() for term in terms):
+            sql += ' WHERE ' + ' OR '.join(
+                f'instr(lower({extract(field)}), ?) > 0'
+                for field in weights for _ in terms)
+            args = [term for _ in weights for term in terms]
+        texts = []
+        for rowid, *values in self.reader().execute(sql + ' ORDER BY rowid',
+                                                    args):
+            text = {bknd.ID: rowid}
+            for field, value in zip(weights, values):
+                if value is not None:
+                    mem.set_path(text, field, value)
+            texts.append(text)
+        scored = mem.text_scores(texts, weights, query)[:limit]
+        rowids = [text[bknd.ID] for _, text in scored]
+        marks = ', '.join('?' * len(rowids))
+        docs = {rowid: from_json(doc) for rowid, doc in self.reader().execute(
+            f'SELECT rowid, doc FROM {table} WHERE rowid IN ({marks})',
+            rowids)}
+        return [{**mem.project(docs[text[bknd.ID]], fields, no_id=True),
+                 bknd.TEXT_SCORE: score}
+                for score, text in scored if text[bknd.ID] in docs]
@@ -0,0 +1,255 @@
+"""
+Typo tolerant autocomplete over short text fields such as names.
+A TrigramIndex keeps, in this process, the three letter pieces of every
+word in the fields it covers, and ranks docs by how many of the query's
+pieces they share, so "Smitth" or a half typed "Smi" still find "Smith".
+"""
+import bisect
+import heapq
+import math
+import re
+import threading
+import time
+from collections import Counter
+
+import data.db_connect as dbc
+
+# result fields
+SCORE = 'score'
+
+SUGGEST_LIMIT = 10
+MAX_SUGGEST_LIMIT = 50
+MIN_QUERY_LEN = 2
+# the share of the query's trigrams a doc must have to be suggested
+MIN_SIMILARITY = 0.5
+
+WORD = re.compile(r'\w+')
+
+NO_KEYS = frozenset()
+
+# matches in at least 1 in DENSE docs are found by walking the ranking
+DENSE = 100
+
+
+def word_trigrams(word: str, partial: bool = False) -> set:
+    """
+    Words are padded so short words and word starts count too.
+    A partial word (still being typed) gets no end padding.
+    """
+    padded = f'  {word}' if partial else f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def trigrams(text: str, partial: bool = False) -> set:
+    """
+    The trigrams of every word in text. With `partial`, the last word
+    is treated as a prefix.
+    """
+    words = WORD.findall(text.lower())
+    grams = set()
+    for i, word in enumerate(words):
+        grams |= word_trigrams(word, partial and i == len(words) - 1)
+    return grams
+
+
+class TrigramIndex:
+    """
+    Indexes the `fields` of the docs in collection, which are identified
+    by their `key` field, and suggests their `payload` fields.
+    Built from the collection on first use, then updated on writes;
+    add() and remove() must be told about every write.
+    Writes made by other processes are only seen once the index is
+    rebuilt, which happens when it is `max_age` seconds old.
+    """
+    def __init__(self, collection: str, key: str, fields: list,
+                 payload: list, max_age: float = None,
+                 clock=time.monotonic):
+        self.collection = collection
+        self.key = key
+        self.fields = fields
+        self.payload = payload
+        self.max_age = dbc.INDEX_MAX_AGE if max_age is None else max_age
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.build_lock = threading.Lock()
+        self.built_at = None
+        # writes seen while a rebuild reads the collection
+        self.pending = None
+        # A doc's rank, (its number of trigrams, key), breaks ties.
+        # Postings hold ranks so they can be compared without lookups.
+        self.postings = {}  # trigram -> set of ranks
+        self.doc_grams = {}  # key -> the trigrams indexed for it
+        self.rank = {}  # key -> rank
+        self.ranked = []  # every rank, in order
+        self.docs = {}  # key -> payload
+
+    def build(self):
+        """
+        Read the collection into a new index and swap it in, so the
+        old one keeps serving meanwhile. Writes made during the read
+        are applied to the new one too.
+        """
+        fresh = TrigramIndex(self.collection, self.key, self.fields,
+                             self.payload)
+        with self.lock:
+            self.pending = []
+        started = self.clock()
+        read_fields = list(dict.fromkeys(
+            [self.key] + self.fields + self.payload))
+        for doc in dbc.read_iter(self.collection, fields=read_fields):
+            fresh._index(doc)
+        fresh.ranked = sorted(fresh.rank.values())
+        with self.lock:
+            for doc, key in self.pending:
+                if doc is None:
+                    fresh._unindex(key)
+                else:
+                    fresh._add(doc)
+            self.pending = None
+            self.postings = fresh.postings
+            self.doc_grams = fresh.doc_grams
+            self.rank = fresh.rank
+            self.ranked = fresh.ranked
+            self.docs = fresh.docs
+            self.built_at = started
+
+    def refresh(self):
+        """
+        Build the index on first use, rebuild it once too old.
+        Only one thread rebuilds; the others use the old index.
+        """
+        built_at = self.built_at
+        if built_at is not None and self.clock() - built_at < self.max_age:
+            return
+        if not self.build_lock.acquire(blocking=built_at is None):
+            return
+        try:
+            if self.built_at == built_at:
+                self.build()
+        finally:
+            self.build_lock.release()
+
+    def _index(self, doc: dict):
+        key = doc[self.key]
+        grams = set()
+        for field in self.fields:
+            grams |= trigrams(doc.get(field) or '')
+        rank = (len(grams), key)
+        for gram in grams:
+            self.postings.setdefault(gram, set()).add(rank)
+        self.doc_grams[key] = grams
+        self.rank[key] = rank
+        self.docs[key] = {field: doc.get(field) for field in self.payload}
+
+    def _unindex(self, key):
+        self.docs.pop(key, None)
+        rank = self.rank.pop(key, None)
+        if rank is None:
+            return
+        del self.ranked[bisect.bisect_left(self.ranked, rank)]
+        for gram in self.doc_grams.pop(key):
+            postings = self.postings[gram]
+            postings.discard(rank)
+            if not postings:
+                del self.postings[gram]
+
+    def _add(self, doc: dict):
+        self._unindex(doc[self.key])
+        self._index(doc)
+        bisect.insort(self.ranked, self.rank[doc[self.key]])
+
+    def add(self, doc: dict):
+        with self.lock:
+            if self.pending is not None:
+                self.pending.append((doc, doc[self.key]))
+            if self.built_at is not None:
+                self._add(doc)
+
+    def remove(self, key):
+        with self.lock:
+            if self.pending is not None:
+                self.pending.append((None, key))
+            if self.built_at is not None:
+                self._unindex(key)
+
+    def suggest(self, query: str, limit: int) -> list:
+        """
+        Up to `limit` payloads, closest first, each with its SCORE:
+        the share of the query's trigrams it has.
+        Ties go to the doc with less other text.
+        """
+        self.refresh()
+        grams = trigrams(query, partial=True)
+        if not grams:
+            return []
+        with self.lock:
+            # rarest first, so the set operations below stay small
+            postings = sorted((self.postings.get(gram, NO_KEYS)
+                               for gram in grams), key=len)
+            # docs with every trigram need no counting
+            best = self._walk(postings, limit)
+            if best is not None:
+                counts = dict.fromkeys(best, len(grams))
+            else:
+                counts = self._count(postings, math.ceil(
+                    MIN_SIMILARITY * len(grams)))
+                best = heapq.nsmallest(
+                    limit, counts,
+                    key=lambda rank: (-counts[rank], rank))
+            return [{**self.docs[rank[1]], SCORE: counts[rank] / len(grams)}
+                    for rank in best]
+
+    def _walk(self, postings: list, limit: int) -> list:
+        """
+        The best ranked `limit` docs in all of postings, or None if
+        there are fewer. When such docs are common, walking the docs
+        in rank order finds them sooner than intersecting postings.
+        """
+        if len(postings[0]) * DENSE >= len(self.ranked):
+            best = []
+            for rank in self.ranked[:limit * DENSE]:
+                if all(rank in ranks for ranks in postings):
+                    best.append(rank)
+                    if len(best) == limit:
+                        return best
+        full = postings[0].intersection(*postings[1:])
+        if len(full) < limit:
+            return None
+        return heapq.nsmallest(limit, full)
+
+    def _count(self, postings: list, min_count: int) -> dict:
+        """
+        How many of postings each doc in at least min_count of them
+        is in. Such a doc must be in one of the rarest
+        len(postings) - min_count + 1, so only those are scanned.
+        """
+        counts = Counter()
+        for ranks in postings[:len(postings) - min_count + 1]:
+            counts.update(ranks)
+        for ranks in postings[len(postings) - min_count + 1:]:
+            for rank in counts:
+                if rank in ranks:
+                    counts[rank] += 1
+        return {rank: count for rank, count in counts.items()
+                if count >= min_count}
+
+
+def check_query(query: str, limit: int):
+    if len(query.strip()) < MIN_QUERY_LEN:
+        raise ValueError(f'Type at least {MIN_QUERY_LEN} characters')
+    if not 0 < limit <= MAX_SUGGEST_LIMIT:
+        raise ValueError(f'limit must be 1 to {MAX_SUGGEST_LIMIT}')
+
+
+def merge(suggestions: list, key: str, limit: int) -> list:
+    """
+    Combine suggestions from several indexes, best first, keeping the
+    first of any with the same `key` value at the same score.
+    """
+    merged = {}
+    for sugg in suggestions:
+        seen = merged.get(sugg[key])
+        if seen is None or sugg[SCORE] > seen[SCORE]:
+            merged[sugg[key]] = sugg
+    return sorted(merged.values(),
+                  key=lambda sugg: -sugg[SCORE])[:limit]
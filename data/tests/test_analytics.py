@@ -0,0 +1,98 @@
+import pytest
+
+import data.analytics as anl
+import data.manuscript as ms
+
+DAY = anl.SECS_PER_DAY
+
+EDITOR = 'editor@nyu.edu'
+OTHER_EDITOR = 'other@nyu.edu'
+
+# (title, day, state), ordered by title then time
+EVENTS = [
+    ('A', 0, ms.SUBMITTED),
+    ('A', 2, ms.IN_REF_REV),
+    ('A', 5, ms.IN_REF_REV),  # another review: still one stay
+    ('A', 10, ms.COPY_EDIT),
+    ('A', 11, ms.AUTHOR_REV),
+    ('A', 12, ms.FORMATTING),
+    ('A', 13, ms.PUBLISHED),
+    ('B', 1, ms.SUBMITTED),
+    ('B', 5, ms.IN_REF_REV),
+    ('B', 9, ms.REJECTED),
+    ('C', 3, ms.SUBMITTED),
+]
+
+TEMP_TITLE = 'Analytics Temp Title'
+TEMP_EDITOR_EMAIL = 'analyticsEditor@gmail.com'
+
+EDITORS = {'A': EDITOR, 'B': EDITOR, 'C': OTHER_EDITOR}
+
+
+@pytest.fixture
+def stats():
+    titles, days, states = zip(*EVENTS)
+    return anl.compute_stats(list(titles), [day * DAY for day in days],
+                             list(states), EDITORS)
+
+
+def test_time_in_state(stats):
+    in_review = stats[anl.TIME_IN_STATE][ms.IN_REF_REV]
+    assert in_review[anl.SPELLS] == 2
+    assert in_review[anl.CURRENT] == 0
+    assert in_review[anl.MEDIAN_DAYS] == pytest.approx(6)
+    submitted = stats[anl.TIME_IN_STATE][ms.SUBMITTED]
+    assert submitted[anl.SPELLS] == 2
+    assert submitted[anl.CURRENT] == 1
+    assert submitted[anl.MEDIAN_DAYS] == pytest.approx(3)
+    assert submitted[anl.P90_DAYS] == pytest.approx(3.8)
+
+
+def test_time_in_state_never_left(stats):
+    published = stats[anl.TIME_IN_STATE][ms.PUBLISHED]
+    assert published[anl.SPELLS] == 0
+    assert published[anl.CURRENT] == 1
+    assert published[anl.MEDIAN_DAYS] is None
+
+
+def test_funnel(stats):
+    funnel = stats[anl.FUNNEL]
+    assert list(funnel) == anl.FUNNEL_STATES
+    assert funnel[ms.SUBMITTED] == 3
+    assert funnel[ms.IN_REF_REV] == 2
+    assert funnel[ms.PUBLISHED] == 1
+    assert funnel[ms.REJECTED] == 1
+    assert funnel[ms.WITHDRAWN] == 0
+
+
+def test_editor_throughput(stats):
+    editor = stats[anl.EDITORS][EDITOR]
+    assert editor[anl.SUBMITTED] == 2
+    assert editor[anl.PUBLISHED] == 1
+    assert editor[anl.REJECTED] == 1
+    assert editor[anl.MEDIAN_TURNAROUND_DAYS] == pytest.approx(10.5)
+    other = stats[anl.EDITORS][OTHER_EDITOR]
+    assert other[anl.SUBMITTED] == 1
+    assert other[anl.MEDIAN_TURNAROUND_DAYS] is None
+
+
+def test_no_events():
+    stats = anl.compute_stats([], [], [], {})
+    assert stats[anl.FUNNEL][ms.SUBMITTED] == 0
+    assert stats[anl.TIME_IN_STATE][ms.SUBMITTED][anl.SPELLS] == 0
+    assert stats[anl.EDITORS] == {}
+
+
+@pytest.fixture(scope='function')
+def temp_manu():
+    title = ms.create(TEMP_TITLE, 'Temp Author', 'tempAuthor@gmail.com',
+                      'Temp Text', 'Temp Abstract', TEMP_EDITOR_EMAIL)
+    yield title
+    ms.delete(title)
+
+
+def test_get_stats(temp_manu):
+    stats = anl.get_stats()
+    assert stats[anl.FUNNEL][ms.SUBMITTED] >= 1
+    assert stats[anl.EDITORS][TEMP_EDITOR_EMAIL][anl.SUBMITTED] == 1
+    assert stats[anl.TIME_IN_STATE][ms.SUBMITTED][anl.CURRENT] >= 1
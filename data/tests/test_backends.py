@@ -0,0 +1,253 @@
+"""
+What every storage backend must do alike, run against each one that
+needs no server. MongoBackend is checked in test_mongo_backend.
+"""
+import pytest
+
+import data.backend as bknd
+import data.memory_backend as mem
+import data.sqlite_backend as sqlb
+
+DB = 'testDB'
+COLLECT = 'things'
+
+DOCS = [
+    {'name': 'a', 'n': 1, 'tags': ['x', 'y'], 'sub': {'k': 1}},
+    {'name': 'b', 'n': 2, 'tags': ['y']},
+    {'name': 'c', 'n': 3, 'tags': [], 'extra': None},
+]
+
+
+@pytest.fixture(scope='function', params=['memory', 'sqlite'])
+def empty(request, tmp_path):
+    if request.param == 'memory':
+        yield mem.MemoryBackend()
+        return
+    backend = sqlb.SqliteBackend(str(tmp_path / 'test.db'))
+    yield backend
+    backend.close()
+
+
+@pytest.fixture(scope='function')
+def backend(empty):
+    empty.create_index(DB, COLLECT, 'name', unique=True)
+    empty.create_index(DB, COLLECT, 'tags', multikey=True)
+    empty.insert_many(DB, COLLECT, [dict(doc) for doc in DOCS])
+    return empty
+
+
+def names(docs) -> list:
+    return [doc['name'] for doc in docs]
+
+
+def find_names(backend, filt, **kwargs) -> list:
+    return names(backend.find(DB, COLLECT, filt, **kwargs))
+
+
+@pytest.mark.parametrize('filt, expected', [
+    ({}, ['a', 'b', 'c']),
+    ({'name': 'b'}, ['b']),
+    ({'tags': 'y'}, ['a', 'b']),
+    ({'tags': ['y']}, ['b']),
+    ({'tags': []}, ['c']),
+    ({'sub.k': 1}, ['a']),
+    ({'n': {'$gt': 1}}, ['b', 'c']),
+    ({'n': {'$gte': 2, '$lt': 3}}, ['b']),
+    ({'n': {'$gt': 'text'}}, []),
+    ({'name': {'$in': ['a', 'c', 'z']}}, ['a', 'c']),
+    ({'name': {'$nin': ['a']}}, ['b', 'c']),
+    ({'name': {'$ne': 'a'}}, ['b', 'c']),
+    ({'extra': None}, ['a', 'b', 'c']),
+    ({'extra': {'$exists': True}}, ['c']),
+    ({'sub': {'$exists': False}}, ['b', 'c']),
+    ({'$or': [{'n': 1}, {'name': 'c'}]}, ['a', 'c']),
+    ({'$and': [{'tags': 'y'}, {'n': {'$gt': 1}}]}, ['b']),
+])
+def test_find(backend, filt, expected):
+    assert find_names(backend, filt) == expected
+
+
+def test_find_bad_operator(backend):
+    with pytest.raises(ValueError):
+        list(backend.find(DB, COLLECT, {'name': {'$regex': 'a'}}))
+
+
+def test_find_sort_skip_limit(backend):
+    backend.insert_one(DB, COLLECT, {'name': 'd', 'n': 0})
+    assert find_names(backend, {}, sort=['n']) == ['d', 'a', 'b', 'c']
+    assert find_names(backend, {}, sort=['n'], skip=1, limit=2) == ['a', 'b']
+
+
+def test_find_fields(backend):
+    doc = next(iter(backend.find(DB, COLLECT, {'name': 'a'}, fields=['n'])))
+    assert doc == {'n': 1}
+    doc = backend.find_one(DB, COLLECT, {'name': 'a'}, fields=['n'])
+    assert set(doc) == {bknd.ID, 'n'}
+
+
+def test_docs_are_copies(backend):
+    doc = {'name': 'd', 'tags': []}
+    backend.insert_one(DB, COLLECT, doc)
+    doc['tags'].append('changed')
+    found = backend.find_one(DB, COLLECT, {'name': 'd'})
+    assert found[bknd.ID] == doc[bknd.ID]
+    found['tags'].append('changed')
+    assert backend.find_one(DB, COLLECT, {'name': 'd'})['tags'] == []
+
+
+def test_unique_index(backend):
+    with pytest.raises(bknd.DuplicateKeyError):
+        backend.insert_one(DB, COLLECT, {'name': 'a'})
+    with pytest.raises(bknd.DuplicateKeyError):
+        backend.update_one(DB, COLLECT, {'name': 'b'},
+                           {'$set': {'name': 'a'}})
+    assert find_names(backend, {'name': 'b'}) == ['b']
+
+
+def test_unique_index_on_existing_dups(empty):
+    empty.insert_many(DB, COLLECT, [{'k': 1}, {'k': 1}])
+    with pytest.raises(bknd.DuplicateKeyError):
+        empty.create_index(DB, COLLECT, 'k', unique=True)
+
+
+def test_insert_many_keeps_going(backend):
+    with pytest.raises(bknd.DuplicateKeyError):
+        backend.insert_many(DB, COLLECT, [{'name': 'a'}, {'name': 'd'}])
+    assert find_names(backend, {'name': 'd'}) == ['d']
+
+
+def test_index_follows_updates(backend):
+    backend.update_one(DB, COLLECT, {'name': 'a'},
+                       {'$set': {'name': 'z'}})
+    assert find_names(backend, {'name': 'a'}) == []
+    assert find_names(backend, {'name': 'z'}) == ['z']
+    assert backend.delete_one(DB, COLLECT, {'name': 'z'}) == 1
+    assert find_names(backend, {'name': 'z'}) == []
+
+
+def test_update_ops(backend):
+    ret = backend.update_one(DB, COLLECT, {'name': 'a'}, {
+        '$set': {'sub.k': 2, 'new': 'v'},
+        '$unset': {'n': ''},
+        '$push': {'tags': 'z'},
+        '$inc': {'count': 2},
+    })
+    assert ret == bknd.UpdateResult(1, 1)
+    doc = backend.find_one(DB, COLLECT, {'name': 'a'}, no_id=True)
+    assert doc == {'name': 'a', 'tags': ['x', 'y', 'z'], 'sub': {'k': 2},
+                   'new': 'v', 'count': 2}
+
+
+def test_add_to_set_and_pull(backend):
+    ret = backend.update_one(DB, COLLECT, {'name': 'b'},
+                             {'$addToSet': {'tags': 'y'}})
+    assert ret == bknd.UpdateResult(1, 0)
+    backend.update_one(DB, COLLECT, {'name': 'b'},
+                       {'$addToSet': {'tags': 'x'}})
+    backend.update_one(DB, COLLECT, {'name': 'b'}, {'$pull': {'tags': 'y'}})
+    assert backend.find_one(DB, COLLECT, {'name': 'b'})['tags'] == ['x']
+
+
+def test_update_no_match(backend):
+    ret = backend.update_one(DB, COLLECT, {'name': 'z'},
+                             {'$set': {'n': 1}})
+    assert ret == bknd.UpdateResult(0, 0)
+
+
+def test_update_bad_operator(backend):
+    with pytest.raises(ValueError):
+        backend.update_one(DB, COLLECT, {'name': 'a'}, {'$rename': {}})
+
+
+def test_update_many(backend):
+    ret = backend.update_many(DB, COLLECT, {'tags': 'y'},
+                              {'$set': {'seen': True}})
+    assert ret.matched_count == 2
+    assert find_names(backend, {'seen': True}) == ['a', 'b']
+
+
+def test_array_filters(empty):
+    empty.insert_one(DB, COLLECT, {'people': [{'email': 'a', 'name': 1},
+                                              {'email': 'b', 'name': 2}]})
+    empty.update_one(DB, COLLECT, {}, {'$set': {'people.$[elem].name': 3}},
+                     array_filters=[{'elem.email': 'b'}])
+    people = empty.find_one(DB, COLLECT, {})['people']
+    assert [person['name'] for person in people] == [1, 3]
+
+
+def test_find_one_and_update(backend):
+    doc = backend.find_one_and_update(DB, COLLECT, {'name': 'a', 'n': 1},
+                                      {'$set': {'n': 5}})
+    assert doc['n'] == 5
+    # compare-and-set: the old value no longer matches
+    assert backend.find_one_and_update(DB, COLLECT, {'name': 'a', 'n': 1},
+                                       {'$set': {'n': 6}}) is None
+
+
+def test_bulk_update(backend):
+    matched = backend.bulk_update(DB, COLLECT, [
+        ({'name': 'a'}, {'$set': {'n': 10}}),
+        ({'name': 'z'}, {'$set': {'n': 10}}),
+    ])
+    assert matched == 1
+
+
+def test_replace_one_upsert(empty):
+    empty.replace_one(DB, COLLECT, {bknd.ID: 'one'}, {'v': 1},
+                      upsert=True)
+    empty.replace_one(DB, COLLECT, {bknd.ID: 'one'}, {'v': 2},
+                      upsert=True)
+    assert list(empty.find(DB, COLLECT, {}, no_id=False)) == [
+        {bknd.ID: 'one', 'v': 2}]
+
+
+def test_delete_many(backend):
+    assert backend.delete_many(DB, COLLECT, {'tags': 'y'}) == 2
+    assert find_names(backend, {}) == ['c']
+
+
+def test_aggregate(backend):
+    groups = backend.aggregate(DB, COLLECT, [
+        {'$match': {'tags': {'$in': ['x', 'y']}}},
+        {'$project': {bknd.ID: 0, 'name': 1, 'tags': 1}},
+        {'$unwind': '$tags'},
+        {'$group': {bknd.ID: '$tags',
+                    'names': {'$push': {'name': '$name',
+                                        'n': {'$ifNull': ['$n', 0]}}},
+                    'count': {'$sum': 1}}},
+        {'$sort': {bknd.ID: 1}},
+    ])
+    assert groups == [
+        {bknd.ID: 'x', 'names': [{'name': 'a', 'n': 0}], 'count': 1},
+        {bknd.ID: 'y', 'names': [{'name': 'a', 'n': 0},
+                                 {'name': 'b', 'n': 0}], 'count': 2},
+    ]
+
+
+def test_aggregate_bad_stage(backend):
+    with pytest.raises(ValueError):
+        backend.aggregate(DB, COLLECT, [{'$lookup': {}}])
+
+
+def test_text_search(empty):
+    empty.create_index(DB, COLLECT, [('title', bknd.TEXT),
+                                     ('body', bknd.TEXT)],
+                       weights={'title': 10, 'body': 1})
+    empty.insert_many(DB, COLLECT, [
+        {'title': 'Graphs', 'body': 'trees and graphs'},
+        {'title': 'Trees', 'body': 'about forests'},
+        {'title': 'Cats', 'body': 'nothing'},
+    ])
+    found = empty.text_search(DB, COLLECT, 'trees', 10, fields=['title'])
+    assert [doc['title'] for doc in found] == ['Trees', 'Graphs']
+    assert found[0][bknd.TEXT_SCORE] > found[1][bknd.TEXT_SCORE]
+
+
+def test_text_search_needs_index(backend):
+    with pytest.raises(ValueError):
+        backend.text_search(DB, COLLECT, 'a', 10)
+
+
+def test_backend_is_abstract():
+    with pytest.raises(TypeError):
+        bknd.Backend()
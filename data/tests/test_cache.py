@@ -0,0 +1,120 @@
+import data.cache as dch
+
+KEY = 'key'
+OTHER_KEY = 'other key'
+VALUE = {'name': 'value'}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_get_missing():
+    cache = dch.LRUCache()
+    assert cache.get(KEY) is dch.MISSING
+    assert cache.stats()[dch.MISSES] == 1
+
+
+def test_put_get():
+    cache = dch.LRUCache()
+    cache.put(KEY, VALUE)
+    assert cache.get(KEY) == VALUE
+    assert cache.stats()[dch.HITS] == 1
+
+
+def test_caches_none():
+    cache = dch.LRUCache()
+    cache.put(KEY, None)
+    assert cache.get(KEY) is None
+
+
+def test_get_returns_copy():
+    cache = dch.LRUCache()
+    cache.put(KEY, VALUE)
+    cache.get(KEY)['name'] = 'changed'
+    assert cache.get(KEY) == VALUE
+
+
+def test_lru_eviction():
+    cache = dch.LRUCache(max_size=2)
+    cache.put(KEY, 1)
+    cache.put(OTHER_KEY, 2)
+    cache.get(KEY)  # now OTHER_KEY is the least recently used
+    cache.put('third', 3)
+    assert cache.get(OTHER_KEY) is dch.MISSING
+    assert cache.get(KEY) == 1
+    assert cache.stats()[dch.EVICTIONS] == 1
+    assert cache.stats()[dch.SIZE] == 2
+
+
+def test_byte_eviction():
+    cache = dch.LRUCache(max_bytes=10, sizeof=len)
+    cache.put(KEY, 'abcd')
+    cache.put(OTHER_KEY, 'efgh')
+    assert cache.stats()[dch.BYTES] == 8
+    cache.put('third', 'ijkl')
+    assert cache.get(KEY) is dch.MISSING
+    assert cache.get(OTHER_KEY) == 'efgh'
+    assert cache.stats()[dch.BYTES] == 8
+
+
+def test_large_entry_skipped():
+    cache = dch.LRUCache(max_entry_bytes=4, sizeof=len)
+    cache.put(KEY, 'abc')
+    cache.put(KEY, 'too long')
+    assert cache.get(KEY) is dch.MISSING
+    assert cache.stats()[dch.SKIPPED] == 1
+    assert cache.stats()[dch.BYTES] == 0
+
+
+def test_value_size():
+    assert dch.value_size(VALUE) == len('{"name": "value"}')
+
+
+def test_value_size_stops_at_limit():
+    big = ['x' * 100] * 1000
+    assert dch.value_size(big) > 100_000
+    assert 1000 < dch.value_size(big, limit=1000) < 3000
+
+
+def test_ttl_expiry():
+    clock = FakeClock()
+    cache = dch.LRUCache(ttl=10, clock=clock)
+    cache.put(KEY, VALUE)
+    clock.now = 9
+    assert cache.get(KEY) == VALUE
+    clock.now = 10
+    assert cache.get(KEY) is dch.MISSING
+    assert cache.stats()[dch.SIZE] == 0
+
+
+def test_invalidate():
+    cache = dch.LRUCache()
+    cache.put(KEY, 1)
+    cache.put(OTHER_KEY, 2)
+    assert cache.invalidate(lambda key, value: value == 1) == 1
+    assert cache.get(KEY) is dch.MISSING
+    assert cache.get(OTHER_KEY) == 2
+
+
+def test_invalidate_group():
+    cache = dch.LRUCache(group=lambda key: key[0])
+    cache.put(('a', 1), 1)
+    cache.put(('b', 1), 1)
+    assert cache.invalidate(lambda key, value: True, group='a') == 1
+    assert cache.get(('a', 1)) is dch.MISSING
+    assert cache.get(('b', 1)) == 1
+    cache.clear()
+    assert cache.groups == {}
+
+
+def test_clear():
+    cache = dch.LRUCache()
+    cache.put(KEY, VALUE)
+    cache.clear()
+    assert cache.stats()[dch.SIZE] == 0
+    assert cache.stats()[dch.BYTES] == 0
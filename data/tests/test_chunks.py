@@ -0,0 +1,101 @@
+import io
+
+import pytest
+
+import data.chunks as chk
+import data.db_connect as dbc
+
+TEST_COLLECT = 'chunks_test'
+BODY = bytes(range(256)) * 10
+CHUNK = 100
+
+
+class TrickleStream:
+    """
+    Hands back at most 7 bytes per read, like a slow socket.
+    """
+    def __init__(self, data: bytes):
+        self.stream = io.BytesIO(data)
+
+    def read(self, size: int) -> bytes:
+        return self.stream.read(min(size, 7))
+
+
+@pytest.fixture(scope='function')
+def stored():
+    info = chk.write(TEST_COLLECT, io.BytesIO(BODY), chunk_size=CHUNK)
+    yield info
+    chk.delete(TEST_COLLECT, info)
+
+
+def num_chunks(info: dict) -> int:
+    return len(list(dbc.read_iter(TEST_COLLECT,
+                                  {chk.FILE_ID: info[chk.FILE_ID]})))
+
+
+def test_write(stored):
+    assert stored[chk.LENGTH] == len(BODY)
+    assert stored[chk.SIZE] == CHUNK
+    assert num_chunks(stored) == 26
+
+
+def test_write_trickle():
+    info = chk.write(TEST_COLLECT, TrickleStream(BODY), chunk_size=CHUNK)
+    try:
+        assert num_chunks(info) == 26
+        assert b''.join(chk.read(TEST_COLLECT, info)) == BODY
+    finally:
+        chk.delete(TEST_COLLECT, info)
+
+
+def test_write_too_big():
+    with pytest.raises(ValueError):
+        chk.write(TEST_COLLECT, io.BytesIO(BODY), max_size=len(BODY) - 1,
+                  chunk_size=CHUNK)
+    assert list(dbc.read_iter(TEST_COLLECT)) == []
+
+
+class CutShortStream:
+    """
+    Hands back one chunk, then fails like a dropped connection.
+    """
+    def __init__(self):
+        self.reads = 0
+
+    def read(self, size: int) -> bytes:
+        self.reads += 1
+        if self.reads > 1:
+            raise OSError('connection reset')
+        return BODY[:size]
+
+
+def test_write_cut_short():
+    with pytest.raises(OSError):
+        chk.write(TEST_COLLECT, CutShortStream(), chunk_size=CHUNK)
+    assert list(dbc.read_iter(TEST_COLLECT)) == []
+
+
+def test_write_empty():
+    info = chk.write(TEST_COLLECT, io.BytesIO(b''))
+    assert info[chk.LENGTH] == 0
+    assert b''.join(chk.read(TEST_COLLECT, info)) == b''
+
+
+def test_read_all(stored):
+    assert b''.join(chk.read(TEST_COLLECT, stored)) == BODY
+
+
+def test_read_range(stored):
+    for start, stop in [(0, 1), (99, 101), (150, 350), (250, 2560),
+                        (2559, None)]:
+        assert (b''.join(chk.read(TEST_COLLECT, stored, start, stop))
+                == BODY[start:stop])
+
+
+def test_read_empty_range(stored):
+    assert list(chk.read(TEST_COLLECT, stored, 10, 10)) == []
+
+
+def test_delete(stored):
+    assert chk.delete(TEST_COLLECT, stored) == 26
+    assert num_chunks(stored) == 0
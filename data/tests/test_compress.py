@@ -0,0 +1,46 @@
+import zlib
+
+import pytest
+
+import data.compress as cmp
+
+LONG_TEXT = 'All work and no play makes Jack a dull boy. ' * 100
+
+
+def test_encode_long():
+    stored = cmp.encode(LONG_TEXT, codec=cmp.ZLIB)
+    assert cmp.is_compressed(stored)
+    assert stored[cmp.CODEC] == cmp.ZLIB
+    assert len(stored[cmp.DATA]) < len(LONG_TEXT)
+
+
+def test_encode_short():
+    assert cmp.encode('short') == 'short'
+
+
+def test_encode_not_str():
+    assert cmp.encode(42, min_size=0) == 42
+
+
+def test_encode_incompressible():
+    # too short for zlib to win
+    assert cmp.encode('xy', min_size=0, codec=cmp.ZLIB) == 'xy'
+
+
+def test_decode_round_trip():
+    assert cmp.decode(cmp.encode(LONG_TEXT)) == LONG_TEXT
+
+
+def test_decode_plain():
+    assert cmp.decode('plain') == 'plain'
+    assert cmp.decode(None) is None
+
+
+def test_decode_zlib():
+    stored = {cmp.CODEC: cmp.ZLIB, cmp.DATA: zlib.compress(b'hi')}
+    assert cmp.decode(stored) == 'hi'
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        cmp.decode({cmp.CODEC: 'lzma', cmp.DATA: b''})
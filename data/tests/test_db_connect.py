@@ -0,0 +1,98 @@
+from unittest.mock import patch
+
+import pytest
+
+import data.db_connect as dbc
+import data.memory_backend as mem
+
+TEST_COLLECT = 'test_db_connect'
+TEST_KEY = 'key'
+
+dbc.add_index(TEST_COLLECT, TEST_KEY, unique=True)
+
+
+def test_pool_settings():
+    config = {'DB_MAX_POOL_SIZE': '50', 'DB_MIN_POOL_SIZE': 5,
+              'DB_MAX_IDLE_TIME_MS': ''}
+    assert dbc.pool_settings(config) == {dbc.MAX_POOL_SIZE: 50,
+                                         dbc.MIN_POOL_SIZE: 5}
+
+
+def test_pool_settings_none():
+    assert dbc.pool_settings({}) == {}
+
+
+def test_pool_settings_bad_value():
+    with pytest.raises(ValueError):
+        dbc.pool_settings({'DB_MAX_POOL_SIZE': 'lots'})
+    with pytest.raises(ValueError):
+        dbc.pool_settings({'DB_MIN_POOL_SIZE': -1})
+
+
+def test_set_pool_settings():
+    old_settings = dict(dbc.POOL_SETTINGS)
+    try:
+        with patch.object(dbc.get_backend(), 'set_pool_settings') as mock:
+            dbc.set_pool_settings({dbc.MAX_POOL_SIZE: 7})
+        assert dbc.POOL_SETTINGS[dbc.MAX_POOL_SIZE] == 7
+        mock.assert_called_once_with({dbc.MAX_POOL_SIZE: 7})
+    finally:
+        dbc.POOL_SETTINGS.clear()
+        dbc.POOL_SETTINGS.update(old_settings)
+
+
+def test_set_pool_settings_unknown():
+    with pytest.raises(ValueError):
+        dbc.set_pool_settings({'poolSize': 7})
+
+
+def test_after_fork():
+    with patch.object(dbc.get_backend(), 'after_fork') as mock:
+        dbc.after_fork()
+    mock.assert_called_once_with()
+
+
+def test_make_backend():
+    assert isinstance(dbc.make_backend(dbc.MEMORY), mem.MemoryBackend)
+
+
+def test_make_backend_unknown():
+    with pytest.raises(ValueError):
+        dbc.make_backend('PAPER')
+
+
+def test_set_backend():
+    old_backend = dbc.get_backend()
+    try:
+        dbc.set_backend(mem.MemoryBackend())
+        dbc.create(TEST_COLLECT, {TEST_KEY: 'a'})
+        with pytest.raises(dbc.DuplicateKeyError):
+            # the registered indexes were built on the new backend
+            dbc.create(TEST_COLLECT, {TEST_KEY: 'a'})
+        assert dbc.read_one(TEST_COLLECT, {TEST_KEY: 'a'})[TEST_KEY] == 'a'
+    finally:
+        dbc.set_backend(old_backend)
+    assert dbc.read_one(TEST_COLLECT, {TEST_KEY: 'a'}) is None
+
+
+def test_read_one_miss_not_cached():
+    filt = {TEST_KEY: 'made elsewhere'}
+    assert dbc.read_one(TEST_COLLECT, filt) is None
+    # as another process would: no invalidation here
+    dbc.get_backend().insert_one(dbc.JOURNAL_DB, TEST_COLLECT, dict(filt))
+    try:
+        assert dbc.read_one(TEST_COLLECT, filt)[TEST_KEY] == 'made elsewhere'
+    finally:
+        dbc.delete(TEST_COLLECT, filt)
+
+
+def test_keyset_filter():
+    assert dbc.keyset_filter(['a', 'b'], [1, 'x']) == {
+        '$or': [{'a': {'$gt': 1}}, {'a': 1, 'b': {'$gt': 'x'}}]}
+
+
+@pytest.mark.parametrize('after', [[], [1], [1, 'x', 2], [{'$gt': 1}, 'x'],
+                                   'x'])
+def test_keyset_filter_bad_after(after):
+    with pytest.raises(ValueError):
+        dbc.keyset_filter(['a', 'b'], after)
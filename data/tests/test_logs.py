@@ -0,0 +1,93 @@
+import io
+import json
+
+import pytest
+
+import data.logs as logs
+
+TEST_LOGGER = 'data.test_logs'
+
+
+@pytest.fixture(scope='function')
+def stream():
+    stream = io.StringIO()
+    yield stream
+    logs.setup({})
+
+
+def lines(stream) -> list:
+    return stream.getvalue().splitlines()
+
+
+def test_text_format(stream):
+    logs.setup({}, stream=stream)
+    logs.get_logger(TEST_LOGGER).info('Hello %s', 'there')
+    assert lines(stream)[0].endswith(f'INFO {TEST_LOGGER}: Hello there')
+
+
+def test_level(stream):
+    logs.setup({'LOG_LEVEL': 'warning'}, stream=stream)
+    log = logs.get_logger(TEST_LOGGER)
+    log.info('Not shown')
+    log.warning('Shown')
+    assert len(lines(stream)) == 1
+
+
+def test_bad_level():
+    with pytest.raises(ValueError):
+        logs.setup({'LOG_LEVEL': 'LOUD'})
+
+
+def test_bad_format():
+    with pytest.raises(ValueError):
+        logs.setup({'LOG_FORMAT': 'XML'})
+
+
+def test_json_format(stream):
+    logs.setup({'LOG_FORMAT': 'json'}, stream=stream)
+    logs.get_logger(TEST_LOGGER).info('Read %d docs', 3,
+                                      extra={'collection': 'people'})
+    entry = json.loads(lines(stream)[0])
+    assert entry[logs.LEVEL] == 'INFO'
+    assert entry[logs.LOGGER] == TEST_LOGGER
+    assert entry[logs.MESSAGE] == 'Read 3 docs'
+    assert entry['collection'] == 'people'
+
+
+def test_json_exception(stream):
+    logs.setup({'LOG_FORMAT': logs.JSON}, stream=stream)
+    try:
+        raise ValueError('Bad')
+    except ValueError:
+        logs.get_logger(TEST_LOGGER).exception('Failed')
+    entry = json.loads(lines(stream)[0])
+    assert 'ValueError: Bad' in entry[logs.EXCEPTION]
+
+
+def test_sampling(stream):
+    logs.setup({'LOG_LEVEL': 'DEBUG', 'LOG_SAMPLE_EVERY': 10},
+               stream=stream)
+    log = logs.get_logger(TEST_LOGGER)
+    for i in range(25):
+        log.debug('Doc %d', i)
+    for i in range(3):
+        log.warning('Slow %d', i)
+    assert len(lines(stream)) == 3 + 3
+
+
+def test_lazy_formatting(stream):
+    logs.setup({}, stream=stream)
+
+    class Expensive:
+        def __str__(self):
+            raise AssertionError('formatted a dropped message')
+
+    logs.get_logger(TEST_LOGGER).debug('%s', Expensive())
+    assert lines(stream) == []
+
+
+def test_bad_sample_rate():
+    with pytest.raises(ValueError):
+        logs.SamplingFilter(0)
+    with pytest.raises(ValueError):
+        logs.setup({'LOG_SAMPLE_EVERY': 'often'})
@@ -1,6 +1,15 @@
+import hashlib
+import io
+
 import pytest
 import random
+from unittest.mock import patch
+
+import data.chunks as chk
+import data.db_connect as dbc
 import data.manuscript as ms
+import data.people as ppl
+import data.search as srch
 
 
 TEST_TITLE = "Test Manuscript Title"
@@ -33,13 +42,13 @@ def gen_random_not_valid_str() -> str:
 @pytest.fixture(scope='function')
 def temp_manuscript():
     # Create a temporary manuscript and yield its title
-    title = ms.create(TEMP_TITLE, TEMP_AUTHOR, TEMP_AUTHOR_EMAIL, 
+    title = ms.create(TEMP_TITLE, TEMP_AUTHOR, TEMP_AUTHOR_EMAIL,
                       TEMP_TEXT, TEMP_ABSTRACT, TEMP_EDITOR_EMAIL)
     yield title
     # Attempt to delete after test
     try:
         ms.delete(title)
-    except:
+    except Exception:
         print('Manuscript already deleted. ')
 
 
@@ -68,15 +77,15 @@ def test_is_not_valid_action():
 def test_handle_action_bad_state(temp_manuscript):
     with pytest.raises(ValueError):
         ms.handle_action(gen_random_not_valid_str(),
-                           ms.TEST_ACTION,
-                           manu=ms.read_one(temp_manuscript))
+                         ms.TEST_ACTION,
+                         manu=ms.read_one(temp_manuscript))
 
 
 def test_handle_action_bad_action(temp_manuscript):
     with pytest.raises(ValueError):
         ms.handle_action(ms.TEST_STATE,
-                           gen_random_not_valid_str(),
-                           manu=ms.read_one(temp_manuscript))
+                         gen_random_not_valid_str(),
+                         manu=ms.read_one(temp_manuscript))
 
 
 def test_handle_action_valid_return(temp_manuscript):
@@ -92,7 +101,7 @@ def test_handle_action_valid_return(temp_manuscript):
 
 def test_create():
     assert not ms.exists(TEST_TITLE)
-    ms.create(TEST_TITLE, TEST_AUTHOR, TEST_AUTHOR_EMAIL, 
+    ms.create(TEST_TITLE, TEST_AUTHOR, TEST_AUTHOR_EMAIL,
               TEST_TEXT, TEST_ABSTRACT, TEST_EDITOR_EMAIL)
     assert ms.exists(TEST_TITLE)
     # Cleanup
@@ -101,43 +110,43 @@ def test_create():
 
 def test_create_duplicate(temp_manuscript):
     with pytest.raises(ValueError):
-        ms.create(temp_manuscript, "Do not care about author", 
+        ms.create(temp_manuscript, "Do not care about author",
                   GOOD_EMAIL, "or text", "or abstract", GOOD_EMAIL)
 
 
 def test_create_empty_title():
     with pytest.raises(ValueError):
-        ms.create(" ", "Do not care about author", 
+        ms.create(" ", "Do not care about author",
                   GOOD_EMAIL, "or text", "or abstract", GOOD_EMAIL)
 
 
 def test_create_empty_author():
     with pytest.raises(ValueError):
-        ms.create("Do not care about title", " ", 
+        ms.create("Do not care about title", " ",
                   GOOD_EMAIL, "or text", "or abstract", GOOD_EMAIL)
 
 
 def test_create_empty_text():
     with pytest.raises(ValueError):
-        ms.create("Do not care about title", "or author", 
+        ms.create("Do not care about title", "or author",
                   GOOD_EMAIL, " ", "or abstract", GOOD_EMAIL)
 
 
 def test_create_empty_abstract():
     with pytest.raises(ValueError):
-        ms.create("Do not care about title", "or author", 
+        ms.create("Do not care about title", "or author",
                   GOOD_EMAIL, "or text", " ", GOOD_EMAIL)
 
 
 def test_create_bad_author_email():
     with pytest.raises(ValueError):
-        ms.create("Do not care about title", "or author", 
+        ms.create("Do not care about title", "or author",
                   BAD_EMAIL, "or text", "or abstract", GOOD_EMAIL)
 
 
 def test_create_bad_editor_email():
     with pytest.raises(ValueError):
-        ms.create("Do not care about title", "or author", 
+        ms.create("Do not care about title", "or author",
                   GOOD_EMAIL, "or text", "or abstract", BAD_EMAIL)
 
 
@@ -163,10 +172,35 @@ def test_read(temp_manuscript):
         assert ms.REFEREES in manuscript
         assert ms.TEXT in manuscript
         assert ms.ABSTRACT in manuscript
-        assert ms.HISTORY in manuscript
+        assert ms.HISTORY not in manuscript
         assert ms.EDITOR_EMAIL in manuscript
 
 
+def test_read_iter(temp_manuscript):
+    titles = [manu[ms.TITLE] for manu in ms.read_iter()]
+    assert temp_manuscript in titles
+    for manu in ms.read_iter(after=temp_manuscript):
+        assert manu[ms.TITLE] > temp_manuscript
+
+
+def test_read_fields(temp_manuscript):
+    manuscripts = ms.read(fields=[ms.STATE, ms.AUTHOR])
+    manuscript = manuscripts[temp_manuscript]
+    assert set(manuscript) == {ms.TITLE, ms.STATE, ms.AUTHOR}
+
+
+def test_read_iter_fields(temp_manuscript):
+    for manu in ms.read_iter(fields=[ms.STATE]):
+        assert set(manu) == {ms.TITLE, ms.STATE}
+
+
+def test_read_one_fields(temp_manuscript):
+    manu = ms.read_one(temp_manuscript, fields=[ms.STATE])
+    assert ms.STATE in manu
+    assert ms.TEXT not in manu
+    assert ms.ABSTRACT not in manu
+
+
 def test_read_one(temp_manuscript):
     assert ms.read_one(temp_manuscript) is not None
 
@@ -187,37 +221,37 @@ def test_delete_not_found():
 
 def test_update_blank_author(temp_manuscript):
     with pytest.raises(ValueError):
-        ms.update(temp_manuscript, " ", GOOD_EMAIL, 
+        ms.update(temp_manuscript, " ", GOOD_EMAIL,
                   "Not Care", "Not Care", GOOD_EMAIL)
 
 
 def test_update_blank_text(temp_manuscript):
     with pytest.raises(ValueError):
-        ms.update(temp_manuscript, "Not Care", GOOD_EMAIL, 
+        ms.update(temp_manuscript, "Not Care", GOOD_EMAIL,
                   " ", "Not Care", GOOD_EMAIL)
 
 
 def test_update_blank_abstract(temp_manuscript):
     with pytest.raises(ValueError):
-        ms.update(temp_manuscript, "Not Care", GOOD_EMAIL, 
+        ms.update(temp_manuscript, "Not Care", GOOD_EMAIL,
                   "Not Care", " ", GOOD_EMAIL)
 
 
 def test_update_invalid_author_email(temp_manuscript):
     with pytest.raises(ValueError):
-        ms.update(temp_manuscript, "Not Care", BAD_EMAIL, 
+        ms.update(temp_manuscript, "Not Care", BAD_EMAIL,
                   "Not Care", "Not Care", GOOD_EMAIL)
 
 
 def test_update_invalid_editor_email(temp_manuscript):
     with pytest.raises(ValueError):
-        ms.update(temp_manuscript, "Not Care", GOOD_EMAIL, 
+        ms.update(temp_manuscript, "Not Care", GOOD_EMAIL,
                   "Not Care", "Not Care", BAD_EMAIL)
 
 
 def test_update_invalid_title():
     with pytest.raises(ValueError):
-        ms.update("invalid title", "Not Care", GOOD_EMAIL, 
+        ms.update("invalid title", "Not Care", GOOD_EMAIL,
                   "Not Care", "Not Care", GOOD_EMAIL)
 
 
@@ -227,7 +261,7 @@ def test_update(temp_manuscript):
     old_text = ms.read_one(temp_manuscript)[ms.TEXT]
     old_abstract = ms.read_one(temp_manuscript)[ms.ABSTRACT]
     old_editor_email = ms.read_one(temp_manuscript)[ms.EDITOR_EMAIL]
-    title = ms.update(temp_manuscript, TEST_AUTHOR, TEST_AUTHOR_EMAIL, 
+    title = ms.update(temp_manuscript, TEST_AUTHOR, TEST_AUTHOR_EMAIL,
                       TEST_TEXT, TEST_ABSTRACT, TEST_EDITOR_EMAIL)
     updated_author = ms.read_one(temp_manuscript)[ms.AUTHOR]
     updated_author_email = ms.read_one(temp_manuscript)[ms.AUTHOR_EMAIL]
@@ -245,3 +279,566 @@ def test_update(temp_manuscript):
     assert updated_text == TEST_TEXT
     assert updated_abstract == TEST_ABSTRACT
     assert updated_editor_email == TEST_EDITOR_EMAIL
+
+
+def history_states(title):
+    events, _ = ms.read_history(title, page_size=100)
+    return [event[ms.STATE] for event in events]
+
+
+def test_apply_action_assign_ref(temp_manuscript):
+    manu = ms.apply_action(temp_manuscript, ms.ASSIGN_REF, ref=TEST_REFEREE)
+    assert manu[ms.STATE] == ms.IN_REF_REV
+    assert manu[ms.REFEREES] == [TEST_REFEREE]
+    assert history_states(temp_manuscript) == [ms.SUBMITTED, ms.IN_REF_REV]
+    stored = ms.read_one(temp_manuscript)
+    assert stored[ms.STATE] == ms.IN_REF_REV
+    assert stored[ms.REFEREES] == [TEST_REFEREE]
+
+
+def test_apply_action_delete_ref(temp_manuscript):
+    ms.apply_action(temp_manuscript, ms.ASSIGN_REF, ref=TEST_REFEREE)
+    manu = ms.apply_action(temp_manuscript, ms.DELETE_REF, ref=TEST_REFEREE)
+    assert manu[ms.STATE] == ms.SUBMITTED
+    assert manu[ms.REFEREES] == []
+
+
+def test_apply_action_reject(temp_manuscript):
+    manu = ms.apply_action(temp_manuscript, ms.REJECT)
+    assert manu[ms.STATE] == ms.REJECTED
+
+
+def test_apply_action_not_available(temp_manuscript):
+    with pytest.raises(ValueError):
+        ms.apply_action(temp_manuscript, ms.DONE)
+    assert ms.read_one(temp_manuscript)[ms.STATE] == ms.SUBMITTED
+
+
+def test_apply_action_needs_ref(temp_manuscript):
+    with pytest.raises(ValueError):
+        ms.apply_action(temp_manuscript, ms.ASSIGN_REF)
+
+
+def test_apply_action_no_manuscript():
+    with pytest.raises(ValueError):
+        ms.apply_action('Not an existing title!', ms.REJECT)
+
+
+def test_apply_action_stale_read(temp_manuscript):
+    # another worker rejects it behind our cached copy's back
+    ms.read_one(temp_manuscript, fields=[ms.STATE, ms.REFEREES])
+    dbc.get_backend().update_one(
+        dbc.JOURNAL_DB, ms.MANUSCRIPTS_COLLECT,
+        {ms.TITLE: temp_manuscript}, {'$set': {ms.STATE: ms.REJECTED}})
+    ms.apply_action(temp_manuscript, ms.WITHDRAW)
+    assert history_states(temp_manuscript)[-1] == ms.WITHDRAWN
+    with pytest.raises(ValueError):
+        ms.apply_action(temp_manuscript, ms.REJECT)
+
+
+def test_apply_actions(temp_manuscript):
+    ms.create(TEST_TITLE, TEST_AUTHOR, TEST_AUTHOR_EMAIL,
+              TEST_TEXT, TEST_ABSTRACT, TEST_EDITOR_EMAIL)
+    try:
+        results = ms.apply_actions([
+            {ms.TITLE: temp_manuscript, ms.ACTION: ms.ASSIGN_REF,
+             ms.REFEREE: TEST_REFEREE},
+            {ms.TITLE: TEST_TITLE, ms.ACTION: ms.REJECT},
+            {ms.TITLE: 'Not an existing title!', ms.ACTION: ms.REJECT},
+        ])
+        assert [res[ms.OK] for res in results] == [True, True, False]
+        assert results[0][ms.STATE] == ms.IN_REF_REV
+        assert ms.ERROR in results[2]
+        manu = ms.read_one(temp_manuscript)
+        assert manu[ms.STATE] == ms.IN_REF_REV
+        assert manu[ms.REFEREES] == [TEST_REFEREE]
+        assert not manu.get(ms.ACTION_IDS)
+        assert ms.read_one(TEST_TITLE)[ms.STATE] == ms.REJECTED
+    finally:
+        ms.delete(TEST_TITLE)
+
+
+def test_apply_actions_bad_transition(temp_manuscript):
+    results = ms.apply_actions([
+        {ms.TITLE: temp_manuscript, ms.ACTION: ms.DONE},
+    ])
+    assert not results[0][ms.OK]
+    assert ms.read_one(temp_manuscript)[ms.STATE] == ms.SUBMITTED
+
+
+def test_apply_actions_one_per_title(temp_manuscript):
+    results = ms.apply_actions([
+        {ms.TITLE: temp_manuscript, ms.ACTION: ms.REJECT},
+        {ms.TITLE: temp_manuscript, ms.ACTION: ms.WITHDRAW},
+    ])
+    assert [res[ms.OK] for res in results] == [True, False]
+
+
+def test_apply_actions_too_many():
+    with pytest.raises(ValueError):
+        ms.apply_actions([{}] * (ms.MAX_BULK_ACTIONS + 1))
+
+
+def test_apply_actions_changed_under_us(temp_manuscript):
+    real_bulk_update = dbc.bulk_update
+
+    def withdraw_first(collection, updates):
+        ms.apply_action(temp_manuscript, ms.WITHDRAW)
+        return real_bulk_update(collection, updates)
+
+    with patch('data.db_connect.bulk_update', side_effect=withdraw_first):
+        results = ms.apply_actions([
+            {ms.TITLE: temp_manuscript, ms.ACTION: ms.REJECT},
+        ])
+    assert not results[0][ms.OK]
+    assert results[0][ms.ERROR] == ms.CHANGED_UNDER_US
+    assert ms.read_one(temp_manuscript)[ms.STATE] == ms.WITHDRAWN
+
+
+def test_apply_actions_competing_batch(temp_manuscript):
+    ms.create(TEST_TITLE, TEST_AUTHOR, TEST_AUTHOR_EMAIL,
+              TEST_TEXT, TEST_ABSTRACT, TEST_EDITOR_EMAIL)
+    real_bulk_update = dbc.bulk_update
+    raced = []
+
+    def race(collection, updates):
+        if raced:
+            return real_bulk_update(collection, updates)
+        raced.append(True)
+        # makes our TEST_TITLE action miss
+        ms.apply_action(TEST_TITLE, ms.WITHDRAW)
+        matched = real_bulk_update(collection, updates)
+        # another batch writes over the manuscript ours did change
+        ms.apply_actions([{ms.TITLE: temp_manuscript,
+                           ms.ACTION: ms.ASSIGN_REF,
+                           ms.REFEREE: TEMP_AUTHOR_EMAIL}])
+        return matched
+
+    try:
+        with patch('data.db_connect.bulk_update', side_effect=race):
+            results = ms.apply_actions([
+                {ms.TITLE: temp_manuscript, ms.ACTION: ms.ASSIGN_REF,
+                 ms.REFEREE: TEST_REFEREE},
+                {ms.TITLE: TEST_TITLE, ms.ACTION: ms.REJECT},
+            ])
+        assert [res[ms.OK] for res in results] == [True, False]
+        assert results[1][ms.ERROR] == ms.CHANGED_UNDER_US
+        events, _ = ms.read_history(temp_manuscript)
+        assert [event[ms.ACTION] for event in events].count(
+            ms.ASSIGN_REF) == 2
+        manu = ms.read_one(temp_manuscript)
+        assert manu[ms.REFEREES] == [TEST_REFEREE, TEMP_AUTHOR_EMAIL]
+        assert not manu.get(ms.ACTION_IDS)
+    finally:
+        ms.delete(TEST_TITLE)
+
+
+QUEUE_EDITOR = 'queueEditor@gmail.com'
+QUEUE_TITLES = ['Queue A', 'Queue B', 'Queue C']
+
+
+@pytest.fixture(scope='function')
+def queued_manuscripts():
+    for title in QUEUE_TITLES:
+        ms.create(title, TEMP_AUTHOR, TEMP_AUTHOR_EMAIL,
+                  TEMP_TEXT, TEMP_ABSTRACT, QUEUE_EDITOR)
+    yield QUEUE_TITLES
+    for title in QUEUE_TITLES:
+        ms.delete(title)
+
+
+def test_read_queue(queued_manuscripts):
+    page, after = ms.read_queue(QUEUE_EDITOR, ms.SUBMITTED, page_size=2)
+    assert [manu[ms.TITLE] for manu in page] == queued_manuscripts[:2]
+    assert after is not None
+    for manu in page:
+        assert ms.TEXT not in manu
+    page, after = ms.read_queue(QUEUE_EDITOR, ms.SUBMITTED, after=after,
+                                page_size=2)
+    assert [manu[ms.TITLE] for manu in page] == queued_manuscripts[2:]
+    assert after is None
+
+
+def test_read_queue_by_state(queued_manuscripts):
+    ms.apply_action(queued_manuscripts[0], ms.REJECT)
+    page, _ = ms.read_queue(QUEUE_EDITOR, ms.REJECTED)
+    assert [manu[ms.TITLE] for manu in page] == queued_manuscripts[:1]
+
+
+def test_read_queue_bad_state():
+    with pytest.raises(ValueError):
+        ms.read_queue(QUEUE_EDITOR, gen_random_not_valid_str())
+
+
+def test_read_by_referee(queued_manuscripts):
+    for title in queued_manuscripts:
+        ms.apply_action(title, ms.ASSIGN_REF, ref=TEST_REFEREE)
+    page, after = ms.read_by_referee(TEST_REFEREE, page_size=2)
+    assert [manu[ms.TITLE] for manu in page] == queued_manuscripts[:2]
+    for manu in page:
+        assert ms.TEXT not in manu
+        assert TEST_REFEREE in manu[ms.REFEREES]
+    page, after = ms.read_by_referee(TEST_REFEREE, after=after, page_size=2)
+    assert [manu[ms.TITLE] for manu in page] == queued_manuscripts[2:]
+    assert after is None
+
+
+def test_read_by_referee_fields(queued_manuscripts):
+    ms.apply_action(queued_manuscripts[0], ms.ASSIGN_REF, ref=TEST_REFEREE)
+    page, _ = ms.read_by_referee(TEST_REFEREE, fields=[ms.STATE])
+    assert page == [{ms.TITLE: queued_manuscripts[0],
+                     ms.STATE: ms.IN_REF_REV}]
+
+
+def test_read_by_referee_none():
+    page, after = ms.read_by_referee('Not a referee!')
+    assert page == []
+    assert after is None
+
+
+def test_search(temp_manuscript):
+    ms.update(temp_manuscript, TEST_AUTHOR, TEST_AUTHOR_EMAIL,
+              'A study of zebrafish fins.', 'On zebrafish.',
+              TEST_EDITOR_EMAIL)
+    results = ms.search('zebrafish')
+    assert [res[ms.TITLE] for res in results] == [temp_manuscript]
+    assert 'zebrafish' in results[0][srch.SNIPPET]
+    assert results[0][srch.SCORE] > 0
+    assert ms.TEXT not in results[0]
+
+
+def test_search_large_text(temp_manuscript):
+    # big enough to be stored compressed
+    text = 'Fins regrow. ' * 200 + 'A study of zebrafish.'
+    assert len(text) > dbc.COMPRESS_MIN_SIZE
+    ms.update(temp_manuscript, TEST_AUTHOR, TEST_AUTHOR_EMAIL,
+              text, TEST_ABSTRACT, TEST_EDITOR_EMAIL)
+    results = ms.search('zebrafish')
+    assert [res[ms.TITLE] for res in results] == [temp_manuscript]
+
+
+def test_search_text_hidden(temp_manuscript):
+    assert ms.SEARCH_TEXT not in ms.read_one(temp_manuscript)
+    assert ms.read_one(temp_manuscript, fields=[ms.SEARCH_TEXT])
+
+
+def test_backfill_search_text(temp_manuscript):
+    dbc.unset(ms.MANUSCRIPTS_COLLECT, {ms.TITLE: temp_manuscript},
+              [ms.SEARCH_TEXT])
+    assert ms.backfill_search_text() >= 1
+    manu = ms.read_one(temp_manuscript, fields=[ms.TEXT, ms.SEARCH_TEXT])
+    assert manu[ms.SEARCH_TEXT] == manu[ms.TEXT]
+
+
+def test_search_after_delete(temp_manuscript):
+    ms.update(temp_manuscript, TEST_AUTHOR, TEST_AUTHOR_EMAIL,
+              'A study of zebrafish fins.', 'On zebrafish.',
+              TEST_EDITOR_EMAIL)
+    ms.delete(temp_manuscript)
+    assert ms.search('zebrafish') == []
+
+
+def test_search_nothing():
+    with pytest.raises(ValueError):
+        ms.search(' the ')
+
+
+def test_search_bad_limit():
+    with pytest.raises(ValueError):
+        ms.search('zebrafish', limit=0)
+
+
+def test_suggest_authors(temp_manuscript):
+    suggestions = ms.suggest_authors(TEMP_AUTHOR[:4])
+    assert {ppl.EMAIL: TEMP_AUTHOR_EMAIL, ppl.NAME: TEMP_AUTHOR} in [
+        {ppl.EMAIL: sugg[ppl.EMAIL], ppl.NAME: sugg[ppl.NAME]}
+        for sugg in suggestions]
+
+
+def test_suggest_authors_once_each(temp_manuscript):
+    ms.create('Another ' + temp_manuscript, TEMP_AUTHOR, TEMP_AUTHOR_EMAIL,
+              TEMP_TEXT, TEMP_ABSTRACT, TEMP_EDITOR_EMAIL)
+    try:
+        emails = [sugg[ppl.EMAIL]
+                  for sugg in ms.suggest_authors(TEMP_AUTHOR)]
+        assert emails.count(TEMP_AUTHOR_EMAIL) == 1
+    finally:
+        ms.delete('Another ' + temp_manuscript)
+
+
+def test_long_text_round_trip(temp_manuscript):
+    long_text = 'Many words about zebrafish. ' * 100
+    ms.update(temp_manuscript, TEMP_AUTHOR, TEMP_AUTHOR_EMAIL,
+              long_text, TEMP_ABSTRACT, TEMP_EDITOR_EMAIL)
+    assert ms.read_one(temp_manuscript)[ms.TEXT] == long_text
+    manus = list(ms.read_iter(fields=[ms.TITLE, ms.TEXT]))
+    assert long_text in [manu[ms.TEXT] for manu in manus]
+
+
+BIG_TEXT = 'Zebrafish fins regrow. ' * 50000
+
+
+def read_text(title, start=0, stop=None):
+    length, read = ms.open_text(title)
+    return length, b''.join(read(start, stop))
+
+
+def test_open_text_inline(temp_manuscript):
+    body = TEMP_TEXT.encode()
+    assert read_text(temp_manuscript) == (len(body), body)
+    assert read_text(temp_manuscript, 1, 3) == (len(body), body[1:3])
+
+
+def test_open_text_not_there():
+    assert ms.open_text('Not a manuscript title') is None
+
+
+def test_upload_text(temp_manuscript):
+    length = ms.upload_text(temp_manuscript, io.BytesIO(BIG_TEXT.encode()))
+    assert length == len(BIG_TEXT)
+    assert read_text(temp_manuscript) == (length, BIG_TEXT.encode())
+    assert read_text(temp_manuscript, 500000, 500010)[1] == \
+        BIG_TEXT.encode()[500000:500010]
+    assert ms.read_one(temp_manuscript)[ms.TEXT] is None
+
+
+def upload_file(title):
+    return ms.read_one(title)[ms.TEXT_FILE]
+
+
+def chunks_left(text_file):
+    return list(dbc.read_iter(ms.MANUSCRIPT_CHUNKS_COLLECT,
+                              {chk.FILE_ID: text_file[chk.FILE_ID]}))
+
+
+def test_upload_text_replaces(temp_manuscript):
+    ms.upload_text(temp_manuscript, io.BytesIO(BIG_TEXT.encode()))
+    first = upload_file(temp_manuscript)
+    ms.upload_text(temp_manuscript, io.BytesIO(b'Second draft.'))
+    # the first upload is a revision now
+    assert chunks_left(first) != []
+    assert read_text(temp_manuscript)[1] == b'Second draft.'
+
+
+def test_update_after_upload(temp_manuscript):
+    ms.upload_text(temp_manuscript, io.BytesIO(BIG_TEXT.encode()))
+    ms.update(temp_manuscript, TEMP_AUTHOR, TEMP_AUTHOR_EMAIL,
+              'Short again.', TEMP_ABSTRACT, TEMP_EDITOR_EMAIL)
+    assert ms.read_one(temp_manuscript)[ms.TEXT_FILE] is None
+    assert read_text(temp_manuscript)[1] == b'Short again.'
+
+
+def test_create_stores_revision(temp_manuscript):
+    revisions = ms.read_revisions(temp_manuscript)
+    assert len(revisions) == 1
+    assert revisions[0][ms.LENGTH] == len(TEMP_TEXT)
+    revision = ms.read_revision(temp_manuscript, revisions[0][ms.HASH])
+    assert revision[ms.ABSTRACT] == TEMP_ABSTRACT
+    assert read_revision_text(temp_manuscript,
+                              revisions[0][ms.HASH]) == TEMP_TEXT
+
+
+def update_text(title, text):
+    ms.update(title, TEMP_AUTHOR, TEMP_AUTHOR_EMAIL, text, TEMP_ABSTRACT,
+              TEMP_EDITOR_EMAIL)
+
+
+def read_revision_text(title, rev_hash):
+    length, read = ms.open_text(title, rev_hash)
+    return b''.join(read(0, length)).decode()
+
+
+def test_update_adds_revision(temp_manuscript):
+    update_text(temp_manuscript, 'Second draft.')
+    hashes = [rev[ms.HASH] for rev in ms.read_revisions(temp_manuscript)]
+    assert len(hashes) == 2
+    # revisions are shared, so either may have come from an upload
+    assert read_revision_text(temp_manuscript, hashes[0]) == TEMP_TEXT
+    assert read_revision_text(temp_manuscript,
+                              hashes[1]) == 'Second draft.'
+
+
+def test_update_same_body_no_revision(temp_manuscript):
+    ms.update(temp_manuscript, 'Another Author', TEMP_AUTHOR_EMAIL,
+              TEMP_TEXT, TEMP_ABSTRACT, TEMP_EDITOR_EMAIL)
+    assert len(ms.read_revisions(temp_manuscript)) == 1
+
+
+def test_revisions_stored_once(temp_manuscript):
+    update_text(temp_manuscript, 'Second draft.')
+    update_text(temp_manuscript, TEMP_TEXT)
+    hashes = [rev[ms.HASH] for rev in ms.read_revisions(temp_manuscript)]
+    assert len(hashes) == 3
+    assert hashes[0] == hashes[2]
+    stored = list(dbc.read_iter(ms.REVISIONS_COLLECT,
+                                {ms.HASH: {'$in': hashes}}))
+    assert len(stored) == 2
+
+
+def test_abstract_edits_store_body_once(temp_manuscript):
+    for i in range(3):
+        ms.update(temp_manuscript, TEMP_AUTHOR, TEMP_AUTHOR_EMAIL,
+                  TEMP_TEXT, f'Abstract {i}', TEMP_EDITOR_EMAIL)
+    hashes = [rev[ms.HASH] for rev in ms.read_revisions(temp_manuscript)]
+    assert len(hashes) == 4
+    stored = list(dbc.read_iter(ms.REVISIONS_COLLECT,
+                                {ms.HASH: {'$in': hashes}}))
+    assert [rev for rev in stored if ms.TEXT in rev] == []
+    body_hashes = {rev[ms.BODY_HASH] for rev in stored}
+    assert len(body_hashes) == 1
+    assert len(list(dbc.read_iter(ms.BODIES_COLLECT,
+                                  {ms.HASH: {'$in': list(body_hashes)}}))) == 1
+    assert read_revision_text(temp_manuscript, hashes[-1]) == TEMP_TEXT
+
+
+def test_manuscript_points_at_body(temp_manuscript):
+    stored = dbc.read_one(ms.MANUSCRIPTS_COLLECT,
+                          {ms.TITLE: temp_manuscript})
+    assert ms.TEXT not in stored
+    body = dbc.read_one(ms.BODIES_COLLECT, {ms.HASH: stored[ms.BODY_HASH]})
+    assert body[ms.TEXT] == TEMP_TEXT
+
+
+def test_failed_writes_store_no_body(temp_manuscript):
+    text = 'A body nobody kept.'
+    with pytest.raises(ValueError):
+        ms.create(temp_manuscript, TEMP_AUTHOR, TEMP_AUTHOR_EMAIL,
+                  text, TEMP_ABSTRACT, TEMP_EDITOR_EMAIL)
+    with pytest.raises(ValueError):
+        ms.update('Not a manuscript title', TEMP_AUTHOR, TEMP_AUTHOR_EMAIL,
+                  text, TEMP_ABSTRACT, TEMP_EDITOR_EMAIL)
+    body_hash = hashlib.sha256(text.encode()).hexdigest()
+    assert dbc.read_one(ms.BODIES_COLLECT, {ms.HASH: body_hash}) is None
+    assert not list(dbc.read_iter(ms.REVISIONS_COLLECT,
+                                  {ms.BODY_HASH: body_hash}))
+
+
+def test_inline_body_read_then_replaced():
+    # stored before bodies were stored on their own
+    dbc.create(ms.MANUSCRIPTS_COLLECT,
+               {ms.TITLE: TEST_TITLE, ms.TEXT: TEST_TEXT, ms.REVISIONS: []})
+    try:
+        assert ms.read_one(TEST_TITLE)[ms.TEXT] == TEST_TEXT
+        ms.update(TEST_TITLE, TEST_AUTHOR, TEST_AUTHOR_EMAIL,
+                  TEMP_TEXT, TEST_ABSTRACT, TEST_EDITOR_EMAIL)
+        assert ms.read_one(TEST_TITLE)[ms.TEXT] == TEMP_TEXT
+        stored = dbc.read_one(ms.MANUSCRIPTS_COLLECT, {ms.TITLE: TEST_TITLE})
+        assert ms.TEXT not in stored
+    finally:
+        ms.delete(TEST_TITLE)
+
+
+def test_store_body_again_reads_nothing():
+    ms.store_body(text=TEMP_TEXT)
+    with patch('data.db_connect.read_one', autospec=True) as mock_read:
+        body = ms.store_body(text=TEMP_TEXT)
+    mock_read.assert_not_called()
+    assert body[ms.LENGTH] == len(TEMP_TEXT)
+
+
+def test_upload_same_body_stored_once(temp_manuscript):
+    ms.upload_text(temp_manuscript, io.BytesIO(TEMP_TEXT.encode()))
+    hashes = [rev[ms.HASH] for rev in ms.read_revisions(temp_manuscript)]
+    # the same abstract and body as when it was created
+    assert hashes == hashes[:1]
+    assert ms.read_one(temp_manuscript)[ms.TEXT] == TEMP_TEXT
+
+
+def test_upload_revision_text(temp_manuscript):
+    ms.upload_text(temp_manuscript, io.BytesIO(BIG_TEXT.encode()))
+    update_text(temp_manuscript, 'Short again.')
+    uploaded = ms.read_revisions(temp_manuscript)[1]
+    assert uploaded[ms.LENGTH] == len(BIG_TEXT)
+    length, read = ms.open_text(temp_manuscript, uploaded[ms.HASH])
+    assert b''.join(read(0, 100)) == BIG_TEXT.encode()[:100]
+
+
+def test_read_revision_other_manuscript(temp_manuscript):
+    rev_hash = ms.read_revisions(temp_manuscript)[0][ms.HASH]
+    assert ms.read_revision('Not a manuscript title', rev_hash) is None
+    assert ms.open_text(temp_manuscript, 'not a hash') is None
+
+
+def test_read_revisions_not_there():
+    assert ms.read_revisions('Not a manuscript title') is None
+
+
+def test_revision_hash():
+    assert ms.revision_hash('a', 'b') == ms.revision_hash('a', 'b')
+    assert ms.revision_hash('a', 'b') != ms.revision_hash('b', 'a')
+
+
+def test_delete_keeps_revisions(temp_manuscript):
+    ms.upload_text(temp_manuscript, io.BytesIO(BIG_TEXT.encode()))
+    uploaded = upload_file(temp_manuscript)
+    ms.delete(temp_manuscript)
+    assert chunks_left(uploaded) != []
+
+
+def test_upload_text_too_big(temp_manuscript):
+    with patch.object(ms, 'MAX_TEXT_SIZE', 10):
+        with pytest.raises(ValueError):
+            ms.upload_text(temp_manuscript, io.BytesIO(BIG_TEXT.encode()))
+    assert read_text(temp_manuscript)[1] == TEMP_TEXT.encode()
+
+
+def test_upload_text_empty(temp_manuscript):
+    with pytest.raises(ValueError):
+        ms.upload_text(temp_manuscript, io.BytesIO(b''))
+    assert read_text(temp_manuscript)[1] == TEMP_TEXT.encode()
+
+
+def test_upload_text_not_there():
+    with pytest.raises(ValueError):
+        ms.upload_text('Not a manuscript title', io.BytesIO(b'text'))
+
+
+def test_history_event(temp_manuscript):
+    ms.apply_action(temp_manuscript, ms.ASSIGN_REF, actor=TEST_EDITOR_EMAIL,
+                    ref=TEST_REFEREE)
+    events, after = ms.read_history(temp_manuscript)
+    assert after is None
+    assert events[0][ms.ACTOR] == TEMP_AUTHOR_EMAIL
+    assert events[1][ms.ACTION] == ms.ASSIGN_REF
+    assert events[1][ms.ACTOR] == TEST_EDITOR_EMAIL
+    assert events[1][ms.EVENT_TIME] >= events[0][ms.EVENT_TIME]
+
+
+def test_history_pages(temp_manuscript):
+    ms.apply_action(temp_manuscript, ms.ASSIGN_REF, ref=TEST_REFEREE)
+    ms.apply_action(temp_manuscript, ms.DELETE_REF, ref=TEST_REFEREE)
+    first, after = ms.read_history(temp_manuscript, page_size=2)
+    assert len(first) == 2
+    rest, after = ms.read_history(temp_manuscript, after=after, page_size=2)
+    assert after is None
+    assert [event[ms.STATE] for event in first + rest] == [
+        ms.SUBMITTED, ms.IN_REF_REV, ms.SUBMITTED]
+
+
+def test_history_bulk(temp_manuscript):
+    ms.apply_actions([{ms.TITLE: temp_manuscript, ms.ACTION: ms.REJECT,
+                       ms.ACTOR: TEST_EDITOR_EMAIL}])
+    events, _ = ms.read_history(temp_manuscript)
+    assert events[-1][ms.STATE] == ms.REJECTED
+    assert events[-1][ms.ACTOR] == TEST_EDITOR_EMAIL
+
+
+def test_history_not_there():
+    assert ms.read_history('Not an existing title!') is None
+
+
+def test_history_dropped_with_manuscript(temp_manuscript):
+    ms.delete(temp_manuscript)
+    assert list(dbc.read_iter(ms.EVENTS_COLLECT,
+                              {ms.TITLE: temp_manuscript})) == []
+
+
+def test_migrate_history(temp_manuscript):
+    # written before we kept an events collection
+    dbc.delete_many(ms.EVENTS_COLLECT, {ms.TITLE: temp_manuscript})
+    dbc.update(ms.MANUSCRIPTS_COLLECT, {ms.TITLE: temp_manuscript},
+               {ms.HISTORY: [ms.SUBMITTED, ms.IN_REF_REV]})
+    assert ms.migrate_history() >= 1
+    assert history_states(temp_manuscript) == [ms.SUBMITTED, ms.IN_REF_REV]
+    assert ms.HISTORY not in ms.read_one(temp_manuscript)
+    assert ms.migrate_history() == 0
@@ -0,0 +1,44 @@
+import os
+
+import pytest
+
+pytest.importorskip('pymongo')
+
+import data.mongo_backend as mbk  # noqa: E402
+
+
+def test_projection():
+    assert mbk.projection(['a', 'b']) == {'a': 1, 'b': 1, '_id': 0}
+    assert mbk.projection(['a'], no_id=False) == {'a': 1}
+    assert mbk.projection(no_id=False) is None
+
+
+def test_set_pool_settings():
+    backend = mbk.MongoBackend(pool_settings={'maxPoolSize': 5})
+    client = backend.get_client()
+    backend.set_pool_settings({'minPoolSize': 1})
+    assert backend.pool_settings == {'maxPoolSize': 5, 'minPoolSize': 1}
+    assert backend.get_client() is not client
+
+
+def test_after_fork():
+    backend = mbk.MongoBackend()
+    client = backend.get_client()
+    backend.after_fork()
+    assert backend.client is None
+    assert backend.get_client() is not client
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_new_client_after_fork():
+    backend = mbk.MongoBackend()
+    parent_client = backend.get_client()
+    pid = os.fork()
+    if pid == 0:
+        # the child must not reuse the parent's client
+        ok = (backend.get_client() is not parent_client
+              and backend.pid == os.getpid())
+        os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert backend.get_client() is parent_client
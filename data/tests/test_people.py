@@ -1,6 +1,9 @@
 import pytest
 
+import data.cache as dch
+import data.db_connect as dbc
 import data.people as ppl
+import data.roles as rls
 from data.roles import TEST_CODE
 
 
@@ -117,10 +120,66 @@ def test_read(temp_person):
         assert ppl.ROLES in person
 
 
+def test_read_iter(temp_person):
+    emails = [person[ppl.EMAIL] for person in ppl.read_iter()]
+    assert temp_person in emails
+    assert emails == sorted(emails)
+
+
+def test_read_iter_after(temp_person):
+    for person in ppl.read_iter(after=temp_person):
+        assert person[ppl.EMAIL] > temp_person
+
+
+def test_read_iter_limit(temp_person):
+    assert len(list(ppl.read_iter(limit=1))) == 1
+
+
+def test_read_no_mongo_id(temp_person):
+    for person in ppl.read().values():
+        assert '_id' not in person
+
+
+def test_read_fields(temp_person):
+    people = ppl.read(fields=[ppl.NAME])
+    assert set(people[temp_person]) == {ppl.NAME, ppl.EMAIL}
+
+
 def test_read_one(temp_person):
     assert ppl.read_one(temp_person) is not None
 
 
+def test_read_one_cached(temp_person):
+    if dbc.cache is None:
+        pytest.skip('read_one cache is off')
+    ppl.read_one(temp_person)
+    hits = dbc.cache_stats()[dch.HITS]
+    ppl.read_one(temp_person)
+    assert dbc.cache_stats()[dch.HITS] == hits + 1
+
+
+def test_read_one_cache_invalidated(temp_person):
+    assert ppl.read_one(temp_person)[ppl.NAME] != UPDATE_NAME
+    ppl.update(temp_person, UPDATE_NAME, UPDATE_AFFILIATION)
+    assert ppl.read_one(temp_person)[ppl.NAME] == UPDATE_NAME
+    ppl.delete(temp_person)
+    assert ppl.read_one(temp_person) is None
+    assert not ppl.exists(temp_person)
+
+
+def test_read_one_identity_map(temp_person):
+    id_map = {}
+    old_provider = dbc.identity_map_provider
+    dbc.set_identity_map_provider(lambda: id_map)
+    try:
+        person = ppl.read_one(temp_person)
+        assert ppl.read_one(temp_person) is person
+        ppl.update(temp_person, UPDATE_NAME, UPDATE_AFFILIATION)
+        assert ppl.read_one(temp_person)[ppl.NAME] == UPDATE_NAME
+    finally:
+        dbc.set_identity_map_provider(old_provider)
+
+
 def test_read_one_not_there():
     assert ppl.read_one('Not an existing email!') is None
 
@@ -144,6 +203,107 @@ def test_get_masthead():
     assert isinstance(mh, dict)
 
 
+def test_get_masthead_has_editor(temp_person):
+    ppl.add_role(temp_person, rls.ED_CODE)
+    mh = ppl.get_masthead()
+    assert set(mh) == set(rls.get_masthead_roles().values())
+    editors = mh[rls.get_masthead_roles()[rls.ED_CODE]]
+    assert ppl.create_mh_rec(ppl.read_one(temp_person)) in editors
+    for rec in editors:
+        assert set(rec) == set(ppl.MH_FIELDS)
+
+
+def mh_editors() -> list:
+    return ppl.get_masthead()[rls.get_masthead_roles()[rls.ED_CODE]]
+
+
+def test_masthead_follows_role_changes(temp_person):
+    rec = ppl.create_mh_rec(ppl.read_one(temp_person))
+    assert rec not in mh_editors()
+    ppl.add_role(temp_person, rls.ED_CODE)
+    assert rec in mh_editors()
+    ppl.delete_role(temp_person, rls.ED_CODE)
+    assert rec not in mh_editors()
+
+
+def test_masthead_follows_update(temp_person):
+    ppl.add_role(temp_person, rls.ED_CODE)
+    ppl.update(temp_person, UPDATE_NAME, UPDATE_AFFILIATION)
+    assert {ppl.NAME: UPDATE_NAME,
+            ppl.AFFILIATION: UPDATE_AFFILIATION} in mh_editors()
+
+
+def test_masthead_one_entry_per_person(temp_person):
+    ppl.add_role(temp_person, rls.ED_CODE)
+    # as if an update had raced the role being added
+    ppl.mh_add({ppl.EMAIL: temp_person, ppl.NAME: UPDATE_NAME,
+                ppl.AFFILIATION: UPDATE_AFFILIATION}, rls.ED_CODE)
+    stored = dbc.read_one(ppl.MASTHEAD_COLLECT,
+                          {dbc.MONGO_ID: ppl.MASTHEAD_ID})
+    entries = [entry for entry in stored[ppl.MH_ROLES][rls.ED_CODE]
+               if entry[ppl.EMAIL] == temp_person]
+    assert len(entries) == 1
+    assert entries[0][ppl.NAME] == UPDATE_NAME
+
+
+def test_masthead_follows_delete(temp_person):
+    ppl.add_role(temp_person, rls.ED_CODE)
+    rec = ppl.create_mh_rec(ppl.read_one(temp_person))
+    ppl.delete(temp_person)
+    assert rec not in mh_editors()
+
+
+def test_masthead_created_with_role():
+    ppl.create('Ed Itor', 'NYU', ADD_EMAIL, rls.ED_CODE)
+    assert {ppl.NAME: 'Ed Itor', ppl.AFFILIATION: 'NYU'} in mh_editors()
+    ppl.delete(ADD_EMAIL)
+
+
+def test_rebuild_masthead_matches(temp_person):
+    ppl.add_role(temp_person, rls.CE_CODE)
+    ppl.update(temp_person, UPDATE_NAME, UPDATE_AFFILIATION)
+    incremental = ppl.get_masthead()
+    ppl.rebuild_masthead()
+    assert ppl.get_masthead() == incremental
+
+
+def test_masthead_order_same_after_rebuild():
+    ppl.create('Alice Adams', 'NYU', 'alice@mh.org', TEST_CODE)
+    ppl.create('Bob Brown', 'NYU', 'bob@mh.org', rls.ED_CODE)
+    ppl.add_role('alice@mh.org', rls.ED_CODE)
+    incremental = mh_editors()
+    ppl.rebuild_masthead()
+    rebuilt = mh_editors()
+    ppl.delete('alice@mh.org')
+    ppl.delete('bob@mh.org')
+    assert rebuilt == incremental
+    names = [rec[ppl.NAME] for rec in rebuilt]
+    assert names.index('Alice Adams') < names.index('Bob Brown')
+
+
+def test_suggest(temp_person):
+    suggestions = ppl.suggest('Petr')
+    assert TEMP_EMAIL in [sugg[ppl.EMAIL] for sugg in suggestions]
+
+
+def test_suggest_follows_update(temp_person):
+    ppl.update(temp_person, 'Quentin Quill', 'PKU')
+    suggestions = ppl.suggest('Quentin')
+    assert suggestions[0][ppl.EMAIL] == TEMP_EMAIL
+    assert suggestions[0][ppl.NAME] == 'Quentin Quill'
+
+
+def test_suggest_follows_delete(temp_person):
+    ppl.delete(temp_person)
+    suggestions = ppl.suggest('Peter')
+    assert TEMP_EMAIL not in [sugg[ppl.EMAIL] for sugg in suggestions]
+
+
+def test_suggest_too_short():
+    with pytest.raises(ValueError):
+        ppl.suggest('P')
+
+
 def test_has_role(temp_person):
     person_rec = ppl.read_one(temp_person)
     assert ppl.has_role(person_rec, TEST_CODE)
@@ -174,6 +334,11 @@ def test_create_duplicate(temp_person):
                     TEST_CODE)
 
 
+def test_email_index_is_unique():
+    assert (dbc.JOURNAL_DB, ppl.PEOPLE_COLLECT, ppl.EMAIL,
+            {'unique': True}) in dbc.INDEXES
+
+
 def test_create_bad_email():
     with pytest.raises(ValueError):
         ppl.create('Do not care about name', 
@@ -241,6 +406,16 @@ def test_add_role(temp_person):
     assert UPDATE_ROLE_CODE in new_roles
 
 
+def test_add_role_keeps_others(temp_person):
+    ppl.add_role(temp_person, UPDATE_ROLE_CODE)
+    ppl.add_role(temp_person, rls.ED_CODE)
+    roles = ppl.read_one(temp_person)[ppl.ROLES]
+    assert roles == [TEST_CODE, UPDATE_ROLE_CODE, rls.ED_CODE]
+    ppl.delete_role(temp_person, UPDATE_ROLE_CODE)
+    roles = ppl.read_one(temp_person)[ppl.ROLES]
+    assert roles == [TEST_CODE, rls.ED_CODE]
+
+
 def test_add_duplicate_role(temp_person):
     roles = ppl.read_one(temp_person)[ppl.ROLES]
     assert TEST_CODE in roles
@@ -0,0 +1,115 @@
+import pytest
+
+import data.db_connect as dbc
+import data.search as srch
+
+TEST_COLLECT = 'search_test'
+COMPRESSED_COLLECT = 'search_test_compressed'
+KEY = 'key'
+TITLE = 'title'
+BODY = 'body'
+WEIGHTS = {TITLE: 3, BODY: 1}
+
+DOCS = [
+    {KEY: 'one', TITLE: 'Graph algorithms', BODY: 'Shortest paths.'},
+    {KEY: 'two', TITLE: 'Compilers', BODY: 'Graph coloring for registers.'},
+    {KEY: 'three', TITLE: 'Databases', BODY: 'B-trees and logs.'},
+]
+
+
+@pytest.fixture(scope='function')
+def docs():
+    for doc in DOCS:
+        dbc.create(TEST_COLLECT, dict(doc))
+    yield DOCS
+    for doc in DOCS:
+        dbc.delete(TEST_COLLECT, {KEY: doc[KEY]})
+
+
+def test_tokenize():
+    assert srch.tokenize('The Graph, and its COLORING!') == [
+        'graph', 'its', 'coloring']
+
+
+def test_make_snippet():
+    text = 'x' * 500 + ' needle ' + 'y' * 500
+    snippet = srch.make_snippet([text], ['needle'])
+    assert 'needle' in snippet
+    assert snippet.startswith('...')
+    assert snippet.endswith('...')
+
+
+def test_make_snippet_no_match():
+    assert srch.make_snippet(['', 'Some text.'], ['needle']) == 'Some text.'
+
+
+def test_make_snippet_empty():
+    assert srch.make_snippet([None, ''], ['needle']) == ''
+
+
+def test_get_backend():
+    backend = srch.get_backend(TEST_COLLECT, KEY, WEIGHTS,
+                               kind=srch.MEMORY)
+    assert isinstance(backend, srch.InvertedIndexSearch)
+    with pytest.raises(ValueError):
+        srch.get_backend(TEST_COLLECT, KEY, WEIGHTS, kind='nope')
+
+
+def test_text_index_never_compressed():
+    srch.get_backend(TEST_COLLECT, KEY, WEIGHTS, kind=srch.MONGO)
+    # Mongo's text index can't see into compressed values
+    with pytest.raises(ValueError):
+        dbc.compress_field(TEST_COLLECT, BODY)
+
+
+def test_compressed_field_never_text_indexed():
+    dbc.compress_field(COMPRESSED_COLLECT, BODY)
+    with pytest.raises(ValueError):
+        srch.get_backend(COMPRESSED_COLLECT, KEY, WEIGHTS, kind=srch.MONGO)
+
+
+def test_inverted_index_ranks(docs):
+    backend = srch.InvertedIndexSearch(TEST_COLLECT, KEY, WEIGHTS)
+    hits = backend.search('graph', 10, fields=[TITLE])
+    # the title match outweighs the body match
+    assert [hit[KEY] for hit in hits] == ['one', 'two']
+    assert hits[0][srch.SCORE] > hits[1][srch.SCORE]
+    assert hits[0][TITLE] == DOCS[0][TITLE]
+
+
+def test_inverted_index_limit(docs):
+    backend = srch.InvertedIndexSearch(TEST_COLLECT, KEY, WEIGHTS)
+    assert len(backend.search('graph', 1, fields=[])) == 1
+
+
+def test_inverted_index_updates(docs):
+    backend = srch.InvertedIndexSearch(TEST_COLLECT, KEY, WEIGHTS)
+    assert backend.search('trees', 10, fields=[]) != []
+    dbc.update(TEST_COLLECT, {KEY: 'three'}, {BODY: 'Logs only.'})
+    backend.add({KEY: 'three', TITLE: 'Databases', BODY: 'Logs only.'})
+    assert backend.search('trees', 10, fields=[]) == []
+    backend.remove('one')
+    hits = backend.search('graph', 10, fields=[])
+    assert [hit[KEY] for hit in hits] == ['two']
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_inverted_index_sees_other_writers(docs):
+    clock = FakeClock()
+    backend = srch.InvertedIndexSearch(TEST_COLLECT, KEY, WEIGHTS,
+                                       max_age=10, clock=clock)
+    assert backend.search('heaps', 10, fields=[]) == []
+    # as another process would, behind this index's back
+    dbc.update(TEST_COLLECT, {KEY: 'three'}, {BODY: 'Heaps.'})
+    clock.now = 9
+    assert backend.search('heaps', 10, fields=[]) == []
+    clock.now = 10
+    hits = backend.search('heaps', 10, fields=[])
+    assert [hit[KEY] for hit in hits] == ['three']
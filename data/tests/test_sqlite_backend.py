@@ -0,0 +1,124 @@
+import threading
+
+import pytest
+
+import data.backend as bknd
+import data.sqlite_backend as sqlb
+from data.tests.test_backends import COLLECT, DB, DOCS, find_names
+
+
+@pytest.fixture(scope='function')
+def path(tmp_path):
+    return str(tmp_path / 'test.db')
+
+
+@pytest.fixture(scope='function')
+def backend(path):
+    backend = sqlb.SqliteBackend(path)
+    backend.create_index(DB, COLLECT, 'name', unique=True)
+    backend.create_index(DB, COLLECT, 'tags', multikey=True)
+    backend.insert_many(DB, COLLECT, [dict(doc) for doc in DOCS])
+    yield backend
+    backend.close()
+
+
+def test_json_round_trip():
+    doc = {'text': {'codec': 'zlib', 'data': b'\x00\xff'}, 'n': [1, 2.5]}
+    assert sqlb.from_json(sqlb.to_json(doc)) == doc
+
+
+def test_json_unstorable():
+    with pytest.raises(TypeError):
+        sqlb.to_json({'when': object()})
+
+
+def test_where():
+    clause, args = sqlb.where({'name': 'a', 'n': {'$gte': 2},
+                               'sub.k': 1, 'extra': None,
+                               '$or': [{'n': 1}]})
+    assert clause.count('json_extract') == 3
+    assert 'json_each' not in clause
+    assert args == ['a', 2, 1]
+
+
+def test_where_multikey():
+    clause, args = sqlb.where({'tags': {'$in': ['x', 'y']}, 'name': 'a'},
+                              multikey={'tags'})
+    assert clause.count('json_each') == 1
+    assert args == ['x', 'y', 'a']
+
+
+def test_where_or_needs_every_branch():
+    clause, args = sqlb.where({'$or': [{'n': 1}, {'sub.k': 1}]})
+    assert clause == ''
+    assert args == []
+
+
+def plan_steps(backend, filt) -> list:
+    table = backend.table(DB, COLLECT)
+    clause, args = backend.where(table, filt)
+    plan = backend.conn().execute(
+        f'EXPLAIN QUERY PLAN SELECT doc FROM {table} WHERE {clause}',
+        args).fetchall()
+    return [step[-1] for step in plan
+            if step[-1].startswith(('SEARCH', 'SCAN'))]
+
+
+@pytest.mark.parametrize('filt', [
+    {'name': 'a'},
+    {'name': {'$in': ['a', 'b']}, 'n': {'$gt': 1}},
+    # as read_by_referee() pages: the index narrows, the array is checked
+    {'name': {'$gt': 'a'}, 'tags': 'y'},
+])
+def test_find_uses_index(backend, filt):
+    steps = plan_steps(backend, filt)
+    assert steps
+    assert all('USING INDEX' in step for step in steps[:1])
+    assert find_names(backend, filt) == [
+        doc['name'] for doc in DOCS
+        if all(sqlb.mem.matches(doc, {key: cond})
+               for key, cond in filt.items())]
+
+
+def test_find_streams_one_snapshot(backend):
+    docs = backend.find(DB, COLLECT, {'n': {'$gte': 1}}, sort=['name'])
+    assert next(docs)['name'] == 'a'
+    backend.insert_one(DB, COLLECT, {'name': 'd', 'n': 4})
+    backend.delete_one(DB, COLLECT, {'name': 'c'})
+    assert [doc['name'] for doc in docs] == ['b', 'c']
+    assert find_names(backend, {}, sort=['name']) == ['a', 'b', 'd']
+
+
+def test_text_search_folds_case(backend):
+    backend.create_index(DB, COLLECT, [('name', bknd.TEXT)])
+    backend.insert_one(DB, COLLECT, {'name': 'Bee b', 'n': 4})
+    found = backend.text_search(DB, COLLECT, 'bee B', 1, fields=['n'])
+    assert found == [{'n': 4, bknd.TEXT_SCORE: 2}]
+
+
+def test_wal_and_persistence(backend, path):
+    assert backend.conn().execute(
+        'PRAGMA journal_mode').fetchone()[0] == 'wal'
+    other = sqlb.SqliteBackend(path)
+    try:
+        # another process's view of the same file
+        assert find_names(other, {'name': 'c'}) == ['c']
+        other.update_one(DB, COLLECT, {'name': 'c'}, {'$set': {'n': 9}})
+        assert backend.find_one(DB, COLLECT, {'name': 'c'})['n'] == 9
+    finally:
+        other.close()
+
+
+def test_connection_per_thread(backend):
+    conns = []
+    thread = threading.Thread(target=lambda: conns.append(backend.conn()))
+    thread.start()
+    thread.join()
+    assert conns[0] is not backend.conn()
+
+
+def test_after_fork(backend):
+    conn = backend.conn()
+    backend.after_fork()
+    assert backend.conn() is not conn
+    conn.close()
@@ -0,0 +1,126 @@
+from unittest.mock import patch
+
+import pytest
+
+import data.db_connect as dbc
+import data.suggest as sgst
+
+TEST_COLLECT = 'suggest_test'
+KEY = 'key'
+NAME = 'name'
+PLACE = 'place'
+
+DOCS = [
+    {KEY: 'smith', NAME: 'Jane Smith', PLACE: 'NYU'},
+    {KEY: 'smythe', NAME: 'John Smythe', PLACE: 'Columbia'},
+    {KEY: 'jones', NAME: 'Ann Jones', PLACE: 'Smithsonian'},
+]
+
+
+@pytest.fixture(scope='function')
+def docs():
+    for doc in DOCS:
+        dbc.create(TEST_COLLECT, dict(doc))
+    yield DOCS
+    for doc in DOCS:
+        dbc.delete(TEST_COLLECT, {KEY: doc[KEY]})
+
+
+@pytest.fixture(scope='function')
+def index(docs):
+    return sgst.TrigramIndex(TEST_COLLECT, KEY, [NAME, PLACE], [KEY, NAME])
+
+
+def test_word_trigrams():
+    assert sgst.word_trigrams('ab') == {'  a', ' ab', 'ab '}
+    assert sgst.word_trigrams('ab', partial=True) == {'  a', ' ab'}
+
+
+def test_trigrams_partial_last_word():
+    grams = sgst.trigrams('Jo Sm', partial=True)
+    assert 'jo ' in grams
+    assert 'sm ' not in grams
+
+
+def test_suggest_prefix(index):
+    hits = index.suggest('smi', 10)
+    assert hits[0][KEY] == 'smith'
+    assert hits[0][sgst.SCORE] == 1.0
+    assert hits[0][NAME] == 'Jane Smith'
+
+
+def test_suggest_typo(index):
+    hits = index.suggest('smitth', 10)
+    assert hits[0][KEY] == 'smith'
+
+
+def test_suggest_other_field(index):
+    hits = index.suggest('columbia', 10)
+    assert [hit[KEY] for hit in hits] == ['smythe']
+
+
+def test_suggest_nothing_close(index):
+    assert index.suggest('xylophone', 10) == []
+
+
+def test_suggest_limit(index):
+    assert len(index.suggest('sm', 1)) == 1
+
+
+def test_suggest_follows_writes(index):
+    assert index.suggest('jones', 10) != []
+    index.add({KEY: 'jones', NAME: 'Ann Brown', PLACE: 'NYU'})
+    assert index.suggest('jones', 10) == []
+    assert index.suggest('brown', 10)[0][NAME] == 'Ann Brown'
+    index.remove('jones')
+    assert index.suggest('brown', 10) == []
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_suggest_sees_other_writers(docs):
+    clock = FakeClock()
+    index = sgst.TrigramIndex(TEST_COLLECT, KEY, [NAME, PLACE], [KEY, NAME],
+                              max_age=10, clock=clock)
+    assert index.suggest('brown', 10) == []
+    # as another process would, behind this index's back
+    dbc.update(TEST_COLLECT, {KEY: 'jones'}, {NAME: 'Ann Brown'})
+    clock.now = 9
+    assert index.suggest('brown', 10) == []
+    clock.now = 10
+    assert index.suggest('brown', 10)[0][KEY] == 'jones'
+
+
+def test_rebuild_keeps_writes_made_meanwhile(index):
+    real_read_iter = dbc.read_iter
+
+    def add_while_reading(*args, **kwargs):
+        index.add({KEY: 'new', NAME: 'Ned Newman', PLACE: 'MIT'})
+        return real_read_iter(*args, **kwargs)
+
+    with patch('data.db_connect.read_iter', side_effect=add_while_reading):
+        index.build()
+    assert index.suggest('newman', 10)[0][KEY] == 'new'
+
+
+def test_check_query():
+    with pytest.raises(ValueError):
+        sgst.check_query('a', 10)
+    with pytest.raises(ValueError):
+        sgst.check_query('ab', sgst.MAX_SUGGEST_LIMIT + 1)
+
+
+def test_merge():
+    merged = sgst.merge([
+        {KEY: 'a', sgst.SCORE: 0.5},
+        {KEY: 'b', sgst.SCORE: 1.0},
+        {KEY: 'a', sgst.SCORE: 0.75},
+    ], KEY, 10)
+    assert merged == [{KEY: 'b', sgst.SCORE: 1.0},
+                      {KEY: 'a', sgst.SCORE: 0.75}]
@@ -1,4 +1,9 @@
+from unittest.mock import patch
+
 import pytest
+
+import data.compress as cmp
+import data.db_connect as dbc
 import data.text as txt
 
 TEMP_PAGE = "TempPage"
@@ -8,6 +13,7 @@ TEMP_TEXT = "Temp Text"
 TEST_PAGE = "TestPage"
 TEST_TITLE = "Test Title"
 TEST_TEXT = "Test Text"
+LONG_TEXT = "A long page of text. " * 200
 
 
 @pytest.fixture(scope='function')
@@ -16,7 +22,7 @@ def temp_text():
     yield page_number
     try:
         txt.delete(page_number)
-    except:
+    except Exception:
         print('Page already deleted. ')
 
 
@@ -66,6 +72,13 @@ def test_read(temp_text):
         assert txt.TEXT in text
 
 
+def test_read_iter(temp_text):
+    pages = [text[txt.PAGE_NUMBER] for text in txt.read_iter()]
+    assert temp_text in pages
+    for text in txt.read_iter(after=temp_text):
+        assert text[txt.PAGE_NUMBER] > temp_text
+
+
 def test_read_one(temp_text):
     assert txt.read_one(temp_text) is not None
 
@@ -97,6 +110,41 @@ def test_update(temp_text):
     assert updated_text == TEST_TEXT
 
 
+def stored_text(page_number):
+    return dbc.get_backend().find_one(
+        dbc.JOURNAL_DB, txt.TEXT_COLLECT,
+        {txt.PAGE_NUMBER: page_number})[txt.TEXT]
+
+
+def test_long_text_stored_compressed(temp_text):
+    txt.update(temp_text, TEST_TITLE, LONG_TEXT)
+    assert cmp.is_compressed(stored_text(temp_text))
+    assert txt.read_one(temp_text)[txt.TEXT] == LONG_TEXT
+    assert txt.read()[temp_text][txt.TEXT] == LONG_TEXT
+
+
+def test_short_text_stored_plain(temp_text):
+    assert stored_text(temp_text) == TEMP_TEXT
+
+
+def test_compressed_text_left_out(temp_text):
+    txt.update(temp_text, TEST_TITLE, LONG_TEXT)
+    page = txt.read_one(temp_text, fields=[txt.TITLE])
+    assert txt.TEXT not in page
+
+
+def test_read_uncompressed_long_text():
+    # written before compression was turned on
+    dbc.get_backend().insert_one(
+        dbc.JOURNAL_DB, txt.TEXT_COLLECT,
+        {txt.PAGE_NUMBER: TEST_PAGE, txt.TITLE: TEST_TITLE,
+         txt.TEXT: LONG_TEXT})
+    try:
+        assert txt.read_one(TEST_PAGE)[txt.TEXT] == LONG_TEXT
+    finally:
+        txt.delete(TEST_PAGE)
+
+
 def test_update_invalid_page_number():
     with pytest.raises(ValueError):
         txt.update('Wrong Page', "Not Care", "Not Care")
@@ -110,3 +158,142 @@ def test_update_blank_title(temp_text):
 def test_update_blank_text(temp_text):
     with pytest.raises(ValueError):
         txt.update(temp_text, "Not Care", " ")
+
+
+OLD_PAGE = 'Line one\nLine two\nLine three\n'
+NEW_PAGE = 'Line one\nLine 2\nLine three\nLine four'
+
+
+def test_delta_round_trip():
+    delta = txt.make_delta(OLD_PAGE, NEW_PAGE)
+    assert txt.apply_delta(OLD_PAGE, delta) == NEW_PAGE
+
+
+def test_delta_keeps_unchanged_lines_out():
+    delta = txt.make_delta(OLD_PAGE, NEW_PAGE)
+    added = [line for op, arg in delta if op == txt.ADD for line in arg]
+    assert added == ['Line 2\n', 'Line four']
+
+
+def test_delta_from_empty():
+    assert txt.apply_delta('', txt.make_delta('', NEW_PAGE)) == NEW_PAGE
+
+
+def test_versions(temp_text):
+    txt.update(temp_text, TEST_TITLE, OLD_PAGE)
+    txt.update(temp_text, TEST_TITLE, NEW_PAGE)
+    versions = txt.read_versions(temp_text)
+    assert [version[txt.VERSION] for version in versions] == [1, 2, 3]
+    assert versions[0][txt.TITLE] == TEMP_TITLE
+    assert txt.read_one(temp_text)[txt.VERSION] == 3
+
+
+def test_read_version(temp_text):
+    txt.update(temp_text, TEST_TITLE, OLD_PAGE)
+    txt.update(temp_text, TEST_TITLE, NEW_PAGE)
+    assert txt.read_version(temp_text, 1)[txt.TEXT] == TEMP_TEXT
+    assert txt.read_version(temp_text, 2)[txt.TEXT] == OLD_PAGE
+    page = txt.read_version(temp_text, 3)
+    assert page[txt.TEXT] == NEW_PAGE
+    assert page[txt.TITLE] == TEST_TITLE
+
+
+def test_read_version_not_there(temp_text):
+    assert txt.read_version(temp_text, 0) is None
+    assert txt.read_version(temp_text, 2) is None
+    assert txt.read_version('Not an existing page number!', 1) is None
+
+
+def test_read_versions_not_there():
+    assert txt.read_versions('Not an existing page number!') is None
+
+
+def test_versions_snapshot(temp_text):
+    with patch.object(txt, 'SNAPSHOT_EVERY', 3):
+        for i in range(2, 8):
+            txt.update(temp_text, TEST_TITLE, f'{OLD_PAGE}Edit {i}\n')
+        stored = list(dbc.read_iter(txt.TEXT_VERSIONS_COLLECT,
+                                    {txt.PAGE_NUMBER: temp_text},
+                                    keys=[txt.VERSION]))
+        assert [txt.SNAPSHOT in version for version in stored] == [
+            True, False, False, True, False, False, True]
+        for i in range(2, 8):
+            assert (txt.read_version(temp_text, i)[txt.TEXT]
+                    == f'{OLD_PAGE}Edit {i}\n')
+
+
+def test_update_page_without_versions():
+    # written before we kept versions
+    dbc.get_backend().insert_one(
+        dbc.JOURNAL_DB, txt.TEXT_COLLECT,
+        {txt.PAGE_NUMBER: TEST_PAGE, txt.TITLE: TEST_TITLE,
+         txt.TEXT: OLD_PAGE})
+    try:
+        txt.update(TEST_PAGE, TEST_TITLE, NEW_PAGE)
+        assert txt.read_version(TEST_PAGE, 1)[txt.TEXT] == OLD_PAGE
+        assert txt.read_version(TEST_PAGE, 2)[txt.TEXT] == NEW_PAGE
+    finally:
+        txt.delete(TEST_PAGE)
+
+
+def test_update_over_orphaned_version(temp_text):
+    # claimed by an update that never got to change the page
+    txt.store_version(temp_text, 2, 'Orphan', 'Orphaned text',
+                      old_text=TEMP_TEXT)
+    txt.update(temp_text, TEST_TITLE, NEW_PAGE)
+    assert txt.read_one(temp_text)[txt.VERSION] == 2
+    assert txt.read_version(temp_text, 2)[txt.TEXT] == NEW_PAGE
+    txt.update(temp_text, TEST_TITLE, OLD_PAGE)
+    assert txt.read_version(temp_text, 3)[txt.TEXT] == OLD_PAGE
+
+
+def test_update_interrupted(temp_text):
+    with patch('data.db_connect.replace', autospec=True,
+               side_effect=ConnectionError('gone')):
+        with pytest.raises(ConnectionError):
+            txt.update(temp_text, TEST_TITLE, OLD_PAGE)
+    # the page changed, and the next update stores its version
+    assert txt.read_one(temp_text)[txt.TEXT] == OLD_PAGE
+    txt.update(temp_text, TEST_TITLE, NEW_PAGE)
+    assert txt.read_version(temp_text, 2)[txt.TEXT] == OLD_PAGE
+    assert txt.read_version(temp_text, 3)[txt.TEXT] == NEW_PAGE
+    assert txt.PENDING not in txt.read_one(temp_text)
+
+
+def test_read_pending_version(temp_text):
+    with patch('data.db_connect.replace', autospec=True,
+               side_effect=ConnectionError('gone')):
+        with pytest.raises(ConnectionError):
+            txt.update(temp_text, TEST_TITLE, OLD_PAGE)
+    assert txt.read_one(temp_text)[txt.PENDING]
+    versions = txt.read_versions(temp_text)
+    assert [version[txt.VERSION] for version in versions] == [1, 2]
+    assert versions[1][txt.TITLE] == TEST_TITLE
+    page = txt.read_version(temp_text, 2)
+    assert page[txt.TEXT] == OLD_PAGE
+    assert page[txt.TITLE] == TEST_TITLE
+    assert txt.read_version(temp_text, 1)[txt.TEXT] == TEMP_TEXT
+
+
+def test_update_changed_under_us(temp_text):
+    real_update = dbc.find_one_and_update
+    raced = []
+
+    def other_update_first(*args, **kwargs):
+        if not raced:
+            raced.append(True)
+            txt.update(temp_text, 'Other', OLD_PAGE)
+        return real_update(*args, **kwargs)
+
+    with patch('data.db_connect.find_one_and_update',
+               side_effect=other_update_first):
+        txt.update(temp_text, TEST_TITLE, NEW_PAGE)
+    assert txt.read_version(temp_text, 2)[txt.TEXT] == OLD_PAGE
+    assert txt.read_version(temp_text, 3)[txt.TEXT] == NEW_PAGE
+
+
+def test_delete_drops_versions(temp_text):
+    txt.update(temp_text, TEST_TITLE, OLD_PAGE)
+    txt.delete(temp_text)
+    assert list(dbc.read_iter(txt.TEXT_VERSIONS_COLLECT,
+                              {txt.PAGE_NUMBER: temp_text})) == []
@@ -2,38 +2,87 @@
 This module interfaces to our user data.
 """
 
+import difflib
+import time
+
 import data.db_connect as dbc
+import data.logs as logs
+
+log = logs.get_logger(__name__)
 
 TEXT_COLLECT = 'texts'
+# every version of every page, mostly as diffs
+TEXT_VERSIONS_COLLECT = 'text_versions'
 
 # fields
 PAGE_NUMBER = 'pageNumber'
 TITLE = 'title'
 TEXT = 'text'
+VERSION = 'version'  # the page's latest, counting from 1
+# The version record of the page's latest change until it is stored in
+# TEXT_VERSIONS_COLLECT; a snapshot's text is the page's own.
+PENDING = 'pending_version'
+
+# version fields (also PAGE_NUMBER, TITLE and VERSION)
+SNAPSHOT = 'snapshot'  # the full text
+DELTA = 'delta'  # or the edits to the previous version's text
+CREATED_AT = 'created_at'  # seconds since the epoch
+VERSION_LIST_FIELDS = [VERSION, TITLE, CREATED_AT]
+
+# delta ops
+KEEP = '='
+DROP = '-'
+ADD = '+'
 
-client = dbc.connect_db()
-print(f'{client=}')
+# Every SNAPSHOT_EVERY versions one is stored whole, so rebuilding a
+# version never applies more than SNAPSHOT_EVERY - 1 deltas.
+SNAPSHOT_EVERY = 10
 
+# How often update() retries when the page changed under it.
+MAX_UPDATE_TRIES = 3
 
-def read():
+dbc.add_index(TEXT_COLLECT, PAGE_NUMBER, unique=True)
+# page bodies dominate our storage and network bytes
+dbc.compress_field(TEXT_COLLECT, TEXT)
+dbc.add_index(TEXT_VERSIONS_COLLECT,
+              [(PAGE_NUMBER, dbc.ASCENDING), (VERSION, dbc.ASCENDING)],
+              unique=True)
+dbc.compress_field(TEXT_VERSIONS_COLLECT, SNAPSHOT)
+
+
+def read(fields: list = None):
     """
     Our contract:
-        - No arguments.
+        - Optionally, the list of fields to fetch (all if None).
         - Returns a dictionary of users page_number on user email.
         - Each user email must be the page_number for another dictionary.
     """
-    text = dbc.read_dict(TEXT_COLLECT, PAGE_NUMBER)
+    text = dbc.read_dict(TEXT_COLLECT, PAGE_NUMBER, fields=fields)
     return text
 
 
-def read_one(page_number: str) -> dict:
+def read_iter(limit: int = 0, skip: int = 0, after: str = None,
+              fields: list = None):
+    """
+    Yield text pages one at a time in page number order.
+    Pass the last page number seen as `after` to resume from there.
+    Only `fields` (plus page number) are fetched if given.
+    """
+    return dbc.read_iter(TEXT_COLLECT, limit=limit, skip=skip,
+                         keys=[PAGE_NUMBER],
+                         after=None if after is None else [after],
+                         fields=fields)
+
+
+def read_one(page_number: str, fields: list = None) -> dict:
     # This should take a page number and return the page dictionary
     # for that page number. Return an empty dictionary of number not found.
-    return dbc.read_one(TEXT_COLLECT, {PAGE_NUMBER: page_number})
+    return dbc.read_one(TEXT_COLLECT, {PAGE_NUMBER: page_number},
+                        fields=fields)
 
 
 def exists(page_number: str) -> bool:
-    return read_one(page_number) is not None
+    return read_one(page_number, fields=[PAGE_NUMBER]) is not None
 
 
 def is_valid_text(page_number: str, title: str, text: str):
@@ -46,24 +95,231 @@ def is_valid_text(page_number: str, title: str, text: str):
     return True
 
 
+def make_delta(old: str, new: str) -> list:
+    """
+    The line edits turning old into new, as ops:
+        [KEEP, n] copies the next n old lines,
+        [DROP, n] skips them,
+        [ADD, lines] inserts lines.
+    """
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    delta = []
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines,
+                                      autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            delta.append([KEEP, i2 - i1])
+            continue
+        if i2 > i1:
+            delta.append([DROP, i2 - i1])
+        if j2 > j1:
+            delta.append([ADD, new_lines[j1:j2]])
+    return delta
+
+
+def apply_delta(old: str, delta: list) -> str:
+    old_lines = old.splitlines(keepends=True)
+    new_lines = []
+    pos = 0
+    for op, arg in delta:
+        if op == KEEP:
+            new_lines.extend(old_lines[pos:pos + arg])
+            pos += arg
+        elif op == DROP:
+            pos += arg
+        else:
+            new_lines.extend(arg)
+    return ''.join(new_lines)
+
+
+def is_snapshot(version: int) -> bool:
+    return (version - 1) % SNAPSHOT_EVERY == 0
+
+
+def make_version(page_number: str, version: int, title: str, text: str,
+                 old_text: str = None) -> dict:
+    """
+    Version of the page: whole if it is due a snapshot,
+    else as a delta from old_text, the previous version's text.
+    """
+    doc = {PAGE_NUMBER: page_number, VERSION: version, TITLE: title,
+           CREATED_AT: time.time()}
+    if is_snapshot(version):
+        doc[SNAPSHOT] = text
+    else:
+        doc[DELTA] = make_delta(old_text, text)
+    return doc
+
+
+def store_version(page_number: str, version: int, title: str, text: str,
+                  old_text: str = None):
+    """
+    Raises DuplicateKeyError if that version is stored already.
+    """
+    dbc.create(TEXT_VERSIONS_COLLECT,
+               make_version(page_number, version, title, text, old_text))
+
+
+def make_pending(version: dict) -> dict:
+    """
+    What the page keeps of version until it is stored.
+    """
+    if SNAPSHOT in version:
+        version = {**version, SNAPSHOT: None}
+    return version
+
+
+def store_pending(page: dict):
+    """
+    Store the version the page is waiting on, if any, replacing
+    whatever an interrupted update left under its number.
+    """
+    pending = page.get(PENDING)
+    if not pending:
+        return
+    version = dict(pending)
+    if SNAPSHOT in version:
+        version[SNAPSHOT] = page[TEXT]
+    dbc.replace(TEXT_VERSIONS_COLLECT,
+                {PAGE_NUMBER: version[PAGE_NUMBER],
+                 VERSION: version[VERSION]}, version)
+    dbc.unset(TEXT_COLLECT, {PAGE_NUMBER: version[PAGE_NUMBER],
+                             VERSION: version[VERSION]}, [PENDING])
+
+
+def store_legacy_version(page: dict):
+    """
+    Store a page from before we kept versions as its version 1.
+    Whoever stores it first, it is the same.
+    """
+    try:
+        store_version(page[PAGE_NUMBER], 1, page[TITLE], page[TEXT])
+    except dbc.DuplicateKeyError:
+        pass
+
+
+def read_pending(page_number: str, fields: list = None) -> dict:
+    """
+    The page (its PENDING and fields) if there is one, with PENDING
+    None unless a version is still waiting to be stored.
+    """
+    page = read_one(page_number, fields=[PENDING] + (fields or []))
+    if page is not None:
+        page.setdefault(PENDING, None)
+    return page
+
+
+def read_versions(page_number: str) -> list:
+    """
+    The page's versions, oldest first, each with its number, title
+    and when it was made. None if there is no such page.
+    A version not stored yet is listed from the page.
+    """
+    page = read_pending(page_number)
+    if page is None:
+        return None
+    versions = list(dbc.read_iter(TEXT_VERSIONS_COLLECT,
+                                  {PAGE_NUMBER: page_number},
+                                  keys=[VERSION], fields=VERSION_LIST_FIELDS))
+    pending = page[PENDING]
+    if pending:
+        # anything stored under its number was left by an interrupted
+        # update; the page's record wins, as it will when stored
+        versions = [version for version in versions
+                    if version[VERSION] < pending[VERSION]]
+        versions.append({field: pending[field]
+                         for field in VERSION_LIST_FIELDS})
+    return versions
+
+
+def read_version(page_number: str, version: int) -> dict:
+    """
+    The page as it was at version, rebuilt from the snapshot at or
+    before it and the deltas since. None if there is no such version.
+    A version not stored yet is the page itself.
+    """
+    if version < 1:
+        return None
+    page = read_pending(page_number, fields=[TEXT])
+    pending = page and page[PENDING]
+    if pending and pending[VERSION] == version:
+        current = {field: value for field, value in pending.items()
+                   if field not in (SNAPSHOT, DELTA)}
+        current[TEXT] = page[TEXT]
+        return current
+    first = version - (version - 1) % SNAPSHOT_EVERY
+    text = None
+    page = None
+    for page in dbc.read_iter(TEXT_VERSIONS_COLLECT,
+                              {PAGE_NUMBER: page_number,
+                               VERSION: {'$gte': first, '$lte': version}},
+                              keys=[VERSION]):
+        if SNAPSHOT in page:
+            text = page.pop(SNAPSHOT)
+        else:
+            text = apply_delta(text, page.pop(DELTA))
+    if page is None or page[VERSION] != version:
+        return None
+    page[TEXT] = text
+    return page
+
+
 def delete(page_number: str):
     del_num = dbc.delete(TEXT_COLLECT, {PAGE_NUMBER: page_number})
-    return page_number if del_num == 1 else None
+    if del_num != 1:
+        return None
+    dbc.delete_many(TEXT_VERSIONS_COLLECT, {PAGE_NUMBER: page_number})
+    return page_number
 
 
 def create(page_number: str, title: str, text: str):
-    if exists(page_number):
-        raise ValueError(f'Adding duplicate {page_number=}')
     if is_valid_text(page_number, title, text):
-        new_text = {PAGE_NUMBER: page_number, TITLE: title, TEXT: text}
-        dbc.create(TEXT_COLLECT, new_text)
+        new_text = {PAGE_NUMBER: page_number, TITLE: title, TEXT: text,
+                    VERSION: 1,
+                    PENDING: make_pending(
+                        make_version(page_number, 1, title, text))}
+        try:
+            dbc.create(TEXT_COLLECT, new_text)
+        except dbc.DuplicateKeyError:
+            raise ValueError(f'Adding duplicate {page_number=}')
+        # clear any history a half finished delete left behind
+        dbc.delete_many(TEXT_VERSIONS_COLLECT, {PAGE_NUMBER: page_number})
+        store_pending(new_text)
         return page_number
 
 
 def update(page_number: str, title: str, text: str):
-    if not exists(page_number):
-        raise ValueError(f'Updating non-existent page: {page_number=}')
+    """
+    Replace the page's title and text, keeping the old ones as a
+    version. A compare-and-set on the page's version, so of two
+    concurrent updates one retries on top of the other.
+    The new version's record rides along on the page and is stored
+    right after; if that is interrupted, the next update stores it.
+    """
     if is_valid_text(page_number, title, text):
-        dbc.update(TEXT_COLLECT, {PAGE_NUMBER: page_number},
-                   {TITLE: title, TEXT: text})
-        return page_number
+        for _ in range(MAX_UPDATE_TRIES):
+            page = read_one(page_number,
+                            fields=[PAGE_NUMBER, TITLE, TEXT, VERSION,
+                                    PENDING])
+            if page is None:
+                raise ValueError(
+                    f'Updating non-existent page: {page_number=}')
+            store_pending(page)
+            version = page.get(VERSION)
+            if version is None:
+                # from before we kept versions: it becomes the first
+                store_legacy_version(page)
+            new_version = make_version(page_number, (version or 1) + 1,
+                                       title, text, old_text=page[TEXT])
+            updated = dbc.find_one_and_update(
+                TEXT_COLLECT, {PAGE_NUMBER: page_number, VERSION: version},
+                {TITLE: title, TEXT: text, VERSION: new_version[VERSION],
+                 PENDING: make_pending(new_version)})
+            if updated is None:
+                log.debug('%s changed under us; retrying', page_number)
+                dbc.invalidate(TEXT_COLLECT, {PAGE_NUMBER: page_number})
+                continue
+            store_pending(updated)
+            return page_number
+        raise ValueError(f'{page_number=} kept changing; not updated')
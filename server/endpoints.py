@@ -2,21 +2,48 @@
 This is the file containing all of the endpoints for our flask app.
 The endpoint called `endpoints` will return all available endpoints.
 """
+import base64
+import binascii
+import json
+import logging
+import os
+import time
+from collections import ChainMap
 from http import HTTPStatus
 
-from flask import Flask, request
+from flask import (Flask, Response, current_app, g, has_request_context,
+                   request, stream_with_context)
 from flask_restx import Resource, Api, fields  # Namespace, fields
 from flask_cors import CORS
 
 import werkzeug.exceptions as wz
 
+import data.db_connect as dbc
+import data.logs as logs
 import data.people as ppl
 import data.text as txt
 import data.manuscript as ms
+import data.suggest as sgst
 
-app = Flask(__name__)
-CORS(app)
-api = Api(app)
+log = logs.get_logger(__name__)
+
+# The routes are registered on api; create_app() puts them on an app.
+api = Api()
+
+
+def request_identity_map():
+    """
+    Each request gets its own identity map, so one API call never
+    looks up the same record twice.
+    """
+    if not has_request_context():
+        return None
+    if 'identity_map' not in g:
+        g.identity_map = {}
+    return g.identity_map
+
+
+dbc.set_identity_map_provider(request_identity_map)
 
 ENDPOINT_EP = '/endpoints'
 ENDPOINT_RESP = 'Available endpoints'
@@ -46,6 +73,86 @@ ROLE = 'role'
 
 MANUSCRIPT_EP = '/manuscript'
 
+# query params for list endpoints
+LIMIT = 'limit'
+SKIP = 'skip'
+AFTER = 'after'
+FIELDS = 'fields'
+QUERY = 'q'
+REVISION = 'revision'
+
+
+def get_int_arg(name: str, default: int = 0) -> int:
+    value = request.args.get(name, default)
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise wz.BadRequest(f'{name} must be an integer: {value}')
+    if value < 0:
+        raise wz.BadRequest(f'{name} can not be negative: {value}')
+    return value
+
+
+def get_fields_arg() -> list:
+    """
+    Parse a comma separated `fields` query param, e.g.
+    `?fields=title,state,author`. None means all fields.
+    """
+    value = request.args.get(FIELDS)
+    if not value:
+        return None
+    return [field.strip() for field in value.split(',') if field.strip()]
+
+
+def get_list_args() -> dict:
+    """
+    Paging and projection args shared by the list endpoints.
+    """
+    return {
+        LIMIT: get_int_arg(LIMIT),
+        SKIP: get_int_arg(SKIP),
+        AFTER: request.args.get(AFTER),
+        FIELDS: get_fields_arg(),
+    }
+
+
+def encode_cursor(after: list) -> str:
+    """
+    Turn the keyset `after` of a page into an opaque, URL safe token.
+    """
+    if after is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(after).encode()).decode()
+
+
+def decode_cursor(token: str) -> list:
+    if not token:
+        return None
+    try:
+        after = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except (binascii.Error, ValueError):
+        raise wz.BadRequest(f'Bad {AFTER} cursor: {token}')
+    if (not isinstance(after, list)
+            or not all(isinstance(value, dbc.SCALARS) for value in after)):
+        raise wz.BadRequest(f'Bad {AFTER} cursor: {token}')
+    return after
+
+
+def stream_dict(recs, key: str) -> Response:
+    """
+    Stream records out as one JSON object keyed on `key`,
+    serializing one record at a time instead of building the dict.
+    """
+    def generate():
+        yield '{'
+        sep = ''
+        for rec in recs:
+            yield f'{sep}{json.dumps(rec[key])}: {json.dumps(rec)}'
+            sep = ', '
+        yield '}\n'
+    return Response(stream_with_context(generate()),
+                    mimetype='application/json')
+
 
 @api.route(HELLO_EP)
 class HelloWorld(Resource):
@@ -70,7 +177,8 @@ class Endpoints(Resource):
         """
         The `get()` method will return a sorted list of available endpoints.
         """
-        endpoints = sorted(rule.rule for rule in api.app.url_map.iter_rules())
+        endpoints = sorted(rule.rule
+                           for rule in current_app.url_map.iter_rules())
         return {"Available endpoints": endpoints}
 
 
@@ -98,9 +206,11 @@ class People(Resource):
     """
     def get(self):
         """
-        Retrieve the journal people.
+        Retrieve the journal people, keyed on email.
+        Supports `limit`, `skip`, `after` (the last email seen)
+        and `fields`, e.g. `?fields=name,affiliation`.
         """
-        return ppl.read()
+        return stream_dict(ppl.read_iter(**get_list_args()), ppl.EMAIL)
 
 
 @api.route(f'{PEOPLE_EP}/<email>')
@@ -131,6 +241,33 @@ class Person(Resource):
             raise wz.NotFound(f'No such person: {email}')
 
 
+SUGGESTIONS_RESP = 'suggestions'
+
+
+@api.route(f'{PEOPLE_EP}/suggest')
+class PeopleSuggest(Resource):
+    """
+    Autocomplete for picking people, e.g. referees.
+    """
+    @api.response(HTTPStatus.OK, 'Success.')
+    @api.response(HTTPStatus.BAD_REQUEST, 'Bad request.')
+    @api.doc(params={QUERY: 'What has been typed so far',
+                     LIMIT: 'How many suggestions at most'})
+    def get(self):
+        """
+        People and manuscript authors whose name or affiliation is close
+        to `q`, closest first. Tolerates typos and partial words.
+        """
+        query = request.args.get(QUERY, '')
+        limit = get_int_arg(LIMIT, sgst.SUGGEST_LIMIT)
+        try:
+            suggestions = (ppl.suggest(query, limit=limit)
+                           + ms.suggest_authors(query, limit=limit))
+        except ValueError as err:
+            raise wz.BadRequest(f'{err}')
+        return {SUGGESTIONS_RESP: sgst.merge(suggestions, ppl.EMAIL, limit)}
+
+
 PEOPLE_CREATE_FLDS = api.model('AddNewPeopleEntry', {
     ppl.NAME: fields.String,
     ppl.EMAIL: fields.String,
@@ -260,9 +397,12 @@ class Texts(Resource):
     """
     def get(self):
         """
-        Retrieve the journal text.
+        Retrieve the journal text, keyed on page number.
+        Supports `limit`, `skip`, `after` (the last page number seen)
+        and `fields`, e.g. `?fields=title`.
         """
-        return txt.read()
+        return stream_dict(txt.read_iter(**get_list_args()),
+                           txt.PAGE_NUMBER)
 
 
 TEXT_FLDS = api.model('TextEntry', {
@@ -326,6 +466,44 @@ class Text(Resource):
             raise wz.NotFound(f'No such text: {page_number}')
 
 
+VERSIONS_RESP = 'versions'
+
+
+@api.route(f'{TEXT_EP}/<page_number>/versions')
+class TextVersions(Resource):
+    """
+    A text page's history.
+    """
+    @api.response(HTTPStatus.OK, 'Success.')
+    @api.response(HTTPStatus.NOT_FOUND, 'No such page.')
+    def get(self, page_number):
+        """
+        The page's versions, oldest first: each one's number, title
+        and when it was made.
+        """
+        versions = txt.read_versions(page_number)
+        if versions is None:
+            raise wz.NotFound(f'No such page: {page_number}')
+        return {VERSIONS_RESP: versions}
+
+
+@api.route(f'{TEXT_EP}/<page_number>/versions/<int:version>')
+class TextVersion(Resource):
+    """
+    A text page as it was.
+    """
+    @api.response(HTTPStatus.OK, 'Success.')
+    @api.response(HTTPStatus.NOT_FOUND, 'No such version.')
+    def get(self, page_number, version):
+        """
+        The page's title and text at a version.
+        """
+        page = txt.read_version(page_number, version)
+        if page is None:
+            raise wz.NotFound(f'No such version: {page_number} {version}')
+        return page
+
+
 @api.route(f'{TEXT_EP}/update')
 class TextUpdate(Resource):
     """
@@ -375,9 +553,11 @@ class Manuscripts(Resource):
     """
     def get(self):
         """
-        Retrieve all manuscripts.
+        Retrieve all manuscripts, keyed on title.
+        Supports `limit`, `skip`, `after` (the last title seen)
+        and `fields`, e.g. `?fields=title,state,author`.
         """
-        return ms.read()
+        return stream_dict(ms.read_iter(**get_list_args()), ms.TITLE)
 
 
 @api.route(f'{MANUSCRIPT_EP}/<title>')
@@ -408,6 +588,136 @@ class Manuscript(Resource):
             raise wz.NotFound(f'No such manuscript: {title}')
 
 
+@api.route(f'{MANUSCRIPT_EP}/<title>/text')
+class ManuscriptText(Resource):
+    """
+    A manuscript's body, streamed in and out.
+    """
+    @api.response(HTTPStatus.OK, 'Success.')
+    @api.response(HTTPStatus.PARTIAL_CONTENT, 'Part of the body.')
+    @api.response(HTTPStatus.NOT_FOUND, 'No such manuscript.')
+    @api.response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE,
+                  'Range not satisfiable.')
+    @api.doc(params={REVISION: 'The hash of an earlier revision'})
+    def get(self, title):
+        """
+        Download the body as UTF-8 text, one chunk at a time.
+        A single `Range: bytes=...` header gets just those bytes.
+        Pass `revision` (a hash) for an earlier body.
+        """
+        opened = ms.open_text(title, request.args.get(REVISION))
+        if opened is None:
+            raise wz.NotFound(f'No such manuscript or revision: {title}')
+        length, read = opened
+        start, stop = 0, length
+        status = HTTPStatus.OK
+        if request.range is not None:
+            byte_range = request.range.range_for_length(length)
+            if byte_range is None:
+                raise wz.RequestedRangeNotSatisfiable(length=length)
+            start, stop = byte_range
+            status = HTTPStatus.PARTIAL_CONTENT
+        resp = Response(stream_with_context(read(start, stop)),
+                        status=status, mimetype='text/plain')
+        resp.headers['Accept-Ranges'] = 'bytes'
+        resp.content_length = stop - start
+        if status == HTTPStatus.PARTIAL_CONTENT:
+            resp.headers['Content-Range'] = (f'bytes {start}-{stop - 1}'
+                                             f'/{length}')
+        return resp
+
+    @api.response(HTTPStatus.OK, 'Success.')
+    @api.response(HTTPStatus.BAD_REQUEST, 'Upload cut short.')
+    @api.response(HTTPStatus.NOT_ACCEPTABLE, 'Not acceptable.')
+    @api.response(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, 'Too large.')
+    def put(self, title):
+        """
+        Upload the body as the raw request body (not JSON, not empty),
+        stored as it arrives. It replaces the manuscript's text.
+        """
+        if (request.content_length or 0) > ms.MAX_TEXT_SIZE:
+            raise wz.RequestEntityTooLarge(
+                f'Text is over {ms.MAX_TEXT_SIZE} bytes')
+        try:
+            ret = ms.upload_text(title, request.stream)
+        except ValueError as err:
+            raise wz.NotAcceptable(f'Could not upload text: {err}')
+        except OSError as err:
+            raise wz.BadRequest(f'Upload cut short: {err}')
+        return {
+            MESSAGE: f'{title} text uploaded!',
+            RETURN: ret,
+        }
+
+
+EVENTS_RESP = 'events'
+
+
+@api.route(f'{MANUSCRIPT_EP}/<title>/history')
+class ManuscriptHistory(Resource):
+    """
+    A manuscript's state changes.
+    """
+    @api.response(HTTPStatus.OK, 'Success.')
+    @api.response(HTTPStatus.BAD_REQUEST, 'Bad request.')
+    @api.response(HTTPStatus.NOT_FOUND, 'No such manuscript.')
+    @api.doc(params={AFTER: 'The cursor from the previous page'})
+    def get(self, title):
+        """
+        The manuscript's state changes, oldest first, one page at a
+        time: each one's time, state, action and actor. Pass the
+        returned `after` to get the next page; it is null on the last.
+        """
+        after = decode_cursor(request.args.get(AFTER))
+        try:
+            page = ms.read_history(title, after=after)
+        except ValueError as err:
+            raise wz.BadRequest(f'{err}')
+        if page is None:
+            raise wz.NotFound(f'No such manuscript: {title}')
+        events, after = page
+        return {EVENTS_RESP: events, AFTER: encode_cursor(after)}
+
+
+@api.route(f'{MANUSCRIPT_EP}/<title>/revisions')
+class ManuscriptRevisions(Resource):
+    """
+    Every abstract and body a manuscript has had.
+    """
+    @api.response(HTTPStatus.OK, 'Success.')
+    @api.response(HTTPStatus.NOT_FOUND, 'No such manuscript.')
+    def get(self, title):
+        """
+        The manuscript's revisions, oldest first: each one's hash,
+        body length and when it was first stored.
+        """
+        revisions = ms.read_revisions(title)
+        if revisions is None:
+            raise wz.NotFound(f'No such manuscript: {title}')
+        return {ms.REVISIONS: revisions}
+
+
+@api.route(f'{MANUSCRIPT_EP}/<title>/revisions/<rev_hash>')
+class ManuscriptRevision(Resource):
+    """
+    One revision of a manuscript.
+    """
+    @api.response(HTTPStatus.OK, 'Success.')
+    @api.response(HTTPStatus.NOT_FOUND, 'No such revision.')
+    def get(self, title, rev_hash):
+        """
+        A revision's abstract and, unless it was uploaded, its text.
+        Stream the text of any revision from
+        `/manuscript/<title>/text?revision=<hash>`.
+        """
+        revision = ms.read_revision(title, rev_hash,
+                                    fields=ms.REVISION_LIST_FIELDS
+                                    + [ms.ABSTRACT, ms.TEXT])
+        if revision is None:
+            raise wz.NotFound(f'No such revision: {rev_hash}')
+        return revision
+
+
 MANUSCRIPT_FLDS = api.model('ManuscriptEntry', {
     ms.TITLE: fields.String,
     ms.AUTHOR: fields.String,
@@ -448,6 +758,169 @@ class ManuscriptCreate(Resource):
         }
 
 
+MANUSCRIPTS_RESP = 'manuscripts'
+
+
+@api.route(f'{MANUSCRIPT_EP}/queue')
+class ManuscriptQueue(Resource):
+    """
+    An editor's work queue.
+    """
+    @api.response(HTTPStatus.OK, 'Success.')
+    @api.response(HTTPStatus.BAD_REQUEST, 'Bad request.')
+    @api.doc(params={ms.EDITOR_EMAIL: 'The editor',
+                     ms.STATE: 'The manuscript state',
+                     AFTER: 'The cursor from the previous page'})
+    def get(self):
+        """
+        The editor's manuscripts in a state, oldest submission first,
+        one page at a time. Pass the returned `after` to get the next
+        page; it is null on the last one.
+        """
+        editor_email = request.args.get(ms.EDITOR_EMAIL)
+        state = request.args.get(ms.STATE)
+        if not editor_email or not state:
+            raise wz.BadRequest(f'{ms.EDITOR_EMAIL} and {ms.STATE} '
+                                'are required')
+        after = decode_cursor(request.args.get(AFTER))
+        try:
+            manus, after = ms.read_queue(editor_email, state, after=after)
+        except ValueError as err:
+            raise wz.BadRequest(f'{err}')
+        return {MANUSCRIPTS_RESP: manus, AFTER: encode_cursor(after)}
+
+
+@api.route(f'{MANUSCRIPT_EP}/search')
+class ManuscriptSearch(Resource):
+    """
+    Full-text search over manuscripts.
+    """
+    @api.response(HTTPStatus.OK, 'Success.')
+    @api.response(HTTPStatus.BAD_REQUEST, 'Bad request.')
+    @api.doc(params={QUERY: 'What to search for',
+                     LIMIT: 'How many results at most'})
+    def get(self):
+        """
+        Search manuscript titles, abstracts and texts.
+        Results come best first, with a relevance score and a snippet.
+        """
+        query = request.args.get(QUERY, '')
+        limit = get_int_arg(LIMIT, ms.SEARCH_LIMIT)
+        try:
+            results = ms.search(query, limit=limit)
+        except ValueError as err:
+            raise wz.BadRequest(f'{err}')
+        return {MANUSCRIPTS_RESP: results}
+
+
+@api.route(f'{MANUSCRIPT_EP}/stats')
+class ManuscriptStats(Resource):
+    """
+    Turnaround statistics over every manuscript's history.
+    """
+    @api.response(HTTPStatus.OK, 'Success.')
+    def get(self):
+        """
+        Days spent in each state (median and 90th percentile), how many
+        manuscripts reached each state, and per editor throughput.
+        """
+        # numpy is slow to import and only needed here
+        import data.analytics as anl
+        return anl.get_stats()
+
+
+@api.route(f'{MANUSCRIPT_EP}/by_referee/<email>')
+class ManuscriptsByReferee(Resource):
+    """
+    A referee's assignments.
+    """
+    @api.response(HTTPStatus.OK, 'Success.')
+    @api.response(HTTPStatus.BAD_REQUEST, 'Bad request.')
+    @api.doc(params={AFTER: 'The cursor from the previous page',
+                     FIELDS: 'Comma separated fields to return'})
+    def get(self, email):
+        """
+        The manuscripts assigned to a referee, in title order,
+        one page at a time. Pass the returned `after` to get the next
+        page; it is null on the last one.
+        """
+        after = decode_cursor(request.args.get(AFTER))
+        try:
+            manus, after = ms.read_by_referee(email, after=after,
+                                              fields=get_fields_arg())
+        except ValueError as err:
+            raise wz.BadRequest(f'{err}')
+        return {MANUSCRIPTS_RESP: manus, AFTER: encode_cursor(after)}
+
+
+MANUSCRIPT_ACTION_FLDS = api.model('ManuscriptAction', {
+    ms.TITLE: fields.String,
+    ms.ACTION: fields.String,
+    ms.REFEREE: fields.String,
+    ms.ACTOR: fields.String,
+})
+
+
+@api.route(f'{MANUSCRIPT_EP}/receive_action')
+class ReceiveAction(Resource):
+    """
+    Move a manuscript through its workflow.
+    """
+    @api.response(HTTPStatus.OK, 'Success.')
+    @api.response(HTTPStatus.NOT_ACCEPTABLE, 'Not acceptable.')
+    @api.expect(MANUSCRIPT_ACTION_FLDS)
+    def put(self):
+        """
+        Apply an action to a manuscript and return the updated record.
+        """
+        try:
+            title = request.json.get(ms.TITLE)
+            action = request.json.get(ms.ACTION)
+            referee = request.json.get(ms.REFEREE)
+            actor = request.json.get(ms.ACTOR)
+            ret = ms.apply_action(title, action, actor=actor, ref=referee)
+        except Exception as err:
+            raise wz.NotAcceptable(f'Could not apply action: '
+                                   f'{err=}')
+        return {
+            MESSAGE: f'{action} applied to {title}!',
+            RETURN: ret,
+        }
+
+
+MANUSCRIPT_BULK_ACTION_FLDS = api.model('ManuscriptBulkAction', {
+    ms.ACTIONS: fields.List(fields.Nested(MANUSCRIPT_ACTION_FLDS)),
+})
+
+
+@api.route(f'{MANUSCRIPT_EP}/bulk_action')
+class BulkAction(Resource):
+    """
+    Move many manuscripts through their workflow at once.
+    """
+    @api.response(HTTPStatus.OK, 'Success.')
+    @api.response(HTTPStatus.NOT_ACCEPTABLE, 'Not acceptable.')
+    @api.expect(MANUSCRIPT_BULK_ACTION_FLDS)
+    def put(self):
+        """
+        Apply a list of actions in one go.
+        The result reports, per action, whether it was applied.
+        """
+        try:
+            actions = request.json.get(ms.ACTIONS)
+            if not isinstance(actions, list):
+                raise ValueError(f'{ms.ACTIONS} must be a list')
+            ret = ms.apply_actions(actions)
+        except Exception as err:
+            raise wz.NotAcceptable(f'Could not apply actions: '
+                                   f'{err=}')
+        return {
+            MESSAGE: f'{sum(res[ms.OK] for res in ret)} of {len(ret)} '
+                     'actions applied!',
+            RETURN: ret,
+        }
+
+
 @api.route(f'{MANUSCRIPT_EP}/update')
 class ManuscriptUpdate(Resource):
     """
@@ -476,3 +949,47 @@ class ManuscriptUpdate(Resource):
             MESSAGE: f'{title} updated!',
             RETURN: ret,
         }
+
+
+def start_timer():
+    g.start = time.perf_counter()
+
+
+def log_request(response: Response) -> Response:
+    """
+    One DEBUG record per request: sample it (LOG_SAMPLE_EVERY) if that
+    is too many.
+    """
+    if log.isEnabledFor(logging.DEBUG) and 'start' in g:
+        log.debug('%s %s %s', request.method, request.path,
+                  response.status_code,
+                  extra={'method': request.method, 'path': request.path,
+                         'status': response.status_code,
+                         'ms': (time.perf_counter() - g.start) * 1000})
+    return response
+
+
+def create_app(config: dict = None) -> Flask:
+    """
+    Build the app, with `config` added to its Flask config.
+    Nothing connects to the DB until a request needs it.
+    The DB pool is sized by config's DB_MAX_POOL_SIZE, DB_MIN_POOL_SIZE
+    and DB_MAX_IDLE_TIME_MS, if set; the client is rebuilt in each
+    worker forked from a preloaded app.
+    Logging is set up from config's LOG_* keys, or the environment's
+    (see data.logs).
+    """
+    app = Flask(__name__)
+    app.config.update(config or {})
+    logs.setup(ChainMap(app.config, os.environ))
+    pool_settings = dbc.pool_settings(app.config)
+    if pool_settings:
+        dbc.set_pool_settings(pool_settings)
+    CORS(app)
+    api.init_app(app)
+    app.before_request(start_timer)
+    app.after_request(log_request)
+    return app
+
+
+app = create_app()
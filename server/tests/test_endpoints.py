@@ -4,29 +4,88 @@ from http.client import (
     NOT_ACCEPTABLE,
     NOT_FOUND,
     OK,
+    PARTIAL_CONTENT,
+    REQUEST_ENTITY_TOO_LARGE,
+    REQUESTED_RANGE_NOT_SATISFIABLE,
     SERVICE_UNAVAILABLE,
 )
 
 from unittest.mock import patch
 
+import os
+import subprocess
+import sys
+
 import pytest, json
 
 from data.people import NAME, AFFILIATION, EMAIL, ROLES
 
-import server.endpoints as ep
-
-TEST_CLIENT = ep.app.test_client()
-
+import data.db_connect as dbc
+import data.logs as logs
 import data.text as txt
 import data.roles as rls
 from data.text import *
 import data.manuscript as ms
+import server.endpoints as ep
+
+TEST_CLIENT = ep.app.test_client()
 
 TEST_EMAIL = "testEmail@gmail.com"
 TEST_TITLE = "Test Manuscript Title"
 TEST_PAGE_NUMBER = "TestPageNumber"
 
 
+# imported only when needed
+LAZY_MODULES = ['numpy', 'pymongo', 'sqlite3', 'data.analytics']
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+
+def imported_modules(module: str) -> set:
+    """
+    The modules importing module pulls in, from a fresh interpreter.
+    The import must not connect to the DB.
+    """
+    ret = subprocess.run(
+        [sys.executable, '-c',
+         f'import sys, {module}; import data.db_connect as dbc; '
+         'assert dbc.backend is None, "connected on import"; '
+         'print("\\n".join(sys.modules))'],
+        cwd=REPO_DIR, capture_output=True, text=True, check=True)
+    return set(ret.stdout.splitlines())
+
+
+def test_import_stays_light():
+    assert not set(LAZY_MODULES) & imported_modules('server.endpoints')
+
+
+def test_create_app():
+    app = ep.create_app({'TESTING': True})
+    assert app.config['TESTING']
+    resp = app.test_client().get(ep.HELLO_EP)
+    assert resp.status_code == OK
+
+
+@patch('data.db_connect.set_pool_settings', autospec=True)
+def test_create_app_pool_settings(mock_set):
+    ep.create_app({'DB_MAX_POOL_SIZE': 20})
+    mock_set.assert_called_once_with({dbc.MAX_POOL_SIZE: 20})
+
+
+def test_request_log(capsys):
+    app = ep.create_app({'LOG_LEVEL': 'DEBUG', 'LOG_FORMAT': 'JSON'})
+    try:
+        app.test_client().get(ep.HELLO_EP)
+        entries = [json.loads(line)
+                   for line in capsys.readouterr().err.splitlines()]
+        entry = [entry for entry in entries
+                 if entry.get('path') == ep.HELLO_EP][0]
+        assert entry['status'] == OK
+        assert entry['ms'] >= 0
+    finally:
+        logs.setup()
+
+
 def test_hello():
     resp = TEST_CLIENT.get(ep.HELLO_EP)
     resp_json = resp.get_json()
@@ -43,8 +102,18 @@ def test_title():
     assert len(resp_json[ep.TITLE_RESP]) > 0
 
 
-@patch('data.people.read', autospec=True,
-        return_value={'id': {NAME: 'Joe Schmoe'}})
+def test_request_identity_map():
+    assert ep.request_identity_map() is None
+    with ep.app.test_request_context():
+        id_map = ep.request_identity_map()
+        assert id_map == {}
+        assert ep.request_identity_map() is id_map
+    with ep.app.test_request_context():
+        assert ep.request_identity_map() is not id_map
+
+
+@patch('data.people.read_iter', autospec=True,
+        return_value=[{EMAIL: TEST_EMAIL, NAME: 'Joe Schmoe'}])
 def test_read_people(mock_read):
     resp = TEST_CLIENT.get(ep.PEOPLE_EP)
     assert resp.status_code == OK
@@ -56,6 +125,31 @@ def test_read_people(mock_read):
         assert NAME in person
 
 
+@patch('data.people.read_iter', autospec=True, return_value=[])
+def test_read_people_paged(mock_read):
+    resp = TEST_CLIENT.get(f'{ep.PEOPLE_EP}?limit=5&after={TEST_EMAIL}')
+    assert resp.status_code == OK
+    assert resp.get_json() == {}
+    mock_read.assert_called_once_with(limit=5, skip=0, after=TEST_EMAIL,
+                                      fields=None)
+
+
+@patch('data.people.read_iter', autospec=True, return_value=[])
+def test_read_people_fields(mock_read):
+    resp = TEST_CLIENT.get(f'{ep.PEOPLE_EP}?fields={NAME}, {AFFILIATION}')
+    assert resp.status_code == OK
+    mock_read.assert_called_once_with(limit=0, skip=0, after=None,
+                                      fields=[NAME, AFFILIATION])
+
+
+@patch('data.people.read_iter', autospec=True, return_value=[])
+def test_read_people_bad_limit(mock_read):
+    resp = TEST_CLIENT.get(f'{ep.PEOPLE_EP}?limit=lots')
+    assert resp.status_code == BAD_REQUEST
+    resp = TEST_CLIENT.get(f'{ep.PEOPLE_EP}?skip=-1')
+    assert resp.status_code == BAD_REQUEST
+
+
 @patch('data.people.read_one', autospec=True,
        return_value={NAME: 'Joe Schmoe'})
 def test_read_one_person(mock_read):
@@ -201,8 +295,9 @@ def test_delete_role_failed(mock_delete_role):
     assert resp.status_code == NOT_ACCEPTABLE
 
 
-@patch('data.text.read', autospec=True,
-       return_value={'page_number': {TITLE: 'Test Title', TEXT: 'Test Text'}})
+@patch('data.text.read_iter', autospec=True,
+       return_value=[{PAGE_NUMBER: TEST_PAGE_NUMBER,
+                      TITLE: 'Test Title', TEXT: 'Test Text'}])
 def test_read_text(mock_read):
     resp = TEST_CLIENT.get(ep.TEXT_EP)
     assert resp.status_code == OK
@@ -317,8 +412,8 @@ MANUSCRIPT_DATA = {
 }
 
 
-@patch('data.manuscript.read', autospec=True,
-       return_value={'title': {ms.TITLE: 'Test Title'}})
+@patch('data.manuscript.read_iter', autospec=True,
+       return_value=[{ms.TITLE: 'Test Title'}])
 def test_read_manuscripts(mock_read):
     resp = TEST_CLIENT.get(ep.MANUSCRIPT_EP)
     assert resp.status_code == OK
@@ -330,6 +425,15 @@ def test_read_manuscripts(mock_read):
         assert ms.TITLE in manu
 
 
+@patch('data.manuscript.read_iter', autospec=True, return_value=[])
+def test_read_manuscripts_fields(mock_read):
+    resp = TEST_CLIENT.get(f'{ep.MANUSCRIPT_EP}?fields=title,state,author')
+    assert resp.status_code == OK
+    mock_read.assert_called_once_with(
+        limit=0, skip=0, after=None,
+        fields=[ms.TITLE, ms.STATE, ms.AUTHOR])
+
+
 @patch('data.manuscript.read_one', autospec=True,
        return_value={ms.TITLE: 'Test Title'})
 def test_read_one_manuscript(mock_read):
@@ -404,3 +508,377 @@ def test_update_manuscript_failed(mock_update):
         content_type='application/json'
     )
     assert resp.status_code == NOT_ACCEPTABLE
+
+
+ACTION_DATA = {
+    ms.TITLE: TEST_TITLE,
+    ms.ACTION: ms.ASSIGN_REF,
+    ms.REFEREE: TEST_EMAIL,
+}
+
+
+@patch('data.manuscript.apply_action', autospec=True,
+       return_value={ms.TITLE: TEST_TITLE, ms.STATE: ms.IN_REF_REV})
+def test_receive_action(mock_apply):
+    resp = TEST_CLIENT.put(
+        f'{ep.MANUSCRIPT_EP}/receive_action',
+        data=json.dumps(ACTION_DATA),
+        content_type='application/json'
+    )
+    assert resp.status_code == OK
+    resp_json = resp.get_json()
+    assert resp_json[ep.RETURN][ms.STATE] == ms.IN_REF_REV
+    mock_apply.assert_called_once_with(TEST_TITLE, ms.ASSIGN_REF,
+                                       actor=None, ref=TEST_EMAIL)
+
+
+@patch('data.manuscript.apply_action', autospec=True,
+       side_effect=ValueError("Mocked Exception"))
+def test_receive_action_failed(mock_apply):
+    resp = TEST_CLIENT.put(
+        f'{ep.MANUSCRIPT_EP}/receive_action',
+        data=json.dumps(ACTION_DATA),
+        content_type='application/json'
+    )
+    assert resp.status_code == NOT_ACCEPTABLE
+
+
+BULK_ACTION_DATA = {ms.ACTIONS: [ACTION_DATA]}
+
+
+@patch('data.manuscript.apply_actions', autospec=True,
+       return_value=[{ms.TITLE: TEST_TITLE, ms.ACTION: ms.ASSIGN_REF,
+                      ms.OK: True, ms.STATE: ms.IN_REF_REV}])
+def test_bulk_action(mock_apply):
+    resp = TEST_CLIENT.put(
+        f'{ep.MANUSCRIPT_EP}/bulk_action',
+        data=json.dumps(BULK_ACTION_DATA),
+        content_type='application/json'
+    )
+    assert resp.status_code == OK
+    resp_json = resp.get_json()
+    assert resp_json[ep.RETURN][0][ms.OK]
+    mock_apply.assert_called_once_with([ACTION_DATA])
+
+
+def test_bulk_action_not_a_list():
+    resp = TEST_CLIENT.put(
+        f'{ep.MANUSCRIPT_EP}/bulk_action',
+        data=json.dumps({ms.ACTIONS: ACTION_DATA}),
+        content_type='application/json'
+    )
+    assert resp.status_code == NOT_ACCEPTABLE
+
+
+QUEUE_AFTER = [1700000000.0, TEST_TITLE]
+
+
+@patch('data.manuscript.read_queue', autospec=True,
+       return_value=([{ms.TITLE: TEST_TITLE}], QUEUE_AFTER))
+def test_manuscript_queue(mock_queue):
+    resp = TEST_CLIENT.get(f'{ep.MANUSCRIPT_EP}/queue?'
+                           f'{ms.EDITOR_EMAIL}={TEST_EMAIL}&'
+                           f'{ms.STATE}={ms.SUBMITTED}')
+    assert resp.status_code == OK
+    resp_json = resp.get_json()
+    assert resp_json[ep.MANUSCRIPTS_RESP] == [{ms.TITLE: TEST_TITLE}]
+    assert ep.decode_cursor(resp_json[ep.AFTER]) == QUEUE_AFTER
+    resp = TEST_CLIENT.get(f'{ep.MANUSCRIPT_EP}/queue?'
+                           f'{ms.EDITOR_EMAIL}={TEST_EMAIL}&'
+                           f'{ms.STATE}={ms.SUBMITTED}&'
+                           f'{ep.AFTER}={resp_json[ep.AFTER]}')
+    assert resp.status_code == OK
+    mock_queue.assert_called_with(TEST_EMAIL, ms.SUBMITTED,
+                                  after=QUEUE_AFTER)
+
+
+def test_manuscript_queue_missing_args():
+    resp = TEST_CLIENT.get(f'{ep.MANUSCRIPT_EP}/queue?'
+                           f'{ms.EDITOR_EMAIL}={TEST_EMAIL}')
+    assert resp.status_code == BAD_REQUEST
+
+
+def test_manuscript_queue_bad_cursor():
+    resp = TEST_CLIENT.get(f'{ep.MANUSCRIPT_EP}/queue?'
+                           f'{ms.EDITOR_EMAIL}={TEST_EMAIL}&'
+                           f'{ms.STATE}={ms.SUBMITTED}&{ep.AFTER}=junk!')
+    assert resp.status_code == BAD_REQUEST
+
+
+def test_manuscript_queue_object_cursor():
+    cursor = ep.encode_cursor([{'$gt': ''}, TEST_TITLE])
+    resp = TEST_CLIENT.get(f'{ep.MANUSCRIPT_EP}/queue?'
+                           f'{ms.EDITOR_EMAIL}={TEST_EMAIL}&'
+                           f'{ms.STATE}={ms.SUBMITTED}&{ep.AFTER}={cursor}')
+    assert resp.status_code == BAD_REQUEST
+
+
+def test_manuscript_queue_short_cursor():
+    resp = TEST_CLIENT.get(f'{ep.MANUSCRIPT_EP}/queue?'
+                           f'{ms.EDITOR_EMAIL}={TEST_EMAIL}&'
+                           f'{ms.STATE}={ms.SUBMITTED}&'
+                           f'{ep.AFTER}={ep.encode_cursor([])}')
+    assert resp.status_code == BAD_REQUEST
+
+
+def test_manuscripts_by_referee_short_cursor():
+    resp = TEST_CLIENT.get(f'{ep.MANUSCRIPT_EP}/by_referee/{TEST_EMAIL}'
+                           f'?{ep.AFTER}={ep.encode_cursor([])}')
+    assert resp.status_code == BAD_REQUEST
+
+
+@patch('data.manuscript.read_queue', autospec=True,
+       side_effect=ValueError('Bad state'))
+def test_manuscript_queue_bad_state(mock_queue):
+    resp = TEST_CLIENT.get(f'{ep.MANUSCRIPT_EP}/queue?'
+                           f'{ms.EDITOR_EMAIL}={TEST_EMAIL}&'
+                           f'{ms.STATE}=bad')
+    assert resp.status_code == BAD_REQUEST
+
+
+@patch('data.manuscript.read_by_referee', autospec=True,
+       return_value=([{ms.TITLE: TEST_TITLE}], None))
+def test_manuscripts_by_referee(mock_read):
+    resp = TEST_CLIENT.get(f'{ep.MANUSCRIPT_EP}/by_referee/{TEST_EMAIL}'
+                           f'?{ep.FIELDS}={ms.STATE}')
+    assert resp.status_code == OK
+    resp_json = resp.get_json()
+    assert resp_json[ep.MANUSCRIPTS_RESP] == [{ms.TITLE: TEST_TITLE}]
+    assert resp_json[ep.AFTER] is None
+    mock_read.assert_called_once_with(TEST_EMAIL, after=None,
+                                      fields=[ms.STATE])
+
+
+@patch('data.manuscript.search', autospec=True,
+       return_value=[{ms.TITLE: TEST_TITLE, 'score': 1.5,
+                      'snippet': 'Test Text'}])
+def test_manuscript_search(mock_search):
+    resp = TEST_CLIENT.get(f'{ep.MANUSCRIPT_EP}/search?{ep.QUERY}=test'
+                           f'&{ep.LIMIT}=5')
+    assert resp.status_code == OK
+    resp_json = resp.get_json()
+    assert resp_json[ep.MANUSCRIPTS_RESP][0][ms.TITLE] == TEST_TITLE
+    mock_search.assert_called_once_with('test', limit=5)
+
+
+@patch('data.manuscript.search', autospec=True,
+       side_effect=ValueError('Nothing to search for'))
+def test_manuscript_search_bad_query(mock_search):
+    resp = TEST_CLIENT.get(f'{ep.MANUSCRIPT_EP}/search?{ep.QUERY}=')
+    assert resp.status_code == BAD_REQUEST
+
+
+@patch('data.manuscript.suggest_authors', autospec=True,
+       return_value=[{EMAIL: TEST_EMAIL, NAME: 'Test', 'score': 0.5}])
+@patch('data.people.suggest', autospec=True,
+       return_value=[{EMAIL: TEST_EMAIL, NAME: 'Test', AFFILIATION: 'NYU',
+                      'score': 1.0}])
+def test_people_suggest(mock_suggest, mock_authors):
+    resp = TEST_CLIENT.get(f'{ep.PEOPLE_EP}/suggest?{ep.QUERY}=tes')
+    assert resp.status_code == OK
+    suggestions = resp.get_json()[ep.SUGGESTIONS_RESP]
+    assert len(suggestions) == 1
+    assert suggestions[0][AFFILIATION] == 'NYU'
+
+
+@patch('data.people.suggest', autospec=True,
+       side_effect=ValueError('Type at least 2 characters'))
+def test_people_suggest_too_short(mock_suggest):
+    resp = TEST_CLIENT.get(f'{ep.PEOPLE_EP}/suggest?{ep.QUERY}=t')
+    assert resp.status_code == BAD_REQUEST
+
+
+TEST_BODY = b'0123456789' * 10
+
+
+def open_test_body(title, rev_hash=None):
+    return len(TEST_BODY), lambda start, stop: iter([TEST_BODY[start:stop]])
+
+
+@patch('data.manuscript.open_text', autospec=True,
+       side_effect=open_test_body)
+def test_manuscript_text(mock_open):
+    resp = TEST_CLIENT.get(f'{ep.MANUSCRIPT_EP}/{TEST_TITLE}/text')
+    assert resp.status_code == OK
+    assert resp.data == TEST_BODY
+    assert resp.headers['Accept-Ranges'] == 'bytes'
+
+
+@patch('data.manuscript.open_text', autospec=True,
+       side_effect=open_test_body)
+def test_manuscript_text_range(mock_open):
+    resp = TEST_CLIENT.get(f'{ep.MANUSCRIPT_EP}/{TEST_TITLE}/text',
+                           headers={'Range': 'bytes=10-19'})
+    assert resp.status_code == PARTIAL_CONTENT
+    assert resp.data == TEST_BODY[10:20]
+    assert resp.headers['Content-Range'] == f'bytes 10-19/{len(TEST_BODY)}'
+
+
+@patch('data.manuscript.open_text', autospec=True,
+       side_effect=open_test_body)
+def test_manuscript_text_bad_range(mock_open):
+    resp = TEST_CLIENT.get(f'{ep.MANUSCRIPT_EP}/{TEST_TITLE}/text',
+                           headers={'Range': 'bytes=500-600'})
+    assert resp.status_code == REQUESTED_RANGE_NOT_SATISFIABLE
+
+
+@patch('data.manuscript.open_text', autospec=True, return_value=None)
+def test_manuscript_text_not_there(mock_open):
+    resp = TEST_CLIENT.get(f'{ep.MANUSCRIPT_EP}/{TEST_TITLE}/text')
+    assert resp.status_code == NOT_FOUND
+
+
+@patch('data.manuscript.upload_text', autospec=True,
+       return_value=len(TEST_BODY))
+def test_manuscript_text_upload(mock_upload):
+    resp = TEST_CLIENT.put(f'{ep.MANUSCRIPT_EP}/{TEST_TITLE}/text',
+                           data=TEST_BODY, content_type='text/plain')
+    assert resp.status_code == OK
+    assert resp.get_json()[ep.RETURN] == len(TEST_BODY)
+    title, stream = mock_upload.call_args.args
+    assert title == TEST_TITLE
+
+
+@patch('data.manuscript.upload_text', autospec=True,
+       side_effect=ValueError('No such manuscript'))
+def test_manuscript_text_upload_fails(mock_upload):
+    resp = TEST_CLIENT.put(f'{ep.MANUSCRIPT_EP}/{TEST_TITLE}/text',
+                           data=TEST_BODY, content_type='text/plain')
+    assert resp.status_code == NOT_ACCEPTABLE
+
+
+@patch('data.manuscript.upload_text', autospec=True,
+       side_effect=OSError('connection reset'))
+def test_manuscript_text_upload_cut_short(mock_upload):
+    resp = TEST_CLIENT.put(f'{ep.MANUSCRIPT_EP}/{TEST_TITLE}/text',
+                           data=TEST_BODY, content_type='text/plain')
+    assert resp.status_code == BAD_REQUEST
+
+
+def test_manuscript_text_upload_too_big():
+    with patch.object(ms, 'MAX_TEXT_SIZE', 10):
+        resp = TEST_CLIENT.put(f'{ep.MANUSCRIPT_EP}/{TEST_TITLE}/text',
+                               data=TEST_BODY, content_type='text/plain')
+    assert resp.status_code == REQUEST_ENTITY_TOO_LARGE
+
+
+TEST_HASH = 'abc123'
+
+
+@patch('data.manuscript.read_revisions', autospec=True,
+       return_value=[{ms.HASH: TEST_HASH, ms.LENGTH: 9,
+                      ms.CREATED_AT: 0}])
+def test_manuscript_revisions(mock_read):
+    resp = TEST_CLIENT.get(f'{ep.MANUSCRIPT_EP}/{TEST_TITLE}/revisions')
+    assert resp.status_code == OK
+    assert resp.get_json()[ms.REVISIONS][0][ms.HASH] == TEST_HASH
+
+
+@patch('data.manuscript.read_revisions', autospec=True, return_value=None)
+def test_manuscript_revisions_not_there(mock_read):
+    resp = TEST_CLIENT.get(f'{ep.MANUSCRIPT_EP}/{TEST_TITLE}/revisions')
+    assert resp.status_code == NOT_FOUND
+
+
+@patch('data.manuscript.read_revision', autospec=True,
+       return_value={ms.HASH: TEST_HASH, ms.ABSTRACT: 'Abstract',
+                     ms.TEXT: 'Text'})
+def test_manuscript_revision(mock_read):
+    resp = TEST_CLIENT.get(f'{ep.MANUSCRIPT_EP}/{TEST_TITLE}/revisions/'
+                           f'{TEST_HASH}')
+    assert resp.status_code == OK
+    assert resp.get_json()[ms.TEXT] == 'Text'
+
+
+@patch('data.manuscript.read_revision', autospec=True, return_value=None)
+def test_manuscript_revision_not_there(mock_read):
+    resp = TEST_CLIENT.get(f'{ep.MANUSCRIPT_EP}/{TEST_TITLE}/revisions/'
+                           f'{TEST_HASH}')
+    assert resp.status_code == NOT_FOUND
+
+
+@patch('data.manuscript.open_text', autospec=True,
+       side_effect=open_test_body)
+def test_manuscript_text_revision(mock_open):
+    resp = TEST_CLIENT.get(f'{ep.MANUSCRIPT_EP}/{TEST_TITLE}/text'
+                           f'?{ep.REVISION}={TEST_HASH}')
+    assert resp.status_code == OK
+    mock_open.assert_called_once_with(TEST_TITLE, TEST_HASH)
+
+
+@patch('data.text.read_versions', autospec=True,
+       return_value=[{txt.VERSION: 1, txt.TITLE: TEST_TITLE,
+                      txt.CREATED_AT: 0}])
+def test_text_versions(mock_read):
+    resp = TEST_CLIENT.get(f'{ep.TEXT_EP}/{TEST_PAGE_NUMBER}/versions')
+    assert resp.status_code == OK
+    assert resp.get_json()[ep.VERSIONS_RESP][0][txt.VERSION] == 1
+
+
+@patch('data.text.read_versions', autospec=True, return_value=None)
+def test_text_versions_not_there(mock_read):
+    resp = TEST_CLIENT.get(f'{ep.TEXT_EP}/{TEST_PAGE_NUMBER}/versions')
+    assert resp.status_code == NOT_FOUND
+
+
+@patch('data.text.read_version', autospec=True,
+       return_value={txt.PAGE_NUMBER: TEST_PAGE_NUMBER, txt.VERSION: 2,
+                     txt.TITLE: TEST_TITLE, txt.TEXT: 'Old text'})
+def test_text_version(mock_read):
+    resp = TEST_CLIENT.get(f'{ep.TEXT_EP}/{TEST_PAGE_NUMBER}/versions/2')
+    assert resp.status_code == OK
+    assert resp.get_json()[txt.TEXT] == 'Old text'
+    mock_read.assert_called_once_with(TEST_PAGE_NUMBER, 2)
+
+
+@patch('data.text.read_version', autospec=True, return_value=None)
+def test_text_version_not_there(mock_read):
+    resp = TEST_CLIENT.get(f'{ep.TEXT_EP}/{TEST_PAGE_NUMBER}/versions/9')
+    assert resp.status_code == NOT_FOUND
+
+
+TEST_EVENT = {ms.TITLE: TEST_TITLE, ms.EVENT_TIME: 1.0, ms.EVENT_ID: 'a',
+              ms.STATE: ms.SUBMITTED, ms.ACTION: None, ms.ACTOR: TEST_EMAIL}
+
+
+@patch('data.manuscript.read_history', autospec=True,
+       return_value=([TEST_EVENT], [1.0, 'a']))
+def test_manuscript_history(mock_read):
+    resp = TEST_CLIENT.get(f'{ep.MANUSCRIPT_EP}/{TEST_TITLE}/history')
+    assert resp.status_code == OK
+    resp_json = resp.get_json()
+    assert resp_json[ep.EVENTS_RESP] == [TEST_EVENT]
+    assert ep.decode_cursor(resp_json[ep.AFTER]) == [1.0, 'a']
+
+
+@patch('data.manuscript.read_history', autospec=True,
+       return_value=([TEST_EVENT], None))
+def test_manuscript_history_after(mock_read):
+    cursor = ep.encode_cursor([1.0, 'a'])
+    resp = TEST_CLIENT.get(f'{ep.MANUSCRIPT_EP}/{TEST_TITLE}/history'
+                           f'?{ep.AFTER}={cursor}')
+    assert resp.status_code == OK
+    assert resp.get_json()[ep.AFTER] is None
+    mock_read.assert_called_once_with(TEST_TITLE, after=[1.0, 'a'])
+
+
+@patch('data.manuscript.read_history', autospec=True,
+       side_effect=ValueError('Bad after'))
+def test_manuscript_history_bad_cursor(mock_read):
+    resp = TEST_CLIENT.get(f'{ep.MANUSCRIPT_EP}/{TEST_TITLE}/history'
+                           f'?{ep.AFTER}={ep.encode_cursor([1.0])}')
+    assert resp.status_code == BAD_REQUEST
+
+
+@patch('data.manuscript.read_history', autospec=True, return_value=None)
+def test_manuscript_history_not_there(mock_read):
+    resp = TEST_CLIENT.get(f'{ep.MANUSCRIPT_EP}/{TEST_TITLE}/history')
+    assert resp.status_code == NOT_FOUND
+
+
+@patch('data.analytics.get_stats', autospec=True,
+       return_value={'funnel': {ms.SUBMITTED: 2, ms.PUBLISHED: 1}})
+def test_manuscript_stats(mock_stats):
+    resp = TEST_CLIENT.get(f'{ep.MANUSCRIPT_EP}/stats')
+    assert resp.status_code == OK
+    assert resp.get_json()['funnel'][ms.SUBMITTED] == 2